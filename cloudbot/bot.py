@@ -7,7 +7,6 @@ import re
 import time
 import warnings
 from concurrent.futures.thread import ThreadPoolExecutor
-from functools import partial
 from pathlib import Path
 from typing import Any
 
@@ -19,10 +18,24 @@ from watchdog.observers import Observer
 
 from cloudbot.client import Client
 from cloudbot.config import Config
-from cloudbot.event import CommandEvent, Event, EventType, RegexEvent
+from cloudbot.dispatch import build_cmd_regex
+from cloudbot.event import (
+    CommandEventView,
+    Event,
+    EventType,
+    EventView,
+    RegexEventView,
+)
 from cloudbot.hook import Action
+from cloudbot.loop_watchdog import (
+    DEFAULT_INTERVAL,
+    DEFAULT_REPORT_INTERVAL,
+    DEFAULT_THRESHOLD,
+    LoopWatchdog,
+)
 from cloudbot.plugin import PluginManager
 from cloudbot.reloader import ConfigReloader, PluginReloader
+from cloudbot.scheduler import Scheduler
 from cloudbot.util import CLIENT_ATTR, database, formatting
 from cloudbot.util.mapping import KeyFoldDict
 
@@ -65,30 +78,8 @@ def clean_name(n):
 def get_cmd_regex(event):
     conn = event.conn
     is_pm = event.chan.lower() == event.nick.lower()
-    command_prefix = re.escape(conn.config.get("command_prefix", "."))
-    conn_nick = re.escape(event.conn.nick)
-    cmd_re = re.compile(
-        r"""
-        ^
-        # Prefix or nick
-        (?:
-            (?P<prefix>["""
-        + command_prefix
-        + r"""])"""
-        + ("?" if is_pm else "")
-        + r"""
-            |
-            """
-        + conn_nick
-        + r"""[,;:]+\s+
-        )
-        (?P<command>\w+)  # Command
-        (?:$|\s+)
-        (?P<text>.*)     # Text
-        """,
-        re.IGNORECASE | re.VERBOSE,
-    )
-    return cmd_re
+    command_prefix = conn.config.get("command_prefix", ".")
+    return build_cmd_regex(command_prefix, conn.nick, is_pm=is_pm)
 
 
 class CloudBot(AbstractBot):
@@ -124,6 +115,9 @@ class CloudBot(AbstractBot):
         # for plugins to abuse
         self.memory: dict[str, Any] = collections.defaultdict()
 
+        # runs work which is due at a specific time
+        self.scheduler = Scheduler(self.loop)
+
         # declare and create data folder
         self.data_path = self.base_dir / "data"
 
@@ -163,6 +157,10 @@ class CloudBot(AbstractBot):
         db_path = self.config.get("database", "sqlite:///cloudbot.db")
         self.db_engine = create_engine(db_path)
         database.configure(self.db_engine)
+        # worker threads for database work done by coroutine hooks
+        self.db_executor_pool = database.DatabaseExecutorPool(
+            self.config.get("db_thread_count", 4)
+        )
 
         logger.debug("Database system initialised.")
 
@@ -184,6 +182,17 @@ class CloudBot(AbstractBot):
 
         self.plugin_manager = PluginManager(self)
 
+        watchdog_conf = self.config.get("loop_watchdog", {})
+        self.loop_watchdog_enabled = watchdog_conf.get("enabled", False)
+        self.loop_watchdog = LoopWatchdog(
+            self,
+            interval=watchdog_conf.get("interval", DEFAULT_INTERVAL),
+            threshold=watchdog_conf.get("threshold", DEFAULT_THRESHOLD),
+            report_interval=watchdog_conf.get(
+                "report_interval", DEFAULT_REPORT_INTERVAL
+            ),
+        )
+
     @property
     def data_dir(self) -> str:
         warnings.warn(
@@ -206,6 +215,7 @@ class CloudBot(AbstractBot):
         logger.debug("Waiting for plugin unload")
         await self.plugin_manager.unload_all()
         logger.debug("Unload complete")
+        self.db_executor_pool.shutdown()
         return restart
 
     def get_client(self, name: str) -> type[Client]:
@@ -246,6 +256,12 @@ class CloudBot(AbstractBot):
 
         self.observer.stop()
 
+        logger.debug("Stopping loop watchdog.")
+        self.loop_watchdog.stop()
+
+        logger.debug("Cancelling scheduled jobs.")
+        self.scheduler.close()
+
         logger.debug("Stopping connect loops and shutting down clients")
         for connection in self.connections.values():
             connection.active = False
@@ -303,6 +319,9 @@ class CloudBot(AbstractBot):
 
         self.observer.start()
 
+        if self.loop_watchdog_enabled:
+            self.loop_watchdog.start()
+
         for conn in self.connections.values():
             if conn.config.get("enabled", True):
                 conn.active = True
@@ -337,6 +356,9 @@ class CloudBot(AbstractBot):
                 self.register_client(_type, obj)
 
     async def process(self, event):
+        # Use the same hooks for the whole event, even if plugins are
+        # reloaded while it is processed
+        registry = self.plugin_manager.registry
         run_before_tasks = []
         tasks = []
         halted = False
@@ -365,31 +387,27 @@ class CloudBot(AbstractBot):
             return True
 
         # Raw IRC hook
-        for raw_hook in self.plugin_manager.catch_all_triggers:
+        for raw_hook in registry.catch_all_triggers:
             # run catch-all coroutine hooks before all others - TODO: Make this a plugin argument
             run_before = not raw_hook.threaded
             if not add_hook(
                 raw_hook,
-                Event(hook=raw_hook, base_event=event),
+                EventView(raw_hook, event),
                 _run_before=run_before,
             ):
                 # The hook has an action of Action.HALT* so stop adding new tasks
                 break
 
-        if event.irc_command in self.plugin_manager.raw_triggers:
-            for raw_hook in self.plugin_manager.raw_triggers[event.irc_command]:
-                if not add_hook(
-                    raw_hook, Event(hook=raw_hook, base_event=event)
-                ):
+        if event.irc_command in registry.raw_triggers:
+            for raw_hook in registry.raw_triggers[event.irc_command]:
+                if not add_hook(raw_hook, EventView(raw_hook, event)):
                     # The hook has an action of Action.HALT* so stop adding new tasks
                     break
 
         # Event hooks
-        if event.type in self.plugin_manager.event_type_hooks:
-            for event_hook in self.plugin_manager.event_type_hooks[event.type]:
-                if not add_hook(
-                    event_hook, Event(hook=event_hook, base_event=event)
-                ):
+        if event.type in registry.event_type_hooks:
+            for event_hook in registry.event_type_hooks[event.type]:
+                if not add_hook(event_hook, EventView(event_hook, event)):
                     # The hook has an action of Action.HALT* so stop adding new tasks
                     break
 
@@ -397,66 +415,46 @@ class CloudBot(AbstractBot):
 
         if event.type is EventType.message:
             # Commands
-            cmd_match = get_cmd_regex(event).match(event.content)
+            dispatcher = self.plugin_manager.get_command_dispatcher(
+                event.conn, registry
+            )
+            is_pm = event.chan.lower() == event.nick.lower()
+            cmd_match = dispatcher.match(event.content, is_pm=is_pm)
 
             if cmd_match:
-                command_prefix = event.conn.config.get("command_prefix", ".")
-                prefix = cmd_match.group("prefix") or command_prefix[0]
+                prefix = (
+                    cmd_match.group("prefix") or dispatcher.command_prefix[0]
+                )
                 command = cmd_match.group("command").lower()
                 text = cmd_match.group("text").strip()
-                cmd_event = partial(
-                    CommandEvent,
-                    text=text,
-                    triggered_command=command,
-                    base_event=event,
-                    cmd_prefix=prefix,
-                )
-                if command in self.plugin_manager.commands:
-                    command_hook = self.plugin_manager.commands[command]
-                    command_event = cmd_event(hook=command_hook)
+                command_hook, potential_matches = dispatcher.lookup(command)
+                if command_hook is not None:
+                    command_event = CommandEventView(
+                        command_hook,
+                        event,
+                        text=text,
+                        triggered_command=command,
+                        cmd_prefix=prefix,
+                    )
                     add_hook(command_hook, command_event)
                     matched_command = True
-                else:
-                    potential_matches = []
-                    for (
-                        potential_match,
-                        plugin,
-                    ) in self.plugin_manager.commands.items():
-                        if potential_match.startswith(command):
-                            potential_matches.append((potential_match, plugin))
-
-                    if potential_matches:
-                        matched_command = True
-                        if len(potential_matches) == 1:
-                            command_hook = potential_matches[0][1]
-                            command_event = cmd_event(hook=command_hook)
-                            add_hook(command_hook, command_event)
-                        else:
-                            commands = sorted(
-                                command for command, plugin in potential_matches
-                            )
-                            txt_list = formatting.get_text_list(commands)
-                            event.notice(f"Possible matches: {txt_list}")
+                elif potential_matches:
+                    matched_command = True
+                    txt_list = formatting.get_text_list(potential_matches)
+                    event.notice(f"Possible matches: {txt_list}")
 
         if event.type in (EventType.message, EventType.action):
             # Regex hooks
-            regex_matched = False
-            for regex, regex_hook in self.plugin_manager.regex_hooks:
-                if not regex_hook.run_on_cmd and matched_command:
-                    continue
-
-                if regex_hook.only_no_match and regex_matched:
-                    continue
-
-                regex_match = regex.search(event.content)
-                if regex_match:
-                    regex_matched = True
-                    regex_event = RegexEvent(
-                        hook=regex_hook, match=regex_match, base_event=event
-                    )
-                    if not add_hook(regex_hook, regex_event):
-                        # The hook has an action of Action.HALT* so stop adding new tasks
-                        break
+            regex_matches = registry.regex_dispatcher.search(
+                event.content, matched_command=matched_command
+            )
+            for regex_hook, regex_match in regex_matches:
+                regex_event = RegexEventView(
+                    regex_hook, event, match=regex_match
+                )
+                if not add_hook(regex_hook, regex_event):
+                    # The hook has an action of Action.HALT* so stop adding new tasks
+                    break
 
         # Run the tasks
         await asyncio.gather(*run_before_tasks)
@@ -1,5 +1,6 @@
 import asyncio
 import collections
+import enum
 import logging
 import random
 from typing import Any
@@ -29,6 +30,123 @@ class ClientConnectError(Exception):
         self.server = server
 
 
+class EventPriority(enum.IntEnum):
+    """Priority classes for incoming events, lower values are handled first"""
+
+    # Server state: PINGs, numerics, joins, parts, mode changes, etc
+    STATE = 0
+    COMMAND = 1
+    OTHER = 2
+
+
+class EventQueue:
+    """
+    A bounded queue of incoming events for a single connection.
+
+    Events are handled by at most `workers` concurrent calls to `bot.process`,
+    in priority order. Workers are started as events arrive and exit once the
+    queue is empty.
+
+    When the queue is full, a new event replaces the newest queued event of a
+    lower priority, or is dropped if there is none. STATE events are never
+    dropped, as losing them would leave the channel state out of sync.
+    """
+
+    def __init__(self, conn, *, max_size=1000, workers=32):
+        self.conn = conn
+        self.max_size = max_size
+        self.workers = workers
+
+        self._queues: tuple[collections.deque, ...] = tuple(
+            collections.deque() for _ in EventPriority
+        )
+        self._tasks: set[asyncio.Task] = set()
+
+        self.processed = 0
+        self.max_depth = 0
+        self.dropped = {priority: 0 for priority in EventPriority}
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(map(len, self._queues))
+
+    @property
+    def active_workers(self) -> int:
+        return len(self._tasks)
+
+    def put(self, event, priority=EventPriority.OTHER) -> bool:
+        """Queue an event for processing
+
+        :return: False if the event was dropped, True otherwise
+        """
+        if self.queue_depth >= self.max_size and not self._shed(priority):
+            self.dropped[priority] += 1
+            return False
+
+        self._queues[priority].append(event)
+        self.max_depth = max(self.max_depth, self.queue_depth)
+
+        if len(self._tasks) < self.workers:
+            task = asyncio.ensure_future(self._worker(), loop=self.conn.loop)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return True
+
+    def _shed(self, priority) -> bool:
+        """Make room for an event of `priority` by dropping a queued event"""
+        for lower in reversed(EventPriority):
+            if lower <= priority:
+                break
+
+            queue = self._queues[lower]
+            if queue:
+                queue.pop()
+                self.dropped[lower] += 1
+                return True
+
+        # State events are always queued, even over the limit
+        return priority is EventPriority.STATE
+
+    def _next_event(self):
+        for queue in self._queues:
+            if queue:
+                return queue.popleft()
+
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            event = self._next_event()
+            if event is None:
+                return
+
+            try:
+                await self.conn.bot.process(event)
+            except Exception:
+                logger.exception(
+                    "[%s] Error occurred while processing event", self.conn.name
+                )
+
+            self.processed += 1
+
+    def clear(self) -> None:
+        for queue in self._queues:
+            queue.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_depth": self.max_depth,
+            "active_workers": self.active_workers,
+            "processed": self.processed,
+            "dropped": {
+                priority.name.lower(): count
+                for priority, count in self.dropped.items()
+            },
+        }
+
+
 class Client:
     """
     A Client representing each connection the bot makes to a single server
@@ -66,6 +184,19 @@ class Client:
 
         self._active = False
 
+        # traffic counters, updated by the client implementation
+        self.lines_in = 0
+        self.lines_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reconnects = 0
+
+        self.event_queue = EventQueue(
+            self,
+            max_size=self.config.get("event_queue_size", 1000),
+            workers=self.config.get("event_workers", 32),
+        )
+
         self.cancelled_future = self.loop.create_future()
 
     def describe_server(self):
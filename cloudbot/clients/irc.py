@@ -1,82 +1,49 @@
 import asyncio
+import enum
 import logging
 import random
 import re
 import socket
 import ssl
+import time
 import traceback
-from collections.abc import Mapping
+from collections import deque
 from functools import partial
-from itertools import chain
 from pathlib import Path
+from typing import Any
 
 from irclib.parser import Message
 
-from cloudbot.client import Client, ClientConnectError, client
-from cloudbot.event import Event, EventType, IrcOutEvent
-from cloudbot.util import colors
+from cloudbot.client import Client, ClientConnectError, EventPriority, client
+from cloudbot.clients.irc_line import (
+    IrcLineEvent,
+    irc_command_to_event_type,
+    split_line,
+)
+from cloudbot.event import BaseEvent, Event, EventType, IrcOutEvent
+from cloudbot.plugin_hooks import execute_hook_threaded
+from cloudbot.util.tokenbucket import TokenBucket
 
 logger = logging.getLogger("cloudbot")
 
 irc_nick_re = re.compile(r"[A-Za-z0-9^{}\[\]\-`_|\\]+")
 
-irc_bad_chars = "".join(
-    c
-    for c in (chr(x) for x in chain(range(0, 32), range(127, 160)))
-    if c not in colors.IRC_FORMATTING_DICT.values() and c != "\1"
-)
-
-irc_clean_re = re.compile(f"[{re.escape(irc_bad_chars)}]")
-
-
-def irc_clean(dirty: str) -> str:
-    return irc_clean_re.sub("", dirty)
-
-
-irc_command_to_event_type = {
-    "PRIVMSG": EventType.message,
-    "JOIN": EventType.join,
-    "PART": EventType.part,
-    "KICK": EventType.kick,
-    "NOTICE": EventType.notice,
-}
-
-content_params = {
-    "PRIVMSG": 1,
-    "NOTICE": 1,
-    "PART": 1,
-    "KICK": 2,
-    "TOPIC": 1,
-    "NICK": 0,
-    "QUIT": 0,
-}
-
-chan_params = {
-    "PRIVMSG": 0,
-    "NOTICE": 0,
-    "JOIN": 0,
-    "PART": 0,
-    "TOPIC": 0,
-    "MODE": 0,
-    "KICK": 0,
-    "INVITE": 1,
-    "353": 2,
-    "366": 1,
-    "324": 1,
-    "329": 1,
-    "332": 1,
-    "333": 1,
-    # WHOIS
-    "310": 1,
-    "311": 1,
-    "312": 1,
-    "318": 1,
-}
-
-target_params = {
-    "KICK": 1,
-    "INVITE": 0,
-    "MODE": 0,
+# Commands which update the bot's view of the server or its channels
+state_commands = {
+    "PING",
+    "PONG",
+    "JOIN",
+    "PART",
+    "KICK",
+    "QUIT",
+    "NICK",
+    "MODE",
+    "TOPIC",
+    "ACCOUNT",
+    "AWAY",
+    "CHGHOST",
+    "CAP",
+    "ERROR",
 }
 
 
@@ -96,13 +63,347 @@ def decode(bytestring):
     return bytestring.decode("utf-8", errors="ignore")
 
 
-def _get_param(msg: Message, index_map: Mapping[str, int]) -> str | None:
-    if msg.command in index_map:
-        idx = index_map[msg.command]
-        if idx < len(msg.parameters):
-            return msg.parameters[idx]
+def hooks_want_command(plugin_manager, command: str) -> bool:
+    """
+    Check whether any loaded hook could be triggered by an incoming line with
+    this command, so lines nobody listens for can be skipped before parsing
+    """
+    if plugin_manager.catch_all_triggers or plugin_manager.raw_triggers.get(
+        command
+    ):
+        return True
+
+    if command == "PRIVMSG":
+        if plugin_manager.commands or plugin_manager.regex_hooks:
+            return True
+
+        # CTCP messages are `other` events
+        event_types: tuple[EventType, ...] = (
+            EventType.message,
+            EventType.action,
+            EventType.other,
+        )
+    else:
+        event_types = (irc_command_to_event_type.get(command, EventType.other),)
+
+    event_hooks = plugin_manager.event_type_hooks
+    return any(event_hooks.get(event_type) for event_type in event_types)
+
+
+def get_event_priority(conn: Client, event: BaseEvent) -> EventPriority:
+    """Classify an incoming event for the connection's event queue"""
+    command = event.irc_command
+    if command in state_commands or command.isdigit():
+        return EventPriority.STATE
+
+    if event.type is EventType.message and event.content:
+        content = event.content
+        prefix = conn.config.get("command_prefix", ".")
+        if (
+            content[0] in prefix
+            or event.chan.lower() == event.nick.lower()
+            or content.lower().startswith(conn.nick.lower())
+        ):
+            return EventPriority.COMMAND
+
+    return EventPriority.OTHER
+
+
+# 8191 bytes of IRCv3 message tags plus a standard 512 byte message
+DEFAULT_MAX_LINE_LENGTH = 8191 + 512
+
+
+class LineFramer:
+    """
+    Splits the incoming byte stream into lines.
+
+    Data is appended to a single buffer, and each read only scans the bytes
+    which haven't been searched yet, so a large burst is framed in linear time.
+
+    >>> framer = LineFramer()
+    >>> framer.feed(b"PING a\\r\\nPING")
+    [b'PING a']
+    >>> framer.feed(b" b\\r")
+    []
+    >>> framer.feed(b"\\n")
+    [b'PING b']
+    """
+
+    def __init__(self, max_line_length: int = DEFAULT_MAX_LINE_LENGTH) -> None:
+        self.max_line_length = max_line_length
+        self._buffer = bytearray()
+        # Offset in the buffer to resume searching for a line ending from
+        self._scan = 0
+        # Whether we are skipping the rest of a line which was too long
+        self._discarding = False
+
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Add data to the buffer and return all lines it completed"""
+        buf = self._buffer
+        buf += data
+
+        lines = []
+        start = 0
+        with memoryview(buf) as view:
+            end = buf.find(b"\r\n", self._scan)
+            while end >= 0:
+                if self._discarding:
+                    self._discarding = False
+                elif end - start > self.max_line_length:
+                    self.dropped += 1
+                else:
+                    lines.append(view[start:end].tobytes())
+
+                start = end + 2
+                end = buf.find(b"\r\n", start)
+
+        if start:
+            del buf[:start]
+
+        if len(buf) > self.max_line_length:
+            # No line ending in sight, drop what we have rather than
+            # buffering without limit
+            if not self._discarding:
+                self._discarding = True
+                self.dropped += 1
+
+            # Keep the last byte in case it is the start of a line ending
+            del buf[:-1]
+
+        # A line ending may be split across reads
+        self._scan = max(len(buf) - 1, 0)
+        return lines
+
+    def clear(self) -> None:
+        self._buffer.clear()
+        self._scan = 0
+        self._discarding = False
+
+
+class SendLane(enum.IntEnum):
+    """Outgoing line priorities, lower values are sent first"""
+
+    PROTOCOL = 0
+    CHAT = 1
+
+
+chat_commands = {"PRIVMSG", "NOTICE"}
+
+
+def get_send_lane(line: str) -> SendLane:
+    """
+    >>> get_send_lane("PONG :server")
+    <SendLane.PROTOCOL: 0>
+    >>> get_send_lane("PRIVMSG #foo :bar")
+    <SendLane.CHAT: 1>
+    """
+    command = line.split(None, 1)[0] if line else ""
+    if command.upper() in chat_commands:
+        return SendLane.CHAT
+
+    return SendLane.PROTOCOL
+
+
+class SendQueue:
+    """
+    Outgoing lines for a single connection.
+
+    Lines are written in order by a single coroutine, protocol lines before
+    chat lines, and are paced by a token bucket so the bot isn't disconnected
+    for flooding. Each line is bound to the protocol which was current when it
+    was queued, and is dropped if that connection is lost before it is sent.
+    """
+
+    def __init__(self, conn, *, tokens=10, restore_rate=2.0, enabled=True):
+        self.conn = conn
+        self.bucket = TokenBucket(tokens, restore_rate)
+        # A bucket which never refills would stop all output
+        self.enabled = enabled and restore_rate > 0
+
+        self._lanes: tuple[deque, ...] = tuple(deque() for _ in SendLane)
+        self._task: asyncio.Future | None = None
+        self._sending: Any = None
+
+        self.sent = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __len__(self) -> int:
+        return sum(map(len, self._lanes))
+
+    @property
+    def avg_latency(self) -> float:
+        if not self.sent:
+            return 0.0
+
+        return self.total_latency / self.sent
+
+    def put(self, line, log=True) -> None:
+        """Queue a line to be sent, must be called from the event loop"""
+        lane = get_send_lane(line)
+        self._lanes[lane].append(
+            (self.conn._protocol, line, log, time.monotonic())
+        )
+        self._start()
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(), loop=self.conn.loop)
+
+    def _stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        self._sending = None
 
-    return None
+    def discard(self, protocol) -> None:
+        """Drop the lines queued for a connection which has been lost"""
+        for lane in self._lanes:
+            kept = [item for item in lane if item[0] is not protocol]
+            lane.clear()
+            lane.extend(kept)
+
+        if self._sending is protocol:
+            # The writer is stuck on the lost connection, restart it
+            self._stop()
+            if len(self):
+                self._start()
+
+    def clear(self) -> None:
+        for lane in self._lanes:
+            lane.clear()
+
+        self._stop()
+
+    def _next_line(self):
+        for lane in self._lanes:
+            if lane:
+                return lane.popleft()
+
+        return None
+
+    async def _wait_for_token(self) -> None:
+        if not self.enabled:
+            return
+
+        bucket = self.bucket
+        while not bucket.consume(1):
+            await asyncio.sleep((1 - bucket.tokens) / bucket.fill_rate)
+
+    async def _run(self) -> None:
+        while len(self):
+            # Wait before taking the next line, so urgent lines queued in the
+            # meantime still go first
+            await self._wait_for_token()
+            item = self._next_line()
+            if item is None:
+                return
+
+            protocol, line, log, queued_at = item
+            self._sending = protocol
+            try:
+                await protocol.send(line, log=log)
+            except Exception:
+                logger.exception(
+                    "[%s] Error occurred while sending line", self.conn.name
+                )
+                continue
+            finally:
+                self._sending = None
+
+            latency = time.monotonic() - queued_at
+            self.sent += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_length": len(self),
+            "queued": {
+                lane.name.lower(): len(self._lanes[lane]) for lane in SendLane
+            },
+            "sent": self.sent,
+            "avg_latency": self.avg_latency,
+            "max_latency": self.max_latency,
+            "tokens": self.bucket.tokens,
+        }
+
+
+class OutPipeline:
+    """
+    The irc_out hooks, compiled into a single filter chain.
+
+    Each line is parsed at most once, the parsed line is shared between
+    stages until a stage changes the line. Stages which modify `parsed_line`
+    must return it. Inline hooks are called directly, other hooks are launched
+    as usual.
+    """
+
+    def __init__(self, bot, conn, hooks):
+        self.bot = bot
+        self.conn = conn
+        self.hooks = tuple(hooks)
+
+    def _parse(self, line, hook):
+        try:
+            return Message.parse(line)
+        except Exception:
+            logger.exception("Unable to parse line requested by hook %s", hook)
+            return None
+
+    async def run(self, line):
+        """Run a line through every stage
+
+        :return: A tuple of (ok, line), `ok` is False if a stage errored, in
+            which case the original line should be sent unfiltered. `line` is
+            the filtered line, which may be None or empty if a stage dropped it.
+        """
+        plugin_manager = self.bot.plugin_manager
+        parsed = None
+        for hook in self.hooks:
+            uses_parsed = "parsed_line" in hook.required_args
+            event = IrcOutEvent(
+                bot=self.bot, hook=hook, conn=self.conn, irc_raw=line
+            )
+            if uses_parsed:
+                if parsed is None and isinstance(line, str):
+                    parsed = self._parse(line, hook)
+
+                event.parsed_line = parsed
+
+            if hook.inline:
+                try:
+                    new_line = execute_hook_threaded(hook, event)
+                except Exception:
+                    logger.exception("Error in hook %s", hook.description)
+                    return False, None
+            else:
+                ok, new_line = await plugin_manager.internal_launch(hook, event)
+                if not ok:
+                    return False, None
+
+            if isinstance(new_line, Message):
+                # Reuse the returned message for the next stage to need it
+                parsed = new_line
+                line = str(new_line)
+            else:
+                if new_line is not line:
+                    parsed = None
+
+                line = new_line
+                if line is not None and not isinstance(line, bytes):
+                    line = str(line)
+
+            if not line:
+                return True, line
+
+        return True, line
 
 
 @client("irc")
@@ -147,6 +448,14 @@ class IrcClient(Client):
 
         self._channel_keys: dict[str, str] = {}
 
+        flood_config = self.config.get("flood_control", {})
+        self.send_queue = SendQueue(
+            self,
+            tokens=flood_config.get("tokens", 10),
+            restore_rate=flood_config.get("restore_rate", 2.0),
+            enabled=flood_config.get("enabled", True),
+        )
+
     def set_channel_key(
         self, channel: str, key: str, *, override: bool = True
     ) -> None:
@@ -291,7 +600,10 @@ class IrcClient(Client):
         if timeout is not None:
             coro = asyncio.wait_for(coro, timeout)
 
+        reconnect = self._protocol is not None
         self._transport, self._protocol = await coro
+        if reconnect:
+            self.reconnects += 1
 
         tasks = [
             self.bot.plugin_manager.launch(
@@ -318,6 +630,8 @@ class IrcClient(Client):
         if self._protocol:
             self._protocol.close()
 
+        self.send_queue.clear()
+
     def message(self, target, *messages):
         for text in messages:
             self.cmd("PRIVMSG", target, text)
@@ -389,11 +703,9 @@ class IrcClient(Client):
 
     def _send(self, line, log=True):
         """
-        Sends a raw IRC line unchecked. Doesn't do connected check, and is *not* threadsafe
+        Queues a raw IRC line unchecked. Doesn't do connected check, and is *not* threadsafe
         """
-        asyncio.ensure_future(
-            self._protocol.send(line, log=log), loop=self.loop
-        )
+        self.send_queue.put(line, log)
 
     @property
     def connected(self):
@@ -413,7 +725,13 @@ class _IrcProtocol(asyncio.Protocol):
         self.conn = conn
 
         # input buffer
-        self._input_buffer = b""
+        # max_line_length limits outgoing lines, incoming lines may carry
+        # message tags so they have their own limit
+        self._framer = LineFramer(
+            conn.config.get("max_recv_line_length", DEFAULT_MAX_LINE_LENGTH)
+        )
+        # Lines dropped before parsing as no hooks wanted them
+        self.skipped_lines = 0
 
         # connected
         self._connected = False
@@ -422,6 +740,8 @@ class _IrcProtocol(asyncio.Protocol):
         # transport
         self._transport = None
 
+        self._out_pipeline: OutPipeline | None = None
+
         # Future that waits until we are connected
         self._connected_future = self.loop.create_future()
 
@@ -435,6 +755,9 @@ class _IrcProtocol(asyncio.Protocol):
 
     def connection_lost(self, exc):
         self._connected = False
+        # Events and lines from the old connection are stale once it's gone
+        self.conn.event_queue.clear()
+        self.conn.send_queue.discard(self)
         if exc:
             logger.error("[%s] Connection lost: %s", self.conn.name, exc)
 
@@ -465,29 +788,23 @@ class _IrcProtocol(asyncio.Protocol):
                 )
 
         old_line = line
-        filtered = bool(self.bot.plugin_manager.out_sieves)
-
-        for out_sieve in self.bot.plugin_manager.out_sieves:
-            event = IrcOutEvent(
-                bot=self.bot, hook=out_sieve, conn=self.conn, irc_raw=line
-            )
+        out_sieves = self.bot.plugin_manager.out_sieves
+        filtered = bool(out_sieves)
+
+        if filtered:
+            pipeline = self._out_pipeline
+            if pipeline is None or pipeline.hooks != tuple(out_sieves):
+                pipeline = self._out_pipeline = OutPipeline(
+                    self.bot, self.conn, out_sieves
+                )
 
-            ok, new_line = await self.bot.plugin_manager.internal_launch(
-                out_sieve, event
-            )
-            if not ok:
+            filtered, line = await pipeline.run(line)
+            if not filtered:
                 logger.warning(
                     "Error occurred in outgoing sieve, falling back to old behavior"
                 )
-                logger.debug("Line was: %s", line)
-                filtered = False
-                break
-
-            line = new_line
-            if line is not None and not isinstance(line, bytes):
-                line = str(line)
-
-            if not line:
+                logger.debug("Line was: %s", old_line)
+            elif not line:
                 return
 
         if not filtered:
@@ -503,16 +820,40 @@ class _IrcProtocol(asyncio.Protocol):
             logger.debug("[%s|out] >> %r", self.conn.name, line)
 
         self._transport.write(line)
+        self.conn.lines_out += 1
+        self.conn.bytes_out += len(line)
 
     def data_received(self, data):
-        self._input_buffer += data
+        dropped = self._framer.dropped
+        lines = self._framer.feed(data)
+        self.conn.bytes_in += len(data)
+        self.conn.lines_in += len(lines)
+        if self._framer.dropped != dropped:
+            logger.warning(
+                "[%s] Dropped %d line(s) longer than %d bytes from %s",
+                self.conn.name,
+                self._framer.dropped - dropped,
+                self._framer.max_line_length,
+                self.conn.describe_server(),
+            )
 
-        while b"\r\n" in self._input_buffer:
-            line_data, self._input_buffer = self._input_buffer.split(b"\r\n", 1)
-            line = decode(line_data)
+        plugin_manager = self.bot.plugin_manager
+        for line_data in lines:
+            try:
+                line = line_data.decode()
+            except UnicodeDecodeError:
+                line = decode(line_data)
 
             try:
-                event = self.parse_line(line)
+                parts = split_line(line)
+                command = parts[2]
+                if command != "PING" and not hooks_want_command(
+                    plugin_manager, command
+                ):
+                    self.skipped_lines += 1
+                    continue
+
+                event = self._make_event(line, *parts)
             except Exception:
                 logger.exception(
                     "[%s] Error occurred while parsing IRC line '%s' from %s",
@@ -521,105 +862,25 @@ class _IrcProtocol(asyncio.Protocol):
                     self.conn.describe_server(),
                 )
             else:
-                # handle the message, async
-                asyncio.ensure_future(self.bot.process(event), loop=self.loop)
-
-    def parse_line(self, line: str) -> Event:
-        message = Message.parse(line)
-        command = message.command
-        command_params = message.parameters
-
-        # Reply to pings immediately
-        if command == "PING":
-            self.conn.send("PONG " + command_params[-1], log=False)
-
-        # Parse the command and params
-        # Content
-        content_raw = _get_param(message, content_params)
-        if content_raw is not None:
-            content = irc_clean(content_raw)
-        else:
-            content = None
-
-        # Event type
-        event_type = irc_command_to_event_type.get(command, EventType.other)
-        target = _get_param(message, target_params)
-
-        # Parse for CTCP
-        if event_type is EventType.message and content_raw.startswith("\x01"):
-            possible_ctcp = content_raw[1:]
-            if content_raw.endswith("\x01"):
-                possible_ctcp = possible_ctcp[:-1]
-
-            if "\x01" in possible_ctcp:
-                logger.debug(
-                    "[%s] Invalid CTCP message received, "
-                    "treating it as a mornal message",
-                    self.conn.name,
+                # queue the message to be handled, async
+                self.conn.event_queue.put(
+                    event, get_event_priority(self.conn, event)
                 )
-                ctcp_text = None
-            else:
-                ctcp_text = possible_ctcp
-                ctcp_text_split = ctcp_text.split(None, 1)
-                if ctcp_text_split[0] == "ACTION":
-                    # this is a CTCP ACTION, set event_type and content accordingly
-                    event_type = EventType.action
-                    content = irc_clean(ctcp_text_split[1])
-                else:
-                    # this shouldn't be considered a regular message
-                    event_type = EventType.other
-        else:
-            ctcp_text = None
-
-        # Channel
-        channel = _get_param(message, chan_params)
 
-        prefix = message.prefix
-        if prefix is None:
-            nick = None
-            user = None
-            host = None
-            mask = None
-        else:
-            nick = prefix.nick
-            user = prefix.user
-            host = prefix.host
-            mask = prefix.mask
+    def parse_line(self, line: str) -> IrcLineEvent:
+        return self._make_event(line, *split_line(line))
 
-        if channel:
-            # TODO Migrate plugins to accept the original case of the channel
-            channel = channel.lower()
+    def _make_event(
+        self, line: str, tags: str, prefix: str, command: str, params: str
+    ) -> IrcLineEvent:
+        event = IrcLineEvent(
+            self.bot, self.conn, line, tags, prefix, command, params
+        )
 
-            channel = channel.split()[0]  # Just in case there is more data
+        # Reply to pings immediately
+        if command == "PING":
+            self.conn.send("PONG " + event.irc_paramlist[-1], log=False)
 
-            # Channel for a PM is the sending user
-            if channel == self.conn.nick.lower():
-                channel = nick.lower()
-        else:
-            # If the channel isn't set, it's the sending user/server
-            channel = nick.lower() if nick else nick
-
-        # Set up parsed message
-        # TODO: Do we really want to send the raw `prefix` and `command_params` here?
-        event = Event(
-            bot=self.bot,
-            conn=self.conn,
-            event_type=event_type,
-            content_raw=content_raw,
-            content=content,
-            target=target,
-            channel=channel,
-            nick=nick,
-            user=user,
-            host=host,
-            mask=mask,
-            irc_raw=line,
-            irc_prefix=mask,
-            irc_command=command,
-            irc_paramlist=command_params,
-            irc_ctcp_text=ctcp_text,
-            irc_tags=message.tags,
-        )
         return event
 
     @property
@@ -0,0 +1,311 @@
+import logging
+import re
+import time
+from collections.abc import Iterator, Mapping
+from itertools import chain
+from typing import Any
+
+from irclib.parser import ParamList, Prefix, TagList
+
+from cloudbot.event import BaseEvent, EventType
+from cloudbot.util import colors
+
+logger = logging.getLogger("cloudbot")
+
+irc_bad_chars = "".join(
+    c
+    for c in (chr(x) for x in chain(range(0, 32), range(127, 160)))
+    if c not in colors.IRC_FORMATTING_DICT.values() and c != "\1"
+)
+
+irc_clean_re = re.compile(f"[{re.escape(irc_bad_chars)}]")
+
+
+def irc_clean(dirty: str) -> str:
+    return irc_clean_re.sub("", dirty)
+
+
+irc_command_to_event_type = {
+    "PRIVMSG": EventType.message,
+    "JOIN": EventType.join,
+    "PART": EventType.part,
+    "KICK": EventType.kick,
+    "NOTICE": EventType.notice,
+}
+
+content_params = {
+    "PRIVMSG": 1,
+    "NOTICE": 1,
+    "PART": 1,
+    "KICK": 2,
+    "TOPIC": 1,
+    "NICK": 0,
+    "QUIT": 0,
+}
+
+chan_params = {
+    "PRIVMSG": 0,
+    "NOTICE": 0,
+    "JOIN": 0,
+    "PART": 0,
+    "TOPIC": 0,
+    "MODE": 0,
+    "KICK": 0,
+    "INVITE": 1,
+    "353": 2,
+    "366": 1,
+    "324": 1,
+    "329": 1,
+    "332": 1,
+    "333": 1,
+    # WHOIS
+    "310": 1,
+    "311": 1,
+    "312": 1,
+    "318": 1,
+}
+
+target_params = {
+    "KICK": 1,
+    "INVITE": 0,
+    "MODE": 0,
+}
+
+
+def _get_param(
+    command: str, params: ParamList, index_map: Mapping[str, int]
+) -> str | None:
+    if command in index_map:
+        idx = index_map[command]
+        if idx < len(params):
+            return params[idx]
+
+    return None
+
+
+def split_line(line: str) -> tuple[str, str, str, str]:
+    """
+    Split a raw IRC line into its tags, prefix, command and parameters
+    without parsing any of them, the same way `Message.parse` does
+
+    >>> split_line("@a=b :nick!user@host privmsg #chan :hi there")
+    ('@a=b', ':nick!user@host', 'PRIVMSG', '#chan :hi there')
+    >>> split_line("PING :foo")
+    ('', '', 'PING', ':foo')
+    """
+    tags = prefix = ""
+    if line.startswith("@"):
+        tags, _, line = line.partition(" ")
+
+    if line.startswith(":"):
+        prefix, _, line = line.partition(" ")
+
+    command, _, params = line.partition(" ")
+    return tags, prefix, command.upper(), params
+
+
+class IrcLineEvent(BaseEvent):
+    """
+    An event for an incoming IRC line.
+
+    The event type and CTCP text are worked out up front, as every line needs
+    them to be dispatched. Everything else is only parsed from the raw line
+    the first time it is accessed, see `__getattr__`.
+    """
+
+    # Computed on first access
+    lazy_fields = (
+        "content",
+        "content_raw",
+        "target",
+        "chan",
+        "nick",
+        "user",
+        "host",
+        "mask",
+        "irc_prefix",
+        "irc_paramlist",
+        "irc_tags",
+    )
+
+    fields = (
+        "db",
+        "db_executor",
+        "bot",
+        "conn",
+        "hook",
+        "type",
+        "irc_raw",
+        "irc_command",
+        "irc_ctcp_text",
+    ) + lazy_fields
+
+    _prefix_obj: Prefix | None
+
+    __slots__ = fields + (
+        "_tags",
+        "_prefix",
+        "_prefix_obj",
+        "_params",
+        "_action",
+        "received",
+        # Attributes added by the client and hooks, like `parsed_line`
+        "__dict__",
+    )
+
+    def __init__(
+        self,
+        bot,
+        conn,
+        line: str,
+        tags: str,
+        prefix: str,
+        command: str,
+        params: str,
+    ) -> None:
+        """
+        :param line: The raw IRC line
+        :param tags: The line's unparsed tags, from `split_line`
+        :param prefix: The line's unparsed prefix, from `split_line`
+        :param command: The line's command, from `split_line`
+        :param params: The line's unparsed parameters, from `split_line`
+        """
+        # When the line was read, used to measure how long hooks wait to run
+        self.received = time.perf_counter()
+        self.db = None
+        self.db_executor = None
+        self.bot = bot
+        self.conn = conn
+        self.hook = None
+        self.irc_raw = line
+        self.irc_command = command
+
+        self._tags = tags
+        self._prefix = prefix
+        self._params = params
+        # The text of a CTCP ACTION
+        self._action: str | None = None
+
+        event_type = irc_command_to_event_type.get(command, EventType.other)
+        ctcp_text = None
+
+        # Parse for CTCP
+        if event_type is EventType.message:
+            content_raw = self.content_raw
+            if content_raw.startswith("\x01"):
+                possible_ctcp = content_raw[1:]
+                if content_raw.endswith("\x01"):
+                    possible_ctcp = possible_ctcp[:-1]
+
+                if "\x01" in possible_ctcp:
+                    logger.debug(
+                        "[%s] Invalid CTCP message received, "
+                        "treating it as a mornal message",
+                        conn.name,
+                    )
+                else:
+                    ctcp_text = possible_ctcp
+                    ctcp_text_split = ctcp_text.split(None, 1)
+                    if ctcp_text_split[0] == "ACTION":
+                        # this is a CTCP ACTION, set event_type and content accordingly
+                        event_type = EventType.action
+                        self._action = ctcp_text_split[1]
+                    else:
+                        # this shouldn't be considered a regular message
+                        event_type = EventType.other
+
+        self.type = event_type
+        self.irc_ctcp_text = ctcp_text
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for slots which haven't been set yet
+        try:
+            compute = self._compute[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        value = compute(self)
+        setattr(self, name, value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self.fields) + len(self.__dict__)
+
+    def __iter__(self) -> Iterator[str]:
+        return chain(self.fields, self.__dict__)
+
+    def _get_content(self) -> str | None:
+        if self._action is not None:
+            return irc_clean(self._action)
+
+        content_raw = self.content_raw
+        if content_raw is None:
+            return None
+
+        return irc_clean(content_raw)
+
+    def _get_content_raw(self) -> str | None:
+        return _get_param(self.irc_command, self.irc_paramlist, content_params)
+
+    def _get_target(self) -> str | None:
+        return _get_param(self.irc_command, self.irc_paramlist, target_params)
+
+    def _get_chan(self) -> str | None:
+        channel = _get_param(self.irc_command, self.irc_paramlist, chan_params)
+        nick = self.nick
+        if channel:
+            # TODO Migrate plugins to accept the original case of the channel
+            channel = channel.lower()
+
+            channel = channel.split()[0]  # Just in case there is more data
+
+            # Channel for a PM is the sending user
+            if channel == self.conn.nick.lower():
+                channel = nick.lower()
+        else:
+            # If the channel isn't set, it's the sending user/server
+            channel = nick.lower() if nick else nick
+
+        return channel
+
+    def _get_prefix(self) -> Prefix | None:
+        # Differentiate empty prefix ': CMD' from no prefix 'CMD'
+        return Prefix.parse(self._prefix[1:]) if self._prefix else None
+
+    def _get_nick(self) -> str | None:
+        prefix = self._prefix_obj
+        return None if prefix is None else prefix.nick
+
+    def _get_user(self) -> str | None:
+        prefix = self._prefix_obj
+        return None if prefix is None else prefix.user
+
+    def _get_host(self) -> str | None:
+        prefix = self._prefix_obj
+        return None if prefix is None else prefix.host
+
+    def _get_mask(self) -> str | None:
+        prefix = self._prefix_obj
+        return None if prefix is None else prefix.mask
+
+    def _get_paramlist(self) -> ParamList:
+        return ParamList.parse(self._params)
+
+    def _get_tags(self) -> TagList | None:
+        # Differentiate empty tags '@ CMD' from no tags 'CMD'
+        return TagList.parse(self._tags[1:]) if self._tags else None
+
+    _compute = {
+        "content": _get_content,
+        "content_raw": _get_content_raw,
+        "target": _get_target,
+        "chan": _get_chan,
+        "nick": _get_nick,
+        "user": _get_user,
+        "host": _get_host,
+        "mask": _get_mask,
+        "irc_prefix": _get_mask,
+        "irc_paramlist": _get_paramlist,
+        "irc_tags": _get_tags,
+        "_prefix_obj": _get_prefix,
+    }
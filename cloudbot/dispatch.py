@@ -0,0 +1,531 @@
+"""
+Precompiled matchers used by `CloudBot.process` to route incoming messages
+to hooks without rebuilding state for every line
+"""
+
+import re
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator, Mapping
+
+from cloudbot.plugin_hooks import CommandHook, RegexHook
+
+__all__ = (
+    "build_cmd_regex",
+    "CommandDispatcher",
+    "RegexEntry",
+    "RegexDispatcher",
+)
+
+
+def build_cmd_regex(
+    command_prefix: str, nick: str, *, is_pm: bool
+) -> re.Pattern:
+    """Compile the regex used to detect commands for a connection
+
+    :param command_prefix: The connection's configured command prefix(es)
+    :param nick: The connection's current nickname
+    :param is_pm: Whether the regex should match private messages, where the
+        command prefix is optional
+    """
+    return re.compile(
+        r"""
+        ^
+        # Prefix or nick
+        (?:
+            (?P<prefix>["""
+        + re.escape(command_prefix)
+        + r"""])"""
+        + ("?" if is_pm else "")
+        + r"""
+            |
+            """
+        + re.escape(nick)
+        + r"""[,;:]+\s+
+        )
+        (?P<command>\w+)  # Command
+        (?:$|\s+)
+        (?P<text>.*)     # Text
+        """,
+        re.IGNORECASE | re.VERBOSE,
+    )
+
+
+class CommandDispatcher:
+    """
+    Matches and resolves commands for a single connection.
+
+    A dispatcher is built from a snapshot of the command table and is only
+    valid for the nick, command prefix and command table version it was built
+    with, see `is_current`.
+    """
+
+    def __init__(
+        self,
+        commands: Mapping[str, CommandHook],
+        nick: str,
+        command_prefix: str,
+        version: int,
+    ) -> None:
+        self.nick = nick
+        self.command_prefix = command_prefix
+        self.version = version
+
+        self._commands = dict(commands)
+        self._names = sorted(self._commands)
+
+        self._chan_regex = build_cmd_regex(command_prefix, nick, is_pm=False)
+        self._pm_regex = build_cmd_regex(command_prefix, nick, is_pm=True)
+
+    def is_current(self, nick: str, command_prefix: str, version: int) -> bool:
+        return (
+            self.version == version
+            and self.nick == nick
+            and self.command_prefix == command_prefix
+        )
+
+    def match(self, content: str, *, is_pm: bool) -> re.Match | None:
+        """Match a message against the command regex
+
+        :param content: The message text
+        :param is_pm: Whether the message was sent in a private message
+        """
+        if is_pm:
+            return self._pm_regex.match(content)
+
+        return self._chan_regex.match(content)
+
+    def lookup(self, command: str) -> tuple[CommandHook | None, list[str]]:
+        """Resolve a command name, allowing unambiguous prefixes
+
+        >>> from unittest.mock import sentinel
+        >>> d = CommandDispatcher(
+        ...     {"foo": sentinel.foo, "foobar": sentinel.foobar, "bar": sentinel.bar},
+        ...     "bot", ".", 0,
+        ... )
+        >>> d.lookup("foo")
+        (sentinel.foo, ['foo'])
+        >>> d.lookup("b")
+        (sentinel.bar, ['bar'])
+        >>> d.lookup("fo")
+        (None, ['foo', 'foobar'])
+        >>> d.lookup("baz")
+        (None, [])
+
+        :param command: The lowercased command name
+        :return: A tuple of (hook, matches), where `hook` is the resolved hook
+            or None and `matches` is the sorted list of matching command names
+        """
+        hook = self._commands.get(command)
+        if hook is not None:
+            return hook, [command]
+
+        names = self._names
+        matches = []
+        idx = bisect_left(names, command)
+        while idx < len(names) and names[idx].startswith(command):
+            matches.append(names[idx])
+            idx += 1
+
+        if len(matches) == 1:
+            return self._commands[matches[0]], matches
+
+        return None, matches
+
+
+# Quantifiers, and the minimum count they allow. "{" is only a quantifier if
+# it is followed by a valid count, otherwise it is a literal
+_QUANTIFIER_RE = re.compile(r"[*+?]|\{(?:(\d+)(?:,\d*)?|,\d*)\}")
+_FLAG_GROUP_RE = re.compile(r"\(\?[aiLmsux]+\)")
+_SCOPED_FLAGS_RE = re.compile(r"\?[aiLmsux]*(?:-[imsx]+)?:")
+_NAMED_GROUP_RE = re.compile(r"\?P<\w+>")
+
+# Escapes which match a single, known character
+_ESCAPED_CHARS = {
+    "a": "\a",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
+# Escapes for character classes and zero-width assertions
+_CLASS_ESCAPES = frozenset("AbBdDsSwWZ")
+
+
+class _UnsupportedPattern(ValueError):
+    """The pattern uses syntax the prefilter scanner doesn't handle"""
+
+
+class _Token:
+    """A single atom of a regex and the quantifier applied to it"""
+
+    __slots__ = ("kind", "value", "min_count")
+
+    def __init__(self, kind: str, value=None) -> None:
+        # One of "literal", "anchor", "group", "alternation" or "other"
+        self.kind = kind
+        # The character for literals, the contents of groups that may be
+        # searched for literals
+        self.value = value
+        # None if there is no quantifier
+        self.min_count: int | None = None
+
+
+def _skip_class(source: str, pos: int) -> int:
+    """Find the end of the character class starting at `pos`"""
+    pos += 1
+    if source.startswith("^", pos):
+        pos += 1
+
+    # A "]" right after the opening bracket is a literal
+    if source.startswith("]", pos):
+        pos += 1
+
+    while pos < len(source):
+        char = source[pos]
+        if char == "\\":
+            pos += 2
+        elif char == "]":
+            return pos + 1
+        else:
+            pos += 1
+
+    raise _UnsupportedPattern("Unterminated character class")
+
+
+def _find_group_end(source: str, pos: int) -> int:
+    """Find the index of the ")" closing the group opened at `pos`"""
+    depth = 0
+    while pos < len(source):
+        char = source[pos]
+        if char == "\\":
+            pos += 2
+            continue
+
+        if char == "[":
+            pos = _skip_class(source, pos)
+            continue
+
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return pos
+
+        pos += 1
+
+    raise _UnsupportedPattern("Unbalanced parenthesis")
+
+
+def _read_group(source: str, pos: int) -> tuple[_Token | None, int]:
+    end = _find_group_end(source, pos)
+    inner = source[pos + 1 : end]
+    if not inner.startswith("?"):
+        return _Token("group", inner), end + 1
+
+    named = _NAMED_GROUP_RE.match(inner)
+    if named:
+        return _Token("group", inner[named.end() :]), end + 1
+
+    if inner.startswith("?#") or _FLAG_GROUP_RE.fullmatch(source, pos, end + 1):
+        # Comments and global flags, which are already in the pattern's flags
+        return None, end + 1
+
+    if inner.startswith(("?=", "?!", "?<=", "?<!", "?P=", "?(")) or (
+        _SCOPED_FLAGS_RE.match(inner)
+    ):
+        # Lookarounds, backreferences, conditionals and groups with their own
+        # flags aren't searched
+        return _Token("other"), end + 1
+
+    raise _UnsupportedPattern(f"Unknown group type {inner[:3]!r}")
+
+
+def _read_escape(source: str, pos: int) -> tuple[_Token, int]:
+    if pos + 1 >= len(source):
+        raise _UnsupportedPattern("Trailing backslash")
+
+    char = source[pos + 1]
+    if not char.isalnum():
+        return _Token("literal", char), pos + 2
+
+    if char in _ESCAPED_CHARS:
+        return _Token("literal", _ESCAPED_CHARS[char]), pos + 2
+
+    if char == "A":
+        return _Token("anchor"), pos + 2
+
+    if char in _CLASS_ESCAPES:
+        return _Token("other"), pos + 2
+
+    # Numeric escapes, backreferences and named characters
+    raise _UnsupportedPattern(f"Unsupported escape \\{char}")
+
+
+def _tokenize(source: str, flags: int) -> list[_Token]:
+    """Split a regex into atoms, without descending into groups"""
+    tokens: list[_Token] = []
+    pos = 0
+    while pos < len(source):
+        char = source[pos]
+        if flags & re.VERBOSE:
+            if char.isspace():
+                pos += 1
+                continue
+
+            if char == "#":
+                pos = source.find("\n", pos)
+                if pos < 0:
+                    break
+
+                continue
+
+        quantifier = _QUANTIFIER_RE.match(source, pos)
+        token: _Token | None
+        if quantifier:
+            if not tokens or tokens[-1].min_count is not None:
+                raise _UnsupportedPattern("Nothing to repeat")
+
+            tokens[-1].min_count = int(quantifier.group(1) or 0)
+            if char == "+":
+                tokens[-1].min_count = 1
+
+            pos = quantifier.end()
+            # Lazy and possessive quantifiers
+            if source.startswith(("?", "+"), pos):
+                pos += 1
+
+            continue
+
+        if char == "\\":
+            token, pos = _read_escape(source, pos)
+        elif char == "(":
+            token, pos = _read_group(source, pos)
+        elif char == "[":
+            token, pos = _Token("other"), _skip_class(source, pos)
+        elif char == "|":
+            token, pos = _Token("alternation"), pos + 1
+        elif char == "^" and not flags & re.MULTILINE:
+            token, pos = _Token("anchor"), pos + 1
+        elif char in ".^$":
+            token, pos = _Token("other"), pos + 1
+        elif char == ")":
+            raise _UnsupportedPattern("Unbalanced parenthesis")
+        else:
+            token, pos = _Token("literal", char), pos + 1
+
+        if token is not None:
+            tokens.append(token)
+
+    return tokens
+
+
+def _find_literals(tokens: list[_Token], flags: int, runs: list[str]) -> None:
+    """Collect runs of literal characters that every match of `tokens` contains"""
+    current: list[str] = []
+    for token in tokens:
+        if token.kind == "literal":
+            if token.min_count is None:
+                current.append(token.value)
+                continue
+
+            # The character is only known to be followed by itself
+            if token.min_count > 0:
+                current.append(token.value)
+
+        if current:
+            runs.append("".join(current))
+            current = []
+
+        if token.kind == "group" and token.min_count != 0:
+            group_tokens = _tokenize(token.value, flags)
+            # Only one of the alternatives has to match
+            if not any(t.kind == "alternation" for t in group_tokens):
+                _find_literals(group_tokens, flags, runs)
+
+    if current:
+        runs.append("".join(current))
+
+
+def get_prefilter(regex) -> tuple[str | None, bool]:
+    """Find a literal string which must be present in any text the regex matches
+
+    The pattern's source is scanned conservatively, any syntax which isn't
+    understood means no prefilter is used for the regex.
+
+    >>> get_prefilter(re.compile(r"^s/(.*)/(.*)/?"))
+    ('s/', True)
+    >>> get_prefilter(re.compile(r"(\\S+)(\\+\\+|--)?\\+\\+"))
+    ('++', False)
+    >>> get_prefilter(re.compile(r"(?i)[a-z]+"))
+    (None, False)
+
+    :param regex: The compiled regex
+    :return: A tuple of (literal, anchored), `literal` is None if no usable
+        literal could be found, `anchored` is True if the literal must appear at
+        the start of the text
+    """
+    if not isinstance(regex, re.Pattern) or not isinstance(regex.pattern, str):
+        return None, False
+
+    if regex.flags & re.LOCALE:
+        return None, False
+
+    try:
+        tokens = _tokenize(regex.pattern, regex.flags)
+        if any(token.kind == "alternation" for token in tokens):
+            return None, False
+
+        anchored = bool(tokens) and tokens[0].kind == "anchor"
+        if anchored:
+            tokens = tokens[1:]
+
+        runs: list[str] = []
+        _find_literals(tokens, regex.flags, runs)
+    except _UnsupportedPattern:
+        return None, False
+
+    if not runs:
+        return None, False
+
+    prefix = None
+    if anchored and tokens[0].kind == "literal" and tokens[0].min_count != 0:
+        prefix = runs[0]
+
+    if regex.flags & re.IGNORECASE:
+        # Only ASCII literals can be safely compared after lowercasing
+        runs = [run.lower() for run in runs if run.isascii()]
+        if prefix is not None:
+            prefix = prefix.lower() if prefix.isascii() else None
+
+    if prefix is not None:
+        return prefix, True
+
+    if not runs:
+        return None, False
+
+    return max(runs, key=len), False
+
+
+class RegexEntry:
+    """
+    A single regex belonging to a RegexHook, along with its prefilter and
+    match counters
+    """
+
+    def __init__(self, regex, hook: RegexHook) -> None:
+        self.regex = regex
+        self.hook = hook
+        self.literal, self.anchored = get_prefilter(regex)
+        self.ignore_case = bool(getattr(regex, "flags", 0) & re.IGNORECASE)
+
+        # Times the regex was considered for a message
+        self.checked = 0
+        # Times the prefilter ruled out a match without running the regex
+        self.skipped = 0
+        self.matched = 0
+
+    @property
+    def match_rate(self) -> float:
+        if not self.checked:
+            return 0.0
+
+        return self.matched / self.checked
+
+    def search(self, content: str, folded: str | None) -> re.Match | None:
+        """Search for the regex in `content`, applying the prefilter first
+
+        :param content: The message text
+        :param folded: The lowercased message text if it is ASCII, otherwise None
+        """
+        self.checked += 1
+        literal = self.literal
+        if literal is not None:
+            if not self.ignore_case:
+                text: str | None = content
+            else:
+                text = folded
+
+            if text is not None:
+                if self.anchored:
+                    found = text.startswith(literal)
+                else:
+                    found = literal in text
+
+                if not found:
+                    self.skipped += 1
+                    return None
+
+        match: re.Match | None = self.regex.search(content)
+        if match:
+            self.matched += 1
+
+        return match
+
+    def __repr__(self) -> str:
+        return (
+            f"RegexEntry[{self.regex.pattern!r}, {self.hook.description}, "
+            f"checked: {self.checked}, skipped: {self.skipped}, "
+            f"matched: {self.matched}]"
+        )
+
+
+class RegexDispatcher:
+    """
+    Matches messages against all loaded regex hooks, in priority order.
+
+    Dispatchers are rebuilt whenever the loaded regex hooks change, entries
+    for unchanged hooks are carried over so their counters are kept.
+    """
+
+    def __init__(
+        self,
+        regex_hooks: Iterable[tuple[re.Pattern, RegexHook]],
+        previous: "RegexDispatcher | None" = None,
+    ) -> None:
+        old_entries = {}
+        if previous is not None:
+            old_entries = {
+                (id(entry.regex), id(entry.hook)): entry
+                for entry in previous.entries
+            }
+
+        self.entries: list[RegexEntry] = [
+            old_entries.get((id(regex), id(hook))) or RegexEntry(regex, hook)
+            for regex, hook in regex_hooks
+        ]
+
+        self._need_fold = any(
+            entry.ignore_case and entry.literal is not None
+            for entry in self.entries
+        )
+
+    def search(
+        self, content: str, *, matched_command: bool = False
+    ) -> Iterator[tuple[RegexHook, re.Match]]:
+        """Find all regex hooks which match `content`
+
+        Honours `RegexHook.run_on_cmd` and `RegexHook.only_no_match`, callers
+        should stop iterating once a hook halts processing.
+
+        :param content: The message text
+        :param matched_command: Whether the message already triggered a command
+        """
+        folded = None
+        if self._need_fold and content.isascii():
+            folded = content.lower()
+
+        regex_matched = False
+        for entry in self.entries:
+            hook = entry.hook
+            if not hook.run_on_cmd and matched_command:
+                continue
+
+            if hook.only_no_match and regex_matched:
+                continue
+
+            match = entry.search(content, folded)
+            if match:
+                regex_matched = True
+                yield hook, match
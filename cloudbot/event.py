@@ -1,13 +1,13 @@
-import concurrent.futures
 import enum
 import logging
 from collections.abc import Iterator, Mapping
 from functools import partial
+from itertools import chain
 from typing import Any
 
 from irclib.parser import Message
 
-from cloudbot.util.database import Session
+from cloudbot.util.database import LazySession, Session
 
 logger = logging.getLogger("cloudbot")
 
@@ -24,111 +24,37 @@ class EventType(enum.Enum):
     other = 6
 
 
-class Event(Mapping[str, Any]):
-    def __init__(
-        self,
-        *,
-        bot=None,
-        hook=None,
-        conn=None,
-        base_event=None,
-        event_type=EventType.other,
-        content=None,
-        content_raw=None,
-        target=None,
-        channel=None,
-        nick=None,
-        user=None,
-        host=None,
-        mask=None,
-        irc_raw=None,
-        irc_prefix=None,
-        irc_command=None,
-        irc_paramlist=None,
-        irc_ctcp_text=None,
-        irc_tags=None,
-    ):
-        """
-        All of these parameters except for `bot` and `hook` are optional.
-        The irc_* parameters should only be specified for IRC events.
-
-        Note that the `bot` argument may be left out if you specify a `base_event`.
-
-        :param bot: The CloudBot instance this event was triggered from
-        :param conn: The Client instance this event was triggered from
-        :param hook: The hook this event will be passed to
-        :param base_event: The base event that this event is based on. If this parameter is not None, then nick, user,
-                            host, mask, and irc_* arguments are ignored
-        :param event_type: The type of the event
-        :param content: The content of the message, or the reason for an join or part
-        :param target: The target of the action, for example the user being kicked, or invited
-        :param channel: The channel that this action took place in
-        :param nick: The nickname of the sender that triggered this event
-        :param user: The user of the sender that triggered this event
-        :param host: The host of the sender that triggered this event
-        :param mask: The mask of the sender that triggered this event (nick!user@host)
-        :param irc_raw: The raw IRC line
-        :param irc_prefix: The raw IRC prefix
-        :param irc_command: The IRC command
-        :param irc_paramlist: The list of params for the IRC command. If the last param is a content param, the ':'
-                                should be removed from the front.
-        :param irc_ctcp_text: CTCP text if this message is a CTCP command
-        """
-        self.db = None
-        self.db_executor = None
-        self.bot = bot
-        self.conn = conn
-        self.hook = hook
-        if base_event is not None:
-            # We're copying an event, so inherit values
-            if self.bot is None and base_event.bot is not None:
-                self.bot = base_event.bot
-            if self.conn is None and base_event.conn is not None:
-                self.conn = base_event.conn
-            if self.hook is None and base_event.hook is not None:
-                self.hook = base_event.hook
-
-            # If base_event is provided, don't check these parameters, just inherit
-            self.type = base_event.type
-            self.content = base_event.content
-            self.content_raw = base_event.content_raw
-            self.target = base_event.target
-            self.chan = base_event.chan
-            self.nick = base_event.nick
-            self.user = base_event.user
-            self.host = base_event.host
-            self.mask = base_event.mask
-            # clients-specific parameters
-            self.irc_raw = base_event.irc_raw
-            self.irc_tags = base_event.irc_tags
-            self.irc_prefix = base_event.irc_prefix
-            self.irc_command = base_event.irc_command
-            self.irc_paramlist = base_event.irc_paramlist
-            self.irc_ctcp_text = base_event.irc_ctcp_text
-        else:
-            # Since base_event wasn't provided, we can take these parameters
-            self.type = event_type
-            self.content = content
-            self.content_raw = content_raw
-            self.target = target
-            self.chan = channel
-            self.nick = nick
-            self.user = user
-            self.host = host
-            self.mask = mask
-            # clients-specific parameters
-            self.irc_raw = irc_raw
-            self.irc_tags = irc_tags
-            self.irc_prefix = irc_prefix
-            self.irc_command = irc_command
-            self.irc_paramlist = irc_paramlist
-            self.irc_ctcp_text = irc_ctcp_text
-
-    def __len__(self) -> int:
-        return len(self.__dict__)
-
-    def __iter__(self) -> Iterator[str]:
-        return iter(self.__dict__)
+class BaseEvent(Mapping[str, Any]):
+    """
+    The methods shared by every event.
+
+    `Event` stores its fields as plain attributes, other implementations
+    (such as the lazily parsed IRC line event, or per-hook views) may store
+    them however they like, as long as they provide the same attributes.
+    """
+
+    __slots__ = ()
+
+    bot: Any
+    conn: Any
+    hook: Any
+    db: Any
+    db_executor: Any
+    type: EventType
+    content: Any
+    content_raw: Any
+    target: Any
+    chan: Any
+    nick: Any
+    user: Any
+    host: Any
+    mask: Any
+    irc_raw: Any
+    irc_tags: Any
+    irc_prefix: Any
+    irc_command: Any
+    irc_paramlist: Any
+    irc_ctcp_text: Any
 
     def __getitem__(self, item: str) -> Any:
         try:
@@ -152,10 +78,14 @@ class Event(Mapping[str, Any]):
         if "db" in self.hook.required_args:
             # logger.debug("Opening database session for {}:threaded=False".format(self.hook.description))
 
-            # we're running a coroutine hook with a db, so initialise an executor pool
-            self.db_executor = concurrent.futures.ThreadPoolExecutor(1)
-            # be sure to initialize the db in the database executor, so it will be accessible in that thread.
-            self.db = await self.async_call(Session)
+            # we're running a coroutine hook with a db, so pin this event to a database worker
+            self.db_executor = self.bot.db_executor_pool.acquire()
+            # Other events may share the worker thread, so don't use the thread-local session.
+            # The session itself is only created once the hook actually uses it
+            self.db = LazySession(
+                Session.session_factory, self.hook.count_db_session_used
+            )
+            self.hook.db_sessions_requested += 1
 
     def prepare_threaded(self):
         """
@@ -173,7 +103,8 @@ class Event(Mapping[str, Any]):
         if "db" in self.hook.required_args:
             # logger.debug("Opening database session for {}:threaded=True".format(self.hook.description))
 
-            self.db = Session()
+            self.db = LazySession(Session, self.hook.count_db_session_used)
+            self.hook.db_sessions_requested += 1
 
     async def close(self):
         """
@@ -190,9 +121,15 @@ class Event(Mapping[str, Any]):
         if self.db is not None:
             # logger.debug("Closing database session for {}:threaded=False".format(self.hook.description))
             # be sure the close the database in the database executor, as it is only accessable in that one thread
-            await self.async_call(self.db.close)
+            if not isinstance(self.db, LazySession) or self.db.opened:
+                await self.async_call(self.db.close)
+
             self.db = None
 
+        if self.db_executor is not None:
+            self.db_executor.release()
+            self.db_executor = None
+
     def close_threaded(self):
         """
         Closes this event after running it through it's hook.
@@ -328,7 +265,7 @@ class Event(Mapping[str, Any]):
         if self.has_permission(permission, notice=notice):
             return True
 
-        for perm_hook in self.bot.plugin_manager.perm_hooks[permission]:
+        for perm_hook in self.bot.plugin_manager.perm_hooks.get(permission, ()):
             ok, res = await self.bot.plugin_manager.internal_launch(
                 perm_hook, Event(base_event=self, hook=perm_hook)
             )
@@ -363,6 +300,113 @@ class Event(Mapping[str, Any]):
         return self.conn.is_nick_valid(nick)
 
 
+class Event(BaseEvent):
+    def __init__(
+        self,
+        *,
+        bot=None,
+        hook=None,
+        conn=None,
+        base_event=None,
+        event_type=EventType.other,
+        content=None,
+        content_raw=None,
+        target=None,
+        channel=None,
+        nick=None,
+        user=None,
+        host=None,
+        mask=None,
+        irc_raw=None,
+        irc_prefix=None,
+        irc_command=None,
+        irc_paramlist=None,
+        irc_ctcp_text=None,
+        irc_tags=None,
+    ):
+        """
+        All of these parameters except for `bot` and `hook` are optional.
+        The irc_* parameters should only be specified for IRC events.
+
+        Note that the `bot` argument may be left out if you specify a `base_event`.
+
+        :param bot: The CloudBot instance this event was triggered from
+        :param conn: The Client instance this event was triggered from
+        :param hook: The hook this event will be passed to
+        :param base_event: The base event that this event is based on. If this parameter is not None, then nick, user,
+                            host, mask, and irc_* arguments are ignored
+        :param event_type: The type of the event
+        :param content: The content of the message, or the reason for an join or part
+        :param target: The target of the action, for example the user being kicked, or invited
+        :param channel: The channel that this action took place in
+        :param nick: The nickname of the sender that triggered this event
+        :param user: The user of the sender that triggered this event
+        :param host: The host of the sender that triggered this event
+        :param mask: The mask of the sender that triggered this event (nick!user@host)
+        :param irc_raw: The raw IRC line
+        :param irc_prefix: The raw IRC prefix
+        :param irc_command: The IRC command
+        :param irc_paramlist: The list of params for the IRC command. If the last param is a content param, the ':'
+                                should be removed from the front.
+        :param irc_ctcp_text: CTCP text if this message is a CTCP command
+        """
+        self.db = None
+        self.db_executor = None
+        self.bot = bot
+        self.conn = conn
+        self.hook = hook
+        if base_event is not None:
+            # We're copying an event, so inherit values
+            if self.bot is None and base_event.bot is not None:
+                self.bot = base_event.bot
+            if self.conn is None and base_event.conn is not None:
+                self.conn = base_event.conn
+            if self.hook is None and base_event.hook is not None:
+                self.hook = base_event.hook
+
+            # If base_event is provided, don't check these parameters, just inherit
+            self.type = base_event.type
+            self.content = base_event.content
+            self.content_raw = base_event.content_raw
+            self.target = base_event.target
+            self.chan = base_event.chan
+            self.nick = base_event.nick
+            self.user = base_event.user
+            self.host = base_event.host
+            self.mask = base_event.mask
+            # clients-specific parameters
+            self.irc_raw = base_event.irc_raw
+            self.irc_tags = base_event.irc_tags
+            self.irc_prefix = base_event.irc_prefix
+            self.irc_command = base_event.irc_command
+            self.irc_paramlist = base_event.irc_paramlist
+            self.irc_ctcp_text = base_event.irc_ctcp_text
+        else:
+            # Since base_event wasn't provided, we can take these parameters
+            self.type = event_type
+            self.content = content
+            self.content_raw = content_raw
+            self.target = target
+            self.chan = channel
+            self.nick = nick
+            self.user = user
+            self.host = host
+            self.mask = mask
+            # clients-specific parameters
+            self.irc_raw = irc_raw
+            self.irc_tags = irc_tags
+            self.irc_prefix = irc_prefix
+            self.irc_command = irc_command
+            self.irc_paramlist = irc_paramlist
+            self.irc_ctcp_text = irc_ctcp_text
+
+    def __len__(self) -> int:
+        return len(self.__dict__)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__dict__)
+
+
 class CommandEvent(Event):
     def __init__(
         self,
@@ -484,6 +528,137 @@ class RegexEvent(Event):
         self.match = match
 
 
+class _SharedField:
+    """
+    A field of an `EventView` which is read from its base event until a hook
+    sets it, the new value is only seen through the view
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self) -> None:
+        self.name = ""
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+
+        changed = view.changed_fields
+        if changed is not None and self.name in changed:
+            return changed[self.name]
+
+        return getattr(view.base_event, self.name)
+
+    def __set__(self, view, value) -> None:
+        if view.changed_fields is None:
+            view.changed_fields = {}
+
+        view.changed_fields[self.name] = value
+
+
+class EventView(BaseEvent):
+    """
+    A lightweight per-hook view of an event, used when one incoming event is
+    dispatched to many hooks.
+
+    Only the hook specific fields are stored on the view, everything else is
+    read from the base event when accessed. Plain views have no `__dict__`,
+    the command and regex views have one through `CommandEvent` and
+    `RegexEvent`.
+    """
+
+    # Fields stored on the view itself, subclasses add their own
+    own_fields: tuple[str, ...] = ("hook", "db", "db_executor")
+
+    # Fields read from the base event, see `_SharedField`
+    bot = _SharedField()
+    conn = _SharedField()
+    type = _SharedField()
+    content = _SharedField()
+    content_raw = _SharedField()
+    target = _SharedField()
+    chan = _SharedField()
+    nick = _SharedField()
+    user = _SharedField()
+    host = _SharedField()
+    mask = _SharedField()
+    irc_raw = _SharedField()
+    irc_tags = _SharedField()
+    irc_prefix = _SharedField()
+    irc_command = _SharedField()
+    irc_paramlist = _SharedField()
+    irc_ctcp_text = _SharedField()
+
+    changed_fields: dict[str, Any] | None
+
+    __slots__ = ("base_event", "changed_fields") + own_fields
+
+    def __init__(self, hook, base_event: BaseEvent) -> None:
+        self.base_event = base_event
+        # The shared fields set on this view, created when first needed
+        self.changed_fields = None
+        self.hook = hook
+        self.db = None
+        self.db_executor = None
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes the view doesn't have itself
+        if name == "base_event" or name.startswith("__"):
+            raise AttributeError(name)
+
+        return getattr(self.base_event, name)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __iter__(self) -> Iterator[str]:
+        keys = chain(
+            self.own_fields,
+            self.base_event,
+            self.changed_fields or (),
+            getattr(self, "__dict__", ()),
+        )
+        return iter(dict.fromkeys(keys))
+
+
+class CommandEventView(EventView, CommandEvent):
+    """A `CommandEvent` for a single command hook, see `EventView`"""
+
+    __slots__ = ("text", "doc", "triggered_command", "triggered_prefix")
+
+    own_fields = EventView.own_fields + __slots__
+
+    def __init__(
+        self,
+        hook,
+        base_event: BaseEvent,
+        *,
+        text,
+        triggered_command,
+        cmd_prefix,
+    ) -> None:
+        super().__init__(hook, base_event)
+        self.text = text
+        self.doc = hook.doc
+        self.triggered_command = triggered_command
+        self.triggered_prefix = cmd_prefix
+
+
+class RegexEventView(EventView, RegexEvent):
+    """A `RegexEvent` for a single regex hook, see `EventView`"""
+
+    __slots__ = ("match",)
+
+    own_fields = EventView.own_fields + __slots__
+
+    def __init__(self, hook, base_event: BaseEvent, *, match) -> None:
+        super().__init__(hook, base_event)
+        self.match = match
+
+
 class CapEvent(Event):
     def __init__(self, *args, cap, cap_param=None, **kwargs):
         super().__init__(*args, **kwargs)
@@ -499,7 +674,10 @@ class IrcOutEvent(Event):
     async def prepare(self):
         await super().prepare()
 
-        if "parsed_line" in self.hook.required_args:
+        if (
+            self.parsed_line is None
+            and "parsed_line" in self.hook.required_args
+        ):
             try:
                 self.parsed_line = Message.parse(self.line)
             except Exception:
@@ -511,7 +689,10 @@ class IrcOutEvent(Event):
     def prepare_threaded(self):
         super().prepare_threaded()
 
-        if "parsed_line" in self.hook.required_args:
+        if (
+            self.parsed_line is None
+            and "parsed_line" in self.hook.required_args
+        ):
             try:
                 self.parsed_line = Message.parse(self.line)
             except Exception:
@@ -42,6 +42,10 @@ class _Hook:
         self.function = function
         self.type = _type
         self.kwargs = {}
+        # The function's parameters and the arguments to pass it, filled in
+        # from the plugin manifest so the signature isn't inspected again
+        self.params: list[str] | None = None
+        self.bind_args: list[str] | None = None
 
     def _add_hook(self, kwargs):
         # update kwargs, overwriting duplicates
@@ -0,0 +1,334 @@
+"""
+An immutable index of the registered hooks
+
+The plugin manager publishes a new `HookRegistry` whenever hooks are added or
+removed, rather than changing the current one, so anything holding on to a
+registry, like an event being processed, sees a consistent set of hooks.
+A new registry is built from the previous one by inserting each hook at its
+place in priority order, only the collections the change touches are copied.
+"""
+
+import bisect
+import logging
+from collections.abc import Callable, Iterable, Mapping
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Any
+
+from cloudbot.dispatch import RegexDispatcher
+
+logger = logging.getLogger("cloudbot")
+
+__all__ = ("HookRegistry", "REGISTERED_TYPES", "registered_hooks")
+
+# The hook types which are indexed by the registry
+REGISTERED_TYPES = (
+    "on_cap_available",
+    "on_cap_ack",
+    "command",
+    "irc_raw",
+    "event",
+    "regex",
+    "sieve",
+    "on_connect",
+    "irc_out",
+    "post_hook",
+    "config",
+    "perm_check",
+)
+
+
+def registered_hooks(plugins: Iterable[Any]) -> list[Any]:
+    """The hooks from `plugins` which are indexed by the registry"""
+    return [
+        hook
+        for plugin in plugins
+        for hook_type in REGISTERED_TYPES
+        for hook in plugin.hooks[hook_type]
+    ]
+
+
+_EMPTY: Mapping[Any, Any] = MappingProxyType({})
+
+_priority = attrgetter("priority")
+
+
+def _regex_priority(entry):
+    return entry[1].priority
+
+
+class HookRegistry:
+    """
+    A snapshot of the registered hooks, each collection is sorted by priority
+
+    Collections are tuples, and read-only mappings of keys to tuples, which
+    are never changed once the registry is created. Use `with_hooks`,
+    `without_hooks` and `replace_hooks` to create updated registries.
+    """
+
+    __slots__ = (
+        "version",
+        "commands",
+        "commands_version",
+        "raw_triggers",
+        "catch_all_triggers",
+        "event_type_hooks",
+        "regex_hooks",
+        "regex_dispatcher",
+        "sieves",
+        "cap_hooks",
+        "connect_hooks",
+        "out_sieves",
+        "hook_hooks",
+        "perm_hooks",
+        "config_hooks",
+        "_sieve_chains",
+    )
+
+    def __init__(self) -> None:
+        # Incremented for every change
+        self.version = 0
+        self.commands: Mapping[str, Any] = _EMPTY
+        # Incremented whenever `commands` changes
+        self.commands_version = 0
+        self.raw_triggers: Mapping[str, tuple] = _EMPTY
+        self.catch_all_triggers: tuple = ()
+        self.event_type_hooks: Mapping[Any, tuple] = _EMPTY
+        self.regex_hooks: tuple = ()
+        self.regex_dispatcher = RegexDispatcher(())
+        self.sieves: tuple = ()
+        self.cap_hooks: Mapping[str, Mapping[str, tuple]] = MappingProxyType(
+            {"on_available": _EMPTY, "on_ack": _EMPTY}
+        )
+        self.connect_hooks: tuple = ()
+        self.out_sieves: tuple = ()
+        self.hook_hooks: Mapping[str, tuple] = _EMPTY
+        self.perm_hooks: Mapping[str, tuple] = _EMPTY
+        self.config_hooks: tuple = ()
+        # hook type -> applicable sieves, see `get_sieve_chain`
+        self._sieve_chains: dict[str, tuple] = {}
+
+    def get_sieve_chain(self, hook_type: str) -> tuple:
+        """Get the sieves which apply to hooks of `hook_type`, in priority order"""
+        try:
+            return self._sieve_chains[hook_type]
+        except KeyError:
+            chain = self._sieve_chains[hook_type] = tuple(
+                sieve for sieve in self.sieves if sieve.applies_to(hook_type)
+            )
+            return chain
+
+    def with_hooks(self, hooks: Iterable[Any]) -> "HookRegistry":
+        """Create a registry with `hooks` added to this one's"""
+        builder = _Builder(self)
+        for hook in hooks:
+            builder.add(hook)
+
+        return builder.build()
+
+    def without_hooks(self, hooks: Iterable[Any]) -> "HookRegistry":
+        """Create a registry with `hooks` removed from this one's"""
+        builder = _Builder(self)
+        for hook in hooks:
+            builder.remove(hook)
+
+        return builder.build()
+
+    def replace_hooks(
+        self, old: Iterable[Any], new: Iterable[Any]
+    ) -> "HookRegistry":
+        """Create a registry with `old` swapped for `new` in a single change"""
+        builder = _Builder(self)
+        for hook in old:
+            builder.remove(hook)
+
+        for hook in new:
+            builder.add(hook)
+
+        return builder.build()
+
+
+class _Builder:
+    """Collects changes to a registry, copying each collection once"""
+
+    def __init__(self, base: HookRegistry) -> None:
+        self.base = base
+        self.lists: dict[str, list] = {}
+        # field -> {key: hooks}, with the hooks copied to a list when changed
+        self.indexes: dict[tuple[str, ...], dict[Any, Any]] = {}
+        self.commands: dict[str, Any] | None = None
+
+    def _list(self, field: str) -> list:
+        try:
+            return self.lists[field]
+        except KeyError:
+            items = self.lists[field] = list(getattr(self.base, field))
+            return items
+
+    def _index(self, path: tuple[str, ...]) -> dict[Any, Any]:
+        try:
+            return self.indexes[path]
+        except KeyError:
+            mapping = getattr(self.base, path[0])
+            for part in path[1:]:
+                mapping = mapping[part]
+
+            index = self.indexes[path] = dict(mapping)
+            return index
+
+    def _index_list(self, path: tuple[str, ...], key: Any) -> list:
+        index = self._index(path)
+        items = index.get(key, ())
+        if not isinstance(items, list):
+            items = index[key] = list(items)
+
+        return items
+
+    def _insert(
+        self,
+        items: list,
+        item: Any,
+        key: Callable[[Any], Any] = _priority,
+    ) -> None:
+        # After any items with the same priority, in registration order
+        bisect.insort_right(items, item, key=key)
+
+    def add(self, hook: Any) -> None:
+        hook_type = hook.type
+        if hook_type == "command":
+            self._add_command(hook)
+        elif hook_type == "irc_raw":
+            if hook.is_catch_all():
+                self._insert(self._list("catch_all_triggers"), hook)
+            else:
+                for trigger in hook.triggers:
+                    self._insert(
+                        self._index_list(("raw_triggers",), trigger), hook
+                    )
+        elif hook_type == "event":
+            for event_type in hook.types:
+                self._insert(
+                    self._index_list(("event_type_hooks",), event_type), hook
+                )
+        elif hook_type == "regex":
+            regex_hooks = self._list("regex_hooks")
+            for regex in hook.regexes:
+                self._insert(regex_hooks, (regex, hook), _regex_priority)
+        elif hook_type in ("on_cap_available", "on_cap_ack"):
+            path = ("cap_hooks", _cap_key(hook_type))
+            for cap in hook.caps:
+                self._insert(self._index_list(path, cap.casefold()), hook)
+        elif hook_type == "perm_check":
+            for perm in hook.perms:
+                self._insert(self._index_list(("perm_hooks",), perm), hook)
+        elif hook_type == "post_hook":
+            self._insert(self._index_list(("hook_hooks",), "post"), hook)
+        else:
+            self._insert(self._list(_list_fields[hook_type]), hook)
+
+    def _add_command(self, hook: Any) -> None:
+        if self.commands is None:
+            self.commands = dict(self.base.commands)
+
+        for alias in hook.aliases:
+            if alias in self.commands:
+                logger.warning(
+                    "Plugin %s attempted to register command %s which was "
+                    "already registered by %s. Ignoring new assignment.",
+                    hook.plugin.title,
+                    alias,
+                    self.commands[alias].plugin.title,
+                )
+            else:
+                self.commands[alias] = hook
+
+    def remove(self, hook: Any) -> None:
+        hook_type = hook.type
+        if hook_type == "command":
+            if self.commands is None:
+                self.commands = dict(self.base.commands)
+
+            for alias in hook.aliases:
+                # make sure that there wasn't a conflict, so we don't delete
+                # another plugin's command
+                if self.commands.get(alias) is hook:
+                    del self.commands[alias]
+        elif hook_type == "irc_raw":
+            if hook.is_catch_all():
+                self._list("catch_all_triggers").remove(hook)
+            else:
+                for trigger in hook.triggers:
+                    self._index_list(("raw_triggers",), trigger).remove(hook)
+        elif hook_type == "event":
+            for event_type in hook.types:
+                self._index_list(("event_type_hooks",), event_type).remove(hook)
+        elif hook_type == "regex":
+            regex_hooks = self._list("regex_hooks")
+            for regex in hook.regexes:
+                regex_hooks.remove((regex, hook))
+        elif hook_type in ("on_cap_available", "on_cap_ack"):
+            path = ("cap_hooks", _cap_key(hook_type))
+            for cap in hook.caps:
+                self._index_list(path, cap.casefold()).remove(hook)
+        elif hook_type == "perm_check":
+            for perm in hook.perms:
+                self._index_list(("perm_hooks",), perm).remove(hook)
+        elif hook_type == "post_hook":
+            self._index_list(("hook_hooks",), "post").remove(hook)
+        else:
+            self._list(_list_fields[hook_type]).remove(hook)
+
+    def build(self) -> HookRegistry:
+        base = self.base
+        registry = HookRegistry.__new__(HookRegistry)
+        for field in HookRegistry.__slots__:
+            setattr(registry, field, getattr(base, field))
+
+        registry.version = base.version + 1
+
+        for field, items in self.lists.items():
+            setattr(registry, field, tuple(items))
+
+        cap_hooks = dict(base.cap_hooks)
+        for path, index in self.indexes.items():
+            frozen = MappingProxyType(
+                {
+                    key: tuple(items)
+                    for key, items in index.items()
+                    # drop keys which no longer have any hooks
+                    if items
+                }
+            )
+            if path[0] == "cap_hooks":
+                cap_hooks[path[1]] = frozen
+            else:
+                setattr(registry, path[0], frozen)
+
+        registry.cap_hooks = MappingProxyType(cap_hooks)
+
+        if self.commands is not None and self.commands != base.commands:
+            registry.commands = MappingProxyType(self.commands)
+            registry.commands_version = base.commands_version + 1
+
+        if "regex_hooks" in self.lists:
+            registry.regex_dispatcher = RegexDispatcher(
+                registry.regex_hooks, previous=base.regex_dispatcher
+            )
+
+        if "sieves" in self.lists:
+            registry._sieve_chains = {}
+
+        return registry
+
+
+# Hook types which are kept in a single sorted tuple
+_list_fields = {
+    "sieve": "sieves",
+    "on_connect": "connect_hooks",
+    "irc_out": "out_sieves",
+    "config": "config_hooks",
+}
+
+
+def _cap_key(hook_type: str) -> str:
+    return "on_available" if hook_type == "on_cap_available" else "on_ack"
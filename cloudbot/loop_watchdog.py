@@ -0,0 +1,201 @@
+"""
+Detects code blocking the event loop
+
+A heartbeat scheduled on the loop records when it last ran, while a separate
+thread checks that it keeps running. If the heartbeat falls behind by more
+than the configured threshold, the stack of the loop's thread is captured
+while it is still blocked and reported once the loop recovers.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from cloudbot.util.histogram import LatencyHistogram
+
+logger = logging.getLogger("cloudbot")
+
+# Seconds between heartbeats on the event loop
+DEFAULT_INTERVAL = 0.5
+# Seconds the loop may be blocked for before it is reported
+DEFAULT_THRESHOLD = 1.0
+# Minimum seconds between stall reports to the admin channels
+DEFAULT_REPORT_INTERVAL = 300.0
+
+
+class LoopStall:
+    """A single period where the event loop was blocked"""
+
+    __slots__ = ("detected", "lag", "task", "stack")
+
+    def __init__(self, lag: float, task: asyncio.Task | None, stack) -> None:
+        self.detected = time.time()
+        self.lag = lag
+        self.task = task
+        self.stack: traceback.StackSummary = stack
+
+    @property
+    def location(self) -> str:
+        """The innermost frame of the captured stack, usually the blocking call"""
+        if not self.stack:
+            return "unknown location"
+
+        frame = self.stack[-1]
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+    @property
+    def task_name(self) -> str:
+        if self.task is None:
+            return "no task"
+
+        return self.task.get_name()
+
+    def format(self) -> str:
+        return "Event loop blocked for over {:.2f}s by {} at {}\n{}".format(
+            self.lag,
+            self.task_name,
+            self.location,
+            "".join(self.stack.format()),
+        )
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag and reports the stack of anything blocking it
+    """
+
+    def __init__(
+        self,
+        bot,
+        *,
+        interval: float = DEFAULT_INTERVAL,
+        threshold: float = DEFAULT_THRESHOLD,
+        report_interval: float = DEFAULT_REPORT_INTERVAL,
+    ) -> None:
+        self.bot = bot
+        self.loop: asyncio.AbstractEventLoop = bot.loop
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_interval
+
+        # How late each heartbeat ran
+        self.lag = LatencyHistogram()
+        # Number of stalls detected
+        self.stalls = 0
+        self.last_stall: LoopStall | None = None
+
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._handle: asyncio.TimerHandle | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        # Whether the current stall was already reported
+        self._reported = False
+        # When a stall was last reported to the admin channels
+        self._last_report: float | None = None
+        # Stalls which weren't reported since then
+        self._unreported = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """Start the watchdog, must be called from the event loop's thread"""
+        if self.running:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._last_beat = time.monotonic()
+        self._handle = self.loop.call_later(self.interval, self._beat)
+        self._thread = threading.Thread(
+            target=self._watch, name="LoopWatchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        thread = self._thread
+        if thread is not None:
+            self._stopped.set()
+            thread.join()
+            self._thread = None
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        self.lag.record(max(0.0, now - self._last_beat - self.interval))
+        self._last_beat = now
+        self._reported = False
+        self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def check(self) -> LoopStall | None:
+        """
+        Check whether the loop is currently blocked, capturing the stall if
+        it hasn't been reported yet
+        """
+        lag = time.monotonic() - self._last_beat - self.interval
+        if lag < self.threshold or self._reported:
+            return None
+
+        frame = sys._current_frames().get(self._loop_thread_id or 0)
+        if frame is None:
+            stack = traceback.StackSummary()
+        else:
+            stack = traceback.extract_stack(frame)
+
+        # Not thread safe, but the loop is blocked so the value is stable
+        task = asyncio.current_task(self.loop)
+
+        self._reported = True
+        self.stalls += 1
+        self.last_stall = stall = LoopStall(lag, task, stack)
+        return stall
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.threshold / 2):
+            stall = self.check()
+            if stall is None:
+                continue
+
+            logger.warning("%s", stall.format())
+            try:
+                self.loop.call_soon_threadsafe(self.report, stall)
+            except RuntimeError:
+                # Loop closed
+                return
+
+    def report(self, stall: LoopStall) -> None:
+        """
+        Report a stall to the admin channels, once the loop has recovered
+
+        Stalls are always logged, but only reported once per
+        `report_interval` seconds
+        """
+        now = time.monotonic()
+        if (
+            self._last_report is not None
+            and now - self._last_report < self.report_interval
+        ):
+            self._unreported += 1
+            return
+
+        self._last_report = now
+        message = "Event loop was blocked for over {:.2f}s by {} at {}".format(
+            stall.lag, stall.task_name, stall.location
+        )
+        if self._unreported:
+            message += (
+                f" ({self._unreported} more stalls since the last report)"
+            )
+            self._unreported = 0
+
+        for conn in self.bot.connections.values():
+            if conn.connected:
+                conn.admin_log(message, console=False)
@@ -1,79 +1,49 @@
 import asyncio
 import importlib
 import logging
+import re
 import sys
-import typing
-from collections import defaultdict
-from collections.abc import MutableMapping
+import time
+from collections.abc import Iterable, MutableMapping
 from functools import partial
-from operator import attrgetter
 from pathlib import Path
-from typing import Optional, TypedDict, cast
-from weakref import WeakValueDictionary
+from typing import Any, Optional, cast
+from weakref import WeakKeyDictionary, WeakValueDictionary
 
 import sqlalchemy
 from sqlalchemy import Table
 
-from cloudbot.event import Event, EventType, PostHookEvent
+from cloudbot.dispatch import CommandDispatcher
+from cloudbot.event import Event, PostHookEvent
+from cloudbot.hook_registry import HookRegistry, registered_hooks
 from cloudbot.plugin_hooks import (
-    CapHook,
-    CommandHook,
-    ConfigHook,
-    EventHook,
-    IrcOutHook,
-    OnCapAckHook,
-    OnCapAvaliableHook,
-    OnConnectHook,
-    OnStartHook,
-    OnStopHook,
-    PeriodicHook,
-    PermHook,
-    PostHookHook,
-    RawHook,
-    RegexHook,
+    Hook,
+    HookRun,
     SieveHook,
-    hook_name_to_plugin,
+    describe_event,
+    execute_hook_inline,
+    execute_hook_probed,
+    execute_hook_sync,
+    execute_hook_threaded,
+    find_hooks,
 )
-from cloudbot.util import HOOK_ATTR, LOADED_ATTR, database
-from cloudbot.util.func_utils import call_with_args
+from cloudbot.plugin_loading import (
+    find_plugin_dependencies,
+    log_load_times,
+    needs_main_thread,
+)
+from cloudbot.plugin_manifest import (
+    LazyPlugin,
+    PluginManifest,
+    file_hash_or_none,
+    find_cached_hooks,
+)
+from cloudbot.util import LOADED_ATTR, database
 
 logger = logging.getLogger("cloudbot")
 
-
-class HookDict(TypedDict):
-    command: list[CommandHook]
-    on_connect: list[OnConnectHook]
-    on_start: list[OnStartHook]
-    on_stop: list[OnStopHook]
-    on_cap_available: list[OnCapAvaliableHook]
-    on_cap_ack: list[OnCapAckHook]
-    sieve: list[SieveHook]
-    event: list[EventHook]
-    regex: list[RegexHook]
-    periodic: list[PeriodicHook]
-    irc_raw: list[RawHook]
-    irc_out: list[IrcOutHook]
-    post_hook: list[PostHookHook]
-    config: list[ConfigHook]
-    perm_check: list[PermHook]
-
-
-def find_hooks(parent, module) -> HookDict:
-    hooks = defaultdict(list)
-    for func in module.__dict__.values():
-        if hasattr(func, HOOK_ATTR) and not hasattr(func, "_not_" + HOOK_ATTR):
-            # if it has cloudbot hook
-            func_hooks = getattr(func, HOOK_ATTR)
-
-            for hook_type, func_hook in func_hooks.items():
-                hooks[hook_type].append(
-                    hook_name_to_plugin(hook_type)(parent, func_hook)
-                )
-
-            # delete the hook to free memory
-            delattr(func, HOOK_ATTR)
-
-    return cast(HookDict, hooks)
+# Default number of seconds after which a running hook is logged as slow
+SLOW_HOOK_THRESHOLD = 5.0
 
 
 def find_tables(code):
@@ -92,6 +62,11 @@ def find_tables(code):
     return tables
 
 
+def _registry_view(name: str) -> property:
+    """A read-only attribute for a collection in the current hook registry"""
+    return property(lambda self: getattr(self.registry, name))
+
+
 class PluginManager:
     """
     PluginManager is the core of CloudBot plugin loading.
@@ -113,33 +88,49 @@ class PluginManager:
         """
         self.bot = bot
 
-        self.plugins: dict[str, Plugin] = {}
-        self._plugin_name_map: MutableMapping[str, Plugin] = (
+        self.plugins: dict[str, Plugin | LazyPlugin] = {}
+        self._plugin_name_map: MutableMapping[str, Plugin | LazyPlugin] = (
             WeakValueDictionary()
         )
-        self.commands: dict[str, CommandHook] = {}
-        self.raw_triggers: dict[str, list[RawHook]] = defaultdict(list)
-        self.catch_all_triggers: list[RawHook] = []
-        self.event_type_hooks: dict[EventType, list[EventHook]] = defaultdict(
-            list
+        # The registered hooks, replaced rather than changed whenever hooks
+        # are added or removed
+        self.registry = HookRegistry()
+        self._command_dispatchers: MutableMapping[Any, CommandDispatcher] = (
+            WeakKeyDictionary()
+        )
+        self._manifest: PluginManifest | None = None
+        self.slow_hook_threshold: float = bot.config.get(
+            "slow_hook_threshold", SLOW_HOOK_THRESHOLD
         )
-        self.regex_hooks: list[tuple[typing.Pattern, RegexHook]] = []
-        self.sieves = []
-        self.cap_hooks: dict[str, dict[str, list[CapHook]]] = {
-            "on_available": defaultdict(list),
-            "on_ack": defaultdict(list),
-        }
-        self.connect_hooks = []
-        self.out_sieves = []
-        self.hook_hooks = defaultdict(list)
-        self.perm_hooks = defaultdict(list)
-        self.config_hooks: list[ConfigHook] = []
 
-    def _add_plugin(self, plugin: "Plugin"):
+    commands = _registry_view("commands")
+    commands_version = _registry_view("commands_version")
+    raw_triggers = _registry_view("raw_triggers")
+    catch_all_triggers = _registry_view("catch_all_triggers")
+    event_type_hooks = _registry_view("event_type_hooks")
+    regex_hooks = _registry_view("regex_hooks")
+    regex_dispatcher = _registry_view("regex_dispatcher")
+    sieves = _registry_view("sieves")
+    cap_hooks = _registry_view("cap_hooks")
+    connect_hooks = _registry_view("connect_hooks")
+    out_sieves = _registry_view("out_sieves")
+    hook_hooks = _registry_view("hook_hooks")
+    perm_hooks = _registry_view("perm_hooks")
+    config_hooks = _registry_view("config_hooks")
+
+    def register_hooks(self, hooks: Iterable[Hook]) -> None:
+        """Add hooks to the registry, without a plugin being loaded"""
+        self.registry = self.registry.with_hooks(hooks)
+
+    def unregister_hooks(self, hooks: Iterable[Hook]) -> None:
+        """Remove hooks from the registry"""
+        self.registry = self.registry.without_hooks(hooks)
+
+    def _add_plugin(self, plugin: "Plugin | LazyPlugin"):
         self.plugins[plugin.file_path] = plugin
         self._plugin_name_map[plugin.title] = plugin
 
-    def _rem_plugin(self, plugin: "Plugin"):
+    def _rem_plugin(self, plugin: "Plugin | LazyPlugin"):
         del self.plugins[plugin.file_path]
         del self._plugin_name_map[plugin.title]
 
@@ -151,6 +142,62 @@ class PluginManager:
         """
         return self._plugin_name_map.get(title)
 
+    @property
+    def lazy_loading(self) -> bool:
+        """
+        Whether plugins which only have command, regex, event or raw hooks are
+        imported when one of their hooks is first triggered, instead of on
+        startup. Their hooks are registered from the plugin manifest, which is
+        updated whenever plugins are loaded.
+        """
+        pl = self.bot.config.get("plugin_loading") or {}
+        return bool(pl.get("lazy_loading", False))
+
+    @property
+    def manifest(self) -> PluginManifest:
+        if self._manifest is None:
+            self._manifest = PluginManifest(
+                self.bot.data_path / "plugin_manifest.json"
+            )
+            self._manifest.load()
+
+        return self._manifest
+
+    def _save_manifest(self) -> None:
+        try:
+            self.manifest.save()
+        except OSError:
+            logger.warning("Unable to save plugin manifest", exc_info=True)
+
+    def get_command_dispatcher(
+        self, conn, registry: HookRegistry | None = None
+    ) -> CommandDispatcher:
+        """
+        Get the command dispatcher for a connection, rebuilding it if the
+        connection's nick, its command prefix or the loaded commands changed
+        :param conn: The connection to get the dispatcher for
+        :param registry: The registry snapshot to take the commands from,
+            defaults to the current registry
+        :return: The CommandDispatcher for this connection
+        """
+        if registry is None:
+            registry = self.registry
+
+        command_prefix = conn.config.get("command_prefix", ".")
+        dispatcher = self._command_dispatchers.get(conn)
+        if dispatcher is None or not dispatcher.is_current(
+            conn.nick, command_prefix, registry.commands_version
+        ):
+            dispatcher = CommandDispatcher(
+                registry.commands,
+                conn.nick,
+                command_prefix,
+                registry.commands_version,
+            )
+            self._command_dispatchers[conn] = dispatcher
+
+        return dispatcher
+
     def safe_resolve(self, path_obj: Path) -> Path:
         """Resolve the parts of a path that exist, allowing a non-existant path
         to be resolved to allow resolution of its parents
@@ -170,7 +217,7 @@ class PluginManager:
 
         return path_obj
 
-    def get_plugin(self, path) -> Optional["Plugin"]:
+    def get_plugin(self, path) -> Optional["Plugin | LazyPlugin"]:
         """
         Find a loaded plugin from its filename
 
@@ -215,13 +262,127 @@ class PluginManager:
         Load a plugin from each *.py file in the given directory.
 
         Won't load any plugins listed in "disabled_plugins".
+
+        Plugins are loaded in stages: modules are imported concurrently in
+        worker threads, tables for every plugin are created together, then
+        on_start hooks run concurrently, each plugin waiting for the plugins
+        it imports from. A plugin can be found with `find_plugin` once its
+        on_start hooks have finished, but its hooks are only registered once
+        all plugins have started.
+
+        With `lazy_loading` enabled, plugins with a current manifest entry
+        which allows it aren't imported at all until they are used.
         """
+        start = time.perf_counter()
         plugin_dir = Path(plugin_dir)
+        lazy_loading = self.lazy_loading
         # Load all .py files in the plugins directory and any subdirectory
         # But ignore files starting with _
-        path_list = plugin_dir.rglob("[!_]*.py")
-        # Load plugins asynchronously :O
-        await asyncio.gather(*[self.load_plugin(path) for path in path_list])
+        to_load = []
+        lazy_plugins = []
+        digests: dict[str, str | None] = {}
+        for path in sorted(plugin_dir.rglob("[!_]*.py")):
+            info = self._get_load_info(path)
+            if info is None:
+                continue
+
+            file_path, title = info
+            # make sure to unload the previously loaded plugin from this path, if it was loaded.
+            if self.get_plugin(file_path):
+                await self.unload_plugin(file_path)
+
+            digests[title] = digest = file_hash_or_none(file_path)
+            entry = self._get_manifest_entry(title, digest)
+            if lazy_loading and entry is not None and entry["lazy"]:
+                lazy_plugin = self._get_lazy_plugin(file_path, title, entry)
+                if lazy_plugin is not None:
+                    # Lazy plugins have no on_start hooks to wait for
+                    self._add_plugin(lazy_plugin)
+                    lazy_plugins.append(lazy_plugin)
+                    continue
+
+            to_load.append((file_path, title, entry))
+
+        timings: dict[str, dict[str, float]] = {title: {} for title in digests}
+
+        imported = await asyncio.gather(
+            *[
+                self._import_plugin_threaded(
+                    file_path, title, timings[title], entry
+                )
+                for file_path, title, entry in to_load
+            ]
+        )
+        plugins = [plugin for plugin in imported if plugin is not None]
+
+        tables_start = time.perf_counter()
+        await self._create_all_tables(plugins)
+        tables_time = time.perf_counter() - tables_start
+
+        started = await self._start_plugins(plugins, timings)
+
+        # on_start hooks are dropped once the plugin is registered
+        manifest_changed = False
+        for plugin in started:
+            manifest_changed |= self._update_manifest(
+                plugin, digests[plugin.title]
+            )
+
+        registering: list[Plugin | LazyPlugin] = [*started, *lazy_plugins]
+        for pending in registering:
+            register_start = time.perf_counter()
+            self._register_plugin(pending, finalize=False)
+            timings[pending.title]["register"] = (
+                time.perf_counter() - register_start
+            )
+
+        self._finalize_registration(registering)
+
+        log_load_times(
+            timings, len(registering), tables_time, time.perf_counter() - start
+        )
+
+        if lazy_plugins:
+            logger.info(
+                "Deferred importing %d plugins until they are used",
+                len(lazy_plugins),
+            )
+
+        if manifest_changed or self.manifest.prune(digests):
+            self._save_manifest()
+
+    def _get_manifest_entry(
+        self, title: str, digest: str | None
+    ) -> dict[str, Any] | None:
+        if digest is None:
+            return None
+
+        return self.manifest.get(title, digest)
+
+    def _update_manifest(self, plugin: "Plugin", digest: str | None) -> bool:
+        """
+        Record a plugin's hooks in the manifest, if they weren't loaded from it
+
+        :return: Whether the manifest changed
+        """
+        if digest is None or plugin.from_manifest:
+            return False
+
+        return self.manifest.update(plugin, digest)
+
+    def _get_lazy_plugin(
+        self, file_path: Path, title: str, entry: dict[str, Any]
+    ) -> LazyPlugin | None:
+        """Create a stand-in for a plugin from its manifest entry"""
+        try:
+            return LazyPlugin(str(file_path), file_path.name, title, entry)
+        except (KeyError, TypeError, ValueError, re.error):
+            logger.warning(
+                "Invalid manifest entry for %s, loading it now",
+                title,
+                exc_info=True,
+            )
+            return None
 
     async def unload_all(self):
         await asyncio.gather(
@@ -237,42 +398,122 @@ class PluginManager:
         setattr(plugin_module, LOADED_ATTR, True)
         return plugin_module
 
-    async def load_plugin(self, path):
-        """
-        Loads a plugin from the given path and plugin object,
-        then registers all hooks from that plugin.
-        """
-
+    def _get_load_info(self, path) -> tuple[Path, str] | None:
+        """Find the file path and title of a plugin, if it can be loaded"""
         path = Path(path)
         file_path = self.safe_resolve(path)
-        file_name = file_path.name
         # Resolve the path relative to the current directory
         plugin_path = file_path.relative_to(self.bot.base_dir)
         title = ".".join(plugin_path.parts[1:]).rsplit(".", 1)[0]
 
         if not self.can_load(title):
-            return
-
-        # make sure to unload the previously loaded plugin from this path, if it was loaded.
-        if self.get_plugin(file_path):
-            await self.unload_plugin(file_path)
+            return None
+
+        return file_path, title
+
+    def _import_plugin(
+        self,
+        file_path: Path,
+        title: str,
+        entry: dict[str, Any] | None = None,
+    ) -> "Plugin":
+        plugin_module = self._load_mod(f"plugins.{title}")
+        return Plugin(
+            str(file_path), file_path.name, title, plugin_module, entry
+        )
 
-        module_name = f"plugins.{title}"
+    async def _import_plugin_threaded(
+        self,
+        file_path: Path,
+        title: str,
+        timing: dict[str, float],
+        entry: dict[str, Any] | None = None,
+    ) -> Optional["Plugin"]:
+        start = time.perf_counter()
         try:
-            plugin_module = self._load_mod(module_name)
+            try:
+                plugin: Plugin = await self.bot.loop.run_in_executor(
+                    None, self._import_plugin, file_path, title, entry
+                )
+                return plugin
+            except Exception as e:
+                if not needs_main_thread(e):
+                    raise
+
+                # Try again on the event loop before giving up
+                logger.debug(
+                    "Importing %s from a worker thread failed, retrying",
+                    title,
+                    exc_info=True,
+                )
+                return self._import_plugin(file_path, title, entry)
         except Exception:
             logger.exception("Error loading %s:", title)
-            return
+            return None
+        finally:
+            timing["import"] = time.perf_counter() - start
+
+    async def _create_all_tables(self, plugins: list["Plugin"]) -> None:
+        """Create the tables for all `plugins` in a single call"""
+        tables = []
+        for plugin in plugins:
+            if plugin.tables:
+                logger.info("Registering tables for %s", plugin.title)
+                tables.extend(plugin.tables)
+
+        if tables:
+            await self.bot.loop.run_in_executor(
+                None,
+                partial(
+                    database.metadata.create_all,
+                    self.bot.db_engine,
+                    tables=tables,
+                    checkfirst=True,
+                ),
+            )
 
-        # create the plugin
-        plugin = Plugin(str(file_path), file_name, title, plugin_module)
+    async def _start_plugins(
+        self, plugins: list["Plugin"], timings: dict[str, dict[str, float]]
+    ) -> list["Plugin"]:
+        """
+        Run the on_start hooks for `plugins` concurrently, a plugin's hooks
+        only start once the hooks of the plugins it imports from have finished
+
+        :return: The plugins whose on_start hooks succeeded, in their
+            original order
+        """
+        dependencies = find_plugin_dependencies(plugins)
+        done = {
+            plugin.title: self.bot.loop.create_future() for plugin in plugins
+        }
 
-        # proceed to register hooks
+        async def _start(plugin):
+            waiting = [done[title] for title in dependencies[plugin.title]]
+            if waiting:
+                await asyncio.wait(waiting)
 
-        # create database tables
-        await plugin.create_tables(self.bot)
+            start = time.perf_counter()
+            try:
+                ok = await self._start_plugin(plugin)
+                if ok:
+                    # Let plugins which start later find this one, its
+                    # hooks are registered once every plugin has started
+                    self._add_plugin(plugin)
+
+                return ok
+            finally:
+                timings[plugin.title]["on_start"] = time.perf_counter() - start
+                done[plugin.title].set_result(None)
 
-        # run on_start hooks
+        results = await asyncio.gather(*[_start(plugin) for plugin in plugins])
+        return [plugin for plugin, ok in zip(plugins, results) if ok]
+
+    async def _start_plugin(self, plugin: "Plugin") -> bool:
+        """
+        Run a plugin's on_start hooks, unregistering its tables if one fails
+
+        :return: True if all of the hooks succeeded
+        """
         for on_start_hook in plugin.hooks["on_start"]:
             success = await self.launch(
                 on_start_hook, Event(bot=self.bot, hook=on_start_hook)
@@ -285,124 +526,93 @@ class PluginManager:
 
                 # unregister databases
                 plugin.unregister_tables(self.bot)
-                return
+                return False
 
+        return True
+
+    async def load_plugin(self, path):
+        """
+        Loads a plugin from the given path and plugin object,
+        then registers all hooks from that plugin.
+        """
+        info = self._get_load_info(path)
+        if info is None:
+            return
+
+        file_path, title = info
+
+        # make sure to unload the previously loaded plugin from this path, if it was loaded.
+        if self.get_plugin(file_path):
+            await self.unload_plugin(file_path)
+
+        prepared = await self._prepare_plugin(file_path, title)
+        if prepared is None:
+            return
+
+        plugin, digest = prepared
+        # on_start hooks are dropped once the plugin is registered
+        changed = self._update_manifest(plugin, digest)
+
+        self._register_plugin(plugin)
+
+        if changed:
+            self._save_manifest()
+
+    async def _prepare_plugin(
+        self, file_path: Path, title: str
+    ) -> tuple["Plugin", str | None] | None:
+        """
+        Import a plugin in a worker thread, create its tables and run its
+        on_start hooks, returning it and the digest of its source
+        """
+        digest = file_hash_or_none(file_path)
+        plugin = await self._import_plugin_threaded(
+            file_path, title, {}, self._get_manifest_entry(title, digest)
+        )
+        if plugin is None:
+            return None
+
+        await plugin.create_tables(self.bot)
+
+        if not await self._start_plugin(plugin):
+            return None
+
+        return plugin, digest
+
+    def _register_plugin(
+        self, plugin: "Plugin | LazyPlugin", *, finalize=True
+    ) -> None:
+        """Register all of a plugin's hooks
+
+        :param finalize: Whether to publish the hooks to the registry, when
+            registering many plugins `_finalize_registration` can be called
+            once all of them are registered instead
+        """
         self._add_plugin(plugin)
 
-        for on_cap_available_hook in plugin.hooks["on_cap_available"]:
-            for cap in on_cap_available_hook.caps:
-                self.cap_hooks["on_available"][cap.casefold()].append(
-                    on_cap_available_hook
-                )
-            self._log_hook(on_cap_available_hook)
+        if finalize:
+            self._finalize_registration([plugin])
 
-        for on_cap_ack_hook in plugin.hooks["on_cap_ack"]:
-            for cap in on_cap_ack_hook.caps:
-                self.cap_hooks["on_ack"][cap.casefold()].append(on_cap_ack_hook)
-            self._log_hook(on_cap_ack_hook)
+        for hook in registered_hooks([plugin]):
+            self._log_hook(hook)
 
         for periodic_hook in plugin.hooks["periodic"]:
             task = asyncio.ensure_future(self._start_periodic(periodic_hook))
             plugin.tasks.append(task)
             self._log_hook(periodic_hook)
 
-        # register commands
-        for command_hook in plugin.hooks["command"]:
-            for alias in command_hook.aliases:
-                if alias in self.commands:
-                    logger.warning(
-                        "Plugin %s attempted to register command %s which was "
-                        "already registered by %s. Ignoring new assignment.",
-                        plugin.title,
-                        alias,
-                        self.commands[alias].plugin.title,
-                    )
-                else:
-                    self.commands[alias] = command_hook
-            self._log_hook(command_hook)
-
-        # register raw hooks
-        for raw_hook in plugin.hooks["irc_raw"]:
-            if raw_hook.is_catch_all():
-                self.catch_all_triggers.append(raw_hook)
-            else:
-                for trigger in raw_hook.triggers:
-                    if trigger in self.raw_triggers:
-                        self.raw_triggers[trigger].append(raw_hook)
-                    else:
-                        self.raw_triggers[trigger] = [raw_hook]
-            self._log_hook(raw_hook)
-
-        # register events
-        for event_hook in plugin.hooks["event"]:
-            for event_type in event_hook.types:
-                if event_type in self.event_type_hooks:
-                    self.event_type_hooks[event_type].append(event_hook)
-                else:
-                    self.event_type_hooks[event_type] = [event_hook]
-            self._log_hook(event_hook)
-
-        # register regexps
-        for regex_hook in plugin.hooks["regex"]:
-            for regex_match in regex_hook.regexes:
-                self.regex_hooks.append((regex_match, regex_hook))
-            self._log_hook(regex_hook)
-
-        # register sieves
-        for sieve_hook in plugin.hooks["sieve"]:
-            self.sieves.append(sieve_hook)
-            self._log_hook(sieve_hook)
-
-        # register connect hooks
-        for connect_hook in plugin.hooks["on_connect"]:
-            self.connect_hooks.append(connect_hook)
-            self._log_hook(connect_hook)
-
-        for out_hook in plugin.hooks["irc_out"]:
-            self.out_sieves.append(out_hook)
-            self._log_hook(out_hook)
-
-        for post_hook in plugin.hooks["post_hook"]:
-            self.hook_hooks["post"].append(post_hook)
-            self._log_hook(post_hook)
-
-        for config_hook in plugin.hooks["config"]:
-            self.config_hooks.append(config_hook)
-            self._log_hook(config_hook)
-
-        for perm_hook in plugin.hooks["perm_check"]:
-            for perm in perm_hook.perms:
-                self.perm_hooks[perm].append(perm_hook)
-
-            self._log_hook(perm_hook)
-
-        # Sort hooks
-        self._sort_hooks()
-
         # we don't need this anymore
         plugin.hooks["on_start"].clear()
 
-    def _sort_hooks(self) -> None:
-        def _sort_list(hooks):
-            hooks.sort(key=attrgetter("priority"))
-
-        def _sort_dict(hooks):
-            for items in hooks.values():
-                _sort_list(items)
+    def _finalize_registration(
+        self, plugins: list["Plugin | LazyPlugin"]
+    ) -> None:
+        # Publish all of the plugins' hooks in a single new registry
+        self.register_hooks(registered_hooks(plugins))
 
-        _sort_dict(self.raw_triggers)
-        _sort_list(self.catch_all_triggers)
-        _sort_dict(self.event_type_hooks)
-        self.regex_hooks.sort(key=lambda x: x[1].priority)
-        _sort_list(self.sieves)
-        for d in self.cap_hooks.values():
-            _sort_dict(d)
-
-        _sort_list(self.connect_hooks)
-        _sort_list(self.out_sieves)
-        _sort_dict(self.hook_hooks)
-        _sort_dict(self.perm_hooks)
-        _sort_list(self.config_hooks)
+    def get_sieve_chain(self, hook_type: str) -> tuple[SieveHook, ...]:
+        """Get the sieves which apply to hooks of `hook_type`, in priority order"""
+        return self.registry.get_sieve_chain(hook_type)
 
     async def unload_plugin(self, path):
         """
@@ -418,80 +628,7 @@ class PluginManager:
         if not plugin:
             return False
 
-        for on_cap_available_hook in plugin.hooks["on_cap_available"]:
-            available_hooks = self.cap_hooks["on_available"]
-            for cap in on_cap_available_hook.caps:
-                cap_cf = cap.casefold()
-                available_hooks[cap_cf].remove(on_cap_available_hook)
-                if not available_hooks[cap_cf]:
-                    del available_hooks[cap_cf]
-
-        for on_cap_ack in plugin.hooks["on_cap_ack"]:
-            ack_hooks = self.cap_hooks["on_ack"]
-            for cap in on_cap_ack.caps:
-                cap_cf = cap.casefold()
-                ack_hooks[cap_cf].remove(on_cap_ack)
-                if not ack_hooks[cap_cf]:
-                    del ack_hooks[cap_cf]
-
-        # unregister commands
-        for command_hook in plugin.hooks["command"]:
-            for alias in command_hook.aliases:
-                if (
-                    alias in self.commands
-                    and self.commands[alias] == command_hook
-                ):
-                    # we need to make sure that there wasn't a conflict, so we don't delete another plugin's command
-                    del self.commands[alias]
-
-        # unregister raw hooks
-        for raw_hook in plugin.hooks["irc_raw"]:
-            if raw_hook.is_catch_all():
-                self.catch_all_triggers.remove(raw_hook)
-            else:
-                for trigger in raw_hook.triggers:
-                    # this can't be not true
-                    assert trigger in self.raw_triggers
-                    self.raw_triggers[trigger].remove(raw_hook)
-                    # if that was the last hook for this trigger
-                    if not self.raw_triggers[trigger]:
-                        del self.raw_triggers[trigger]
-
-        # unregister events
-        for event_hook in plugin.hooks["event"]:
-            for event_type in event_hook.types:
-                # this can't be not true
-                assert event_type in self.event_type_hooks
-                self.event_type_hooks[event_type].remove(event_hook)
-                # if that was the last hook for this event type
-                if not self.event_type_hooks[event_type]:
-                    del self.event_type_hooks[event_type]
-
-        # unregister regexps
-        for regex_hook in plugin.hooks["regex"]:
-            for regex_match in regex_hook.regexes:
-                self.regex_hooks.remove((regex_match, regex_hook))
-
-        # unregister sieves
-        for sieve_hook in plugin.hooks["sieve"]:
-            self.sieves.remove(sieve_hook)
-
-        # unregister connect hooks
-        for connect_hook in plugin.hooks["on_connect"]:
-            self.connect_hooks.remove(connect_hook)
-
-        for out_hook in plugin.hooks["irc_out"]:
-            self.out_sieves.remove(out_hook)
-
-        for post_hook in plugin.hooks["post_hook"]:
-            self.hook_hooks["post"].remove(post_hook)
-
-        for config_hook in plugin.hooks["config"]:
-            self.config_hooks.remove(config_hook)
-
-        for perm_hook in plugin.hooks["perm_check"]:
-            for perm in perm_hook.perms:
-                self.perm_hooks[perm].remove(perm_hook)
+        self.unregister_hooks(registered_hooks([plugin]))
 
         # Run on_stop hooks
         for on_stop_hook in plugin.hooks["on_stop"]:
@@ -525,24 +662,6 @@ class PluginManager:
             logger.info("Loaded %s", hook)
             logger.debug("Loaded %r", hook)
 
-    def _execute_hook_threaded(self, hook, event):
-        """ """
-        event.prepare_threaded()
-
-        try:
-            return call_with_args(hook.function, event)
-        finally:
-            event.close_threaded()
-
-    async def _execute_hook_sync(self, hook, event):
-        """ """
-        await event.prepare()
-
-        try:
-            return await call_with_args(hook.function, event)
-        finally:
-            await event.close()
-
     async def internal_launch(self, hook, event):
         """
         Launches a hook with the data from [event]
@@ -551,15 +670,35 @@ class PluginManager:
         :return: a tuple of (ok, result) where ok is a boolean that determines if the hook ran without error and result
             is the result from the hook
         """
-        if hook.threaded:
+        run = HookRun(hook, event)
+        if hook.inline:
+            coro = execute_hook_inline(hook, event)
+        elif hook.threaded:
+            if hook.auto_inline and self.bot.config.get(
+                "auto_inline_hooks", False
+            ):
+                func = execute_hook_probed
+            else:
+                func = execute_hook_threaded
+
             coro = self.bot.loop.run_in_executor(
-                None, self._execute_hook_threaded, hook, event
+                None, run.run_threaded, func, hook, event
             )
         else:
-            coro = self._execute_hook_sync(hook, event)
+            coro = execute_hook_sync(hook, event)
 
-        task = asyncio.ensure_future(coro)
+        task = run.task = asyncio.ensure_future(coro)
         hook.plugin.tasks.append(task)
+
+        threshold = self.slow_hook_threshold
+        slow_handle = None
+        # Inline hooks block the loop, so the timer couldn't fire while they
+        # run, _finish_run reports them instead
+        if threshold and not hook.inline:
+            slow_handle = self.bot.loop.call_later(
+                threshold, self._report_slow_hook, run, threshold
+            )
+
         try:
             out = await task
             ok = True
@@ -570,8 +709,39 @@ class PluginManager:
 
         hook.plugin.tasks.remove(task)
 
+        if slow_handle is not None:
+            slow_handle.cancel()
+
+        self._finish_run(run, threshold)
+
         return ok, out
 
+    def _report_slow_hook(self, run, threshold):
+        """Log a hook which is still running after `threshold` seconds"""
+        if run.task is None or run.task.done():
+            return
+
+        run.reported = True
+        logger.warning(
+            "Hook %s has been running for over %.1fs, event: %s\n%s",
+            run.hook.description,
+            threshold,
+            describe_event(run.event),
+            run.format_stack(),
+        )
+
+    def _finish_run(self, run, threshold):
+        elapsed = run.finish()
+        if threshold and elapsed > threshold and not run.reported:
+            # The hook blocked the event loop, so it couldn't be caught
+            # while it was running
+            logger.warning(
+                "Hook %s took %.1fs, event: %s",
+                run.hook.description,
+                elapsed,
+                describe_event(run.event),
+            )
+
     async def _execute_hook(self, hook, event):
         """
         Runs the specific hook with the given bot and event.
@@ -594,7 +764,7 @@ class PluginManager:
             result=result,
             error=error,
         )
-        for post_hook in self.hook_hooks["post"]:
+        for post_hook in self.hook_hooks.get("post", ()):
             success, res = await self.internal_launch(
                 post_hook, post_event(hook=post_hook)
             )
@@ -605,27 +775,50 @@ class PluginManager:
 
     async def _sieve(self, sieve, event, hook):
         """ """
-        if sieve.threaded:
-            coro = self.bot.loop.run_in_executor(
-                None, sieve.function, self.bot, event, hook
-            )
+        run = HookRun(sieve, event)
+        result, error = None, None
+        if sieve.inline:
+            try:
+                result = sieve.function(self.bot, event, hook)
+            except Exception:
+                logger.exception(
+                    "Error running sieve %s on %s:",
+                    sieve.description,
+                    hook.description,
+                )
+                error = sys.exc_info()
         else:
-            coro = sieve.function(self.bot, event, hook)
+            if sieve.threaded:
+                coro = self.bot.loop.run_in_executor(
+                    None,
+                    run.run_threaded,
+                    sieve.function,
+                    self.bot,
+                    event,
+                    hook,
+                )
+            else:
+                coro = sieve.function(self.bot, event, hook)
+
+            task = run.task = asyncio.ensure_future(coro)
+            sieve.plugin.tasks.append(task)
+            try:
+                result = await task
+            except Exception:
+                logger.exception(
+                    "Error running sieve %s on %s:",
+                    sieve.description,
+                    hook.description,
+                )
+                error = sys.exc_info()
 
-        result, error = None, None
-        task = asyncio.ensure_future(coro)
-        sieve.plugin.tasks.append(task)
-        try:
-            result = await task
-        except Exception:
-            logger.exception(
-                "Error running sieve %s on %s:",
-                sieve.description,
-                hook.description,
-            )
-            error = sys.exc_info()
+            sieve.plugin.tasks.remove(task)
 
-        sieve.plugin.tasks.remove(task)
+        sieve.runs += 1
+        sieve.total_time += run.finish()
+
+        if error is None and not sieve.report:
+            return result
 
         post_event = partial(
             PostHookEvent,
@@ -636,7 +829,7 @@ class PluginManager:
             result=result,
             error=error,
         )
-        for post_hook in self.hook_hooks["post"]:
+        for post_hook in self.hook_hooks.get("post", ()):
             success, res = await self.internal_launch(
                 post_hook, post_event(hook=post_hook)
             )
@@ -662,13 +855,68 @@ class PluginManager:
             "on_stop",
             "periodic",
         ):
-            for sieve in self.bot.plugin_manager.sieves:
+            for sieve in self.get_sieve_chain(hook.type):
                 event = await self._sieve(sieve, event, hook)
                 if event is None:
                     return False
 
         return await self._execute_hook(hook, event)
 
+    async def _load_lazy_plugin(self, stand_in: LazyPlugin) -> None:
+        """
+        Start the plugin a stand-in was created for, then swap the stand-in's
+        hooks for its hooks in a single registry update
+        """
+        logger.info("Loading plugin %s on first use", stand_in.title)
+        file_path = Path(stand_in.file_path)
+        prepared = await self._prepare_plugin(file_path, stand_in.title)
+        if prepared is None:
+            return
+
+        plugin, digest = prepared
+        if self.get_plugin(file_path) is not stand_in:
+            # The stand-in was unloaded or replaced while loading
+            plugin.unregister_tables(self.bot)
+            return
+
+        changed = self._update_manifest(plugin, digest)
+
+        self.registry = self.registry.replace_hooks(
+            registered_hooks([stand_in]), registered_hooks([plugin])
+        )
+        self._register_plugin(plugin, finalize=False)
+
+        if changed:
+            self._save_manifest()
+
+    async def _resolve_lazy_hook(self, hook):
+        """
+        Load the plugin a stand-in hook belongs to, if it isn't already being
+        loaded, and find the real hook
+
+        :return: The real hook, or None if it couldn't be loaded
+        """
+        plugin = hook.plugin
+        if plugin.loading is None:
+            plugin.loading = asyncio.ensure_future(
+                self._load_lazy_plugin(plugin)
+            )
+
+        await asyncio.shield(plugin.loading)
+
+        loaded = self.get_plugin(plugin.file_path)
+        if loaded is None or isinstance(loaded, LazyPlugin):
+            return None
+
+        for real_hook in cast(dict[str, list], loaded.hooks)[hook.type]:
+            if real_hook.function_name == hook.function_name:
+                return real_hook
+
+        logger.warning(
+            "Hook %s not found after loading %s", hook.description, loaded.title
+        )
+        return None
+
     async def launch(self, hook, event):
         """
         Dispatch a given event to a given hook using a given bot object.
@@ -676,6 +924,13 @@ class PluginManager:
         Returns False if the hook didn't run successfully, and True if it ran successfully.
         """
 
+        if isinstance(hook.plugin, LazyPlugin):
+            hook = await self._resolve_lazy_hook(hook)
+            if hook is None:
+                return False
+
+            event.hook = hook
+
         if hook.lock:
             async with hook.lock:
                 return await self._launch(hook, event)
@@ -692,13 +947,28 @@ class Plugin:
     Each Plugin represents a plugin file, and contains loaded hooks.
     """
 
-    def __init__(self, filepath, filename, title, code):
-        """ """
+    # Whether this is a stand-in for a plugin which hasn't been imported yet
+    lazy = False
+
+    def __init__(self, filepath, filename, title, code, manifest_entry=None):
+        """
+        :param manifest_entry: The plugin's entry in the plugin manifest, if
+            it is current
+        """
         self.tasks = []
         self.file_path = filepath
         self.file_name = filename
         self.title = title
-        self.hooks = find_hooks(self, code)
+        hooks = None
+        if manifest_entry is not None:
+            hooks = find_cached_hooks(self, code, manifest_entry)
+
+        # Whether the hooks were found using the manifest
+        self.from_manifest = hooks is not None
+        if hooks is None:
+            hooks = find_hooks(self, code)
+
+        self.hooks = hooks
         # we need to find tables for each plugin so that they can be unloaded from the global metadata when the
         # plugin is reloaded
         self.tables = find_tables(code)
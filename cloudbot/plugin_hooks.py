@@ -1,11 +1,28 @@
 import asyncio
 import inspect
 import logging
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from typing import TypedDict, cast
 
 from cloudbot.hook import Action, Priority
+from cloudbot.util import HOOK_ATTR
+from cloudbot.util.func_utils import ArgBinder
+from cloudbot.util.histogram import LatencyHistogram
 
 logger = logging.getLogger("cloudbot")
 
+# With "auto_inline_hooks" enabled, synchronous hooks which never take longer
+# than INLINE_MAX_TIME seconds over their first INLINE_PROBE_RUNS runs are
+# moved to the event loop
+INLINE_PROBE_RUNS = 20
+INLINE_MAX_TIME = 0.001
+# Automatically inlined hooks which take longer than this are moved back
+INLINE_DEMOTE_TIME = 0.005
+
 
 class Hook:
     """
@@ -13,6 +30,10 @@ class Hook:
     rather extended.
     """
 
+    # Whether synchronous hooks of this type run on the event loop by default,
+    # None lets the plugin manager decide based on measured run times
+    default_inline: bool | None = None
+
     def __init__(self, _type, plugin, func_hook):
         """ """
         self.type = _type
@@ -20,12 +41,14 @@ class Hook:
         self.function = func_hook.function
         self.function_name = self.function.__name__
 
-        sig = inspect.signature(self.function)
+        params = func_hook.params
+        if params is None:
+            params = list(inspect.signature(self.function).parameters)
 
         # don't process args starting with "_"
-        self.required_args = [
-            arg for arg in sig.parameters.keys() if not arg.startswith("_")
-        ]
+        self.required_args = [arg for arg in params if not arg.startswith("_")]
+        # precompute how to pull the arguments off an event
+        self.arg_binder = ArgBinder(self.function, func_hook.bind_args)
 
         if asyncio.iscoroutine(self.function) or asyncio.iscoroutinefunction(
             self.function
@@ -42,6 +65,29 @@ class Hook:
         )
         self.do_sieve = func_hook.kwargs.pop("do_sieve", True)
 
+        inline = func_hook.kwargs.pop("inline", self.default_inline)
+        # Only synchronous hooks which don't use the database are candidates
+        # for being moved to the event loop automatically
+        self.auto_inline = (
+            inline is None and self.threaded and "db" not in self.required_args
+        )
+        self.inline = bool(inline) and self.threaded
+        # Run time samples collected while deciding on `auto_inline`
+        self.inline_probes = 0
+        self.inline_probe_max = 0.0
+
+        # Database sessions prepared for this hook, and how many of those
+        # the hook actually used
+        self.db_sessions_requested = 0
+        self.db_sessions_used = 0
+
+        # Time from launching the hook to it finishing
+        self.wall_time = LatencyHistogram()
+        # Time from the triggering event being received to the hook starting
+        self.queue_wait = LatencyHistogram()
+        # Time threaded hooks spent waiting for a worker thread
+        self.executor_wait = LatencyHistogram()
+
         lock = func_hook.kwargs.pop("lock", None)
 
         if self.single_thread and not lock:
@@ -64,6 +110,9 @@ class Hook:
                 self.description,
             )
 
+    def count_db_session_used(self):
+        self.db_sessions_used += 1
+
     @property
     def description(self):
         return f"{self.plugin.title}:{self.function_name}"
@@ -174,10 +223,38 @@ class RawHook(Hook):
 
 
 class SieveHook(Hook):
+    default_inline = True
+
     def __init__(self, plugin, sieve_hook):
         """ """
+        hook_types = sieve_hook.kwargs.pop("hook_types", None)
+        report = sieve_hook.kwargs.pop("report", True)
+
         super().__init__("sieve", plugin, sieve_hook)
 
+        if isinstance(hook_types, str):
+            hook_types = [hook_types]
+
+        # The hook types this sieve applies to, or None for all types
+        self.hook_types = None if hook_types is None else set(hook_types)
+
+        # Whether to run post hooks for this sieve when it succeeds,
+        # post hooks are always run for errors
+        self.report = report
+
+        self.runs = 0
+        self.total_time = 0.0
+
+    def applies_to(self, hook_type):
+        return self.hook_types is None or hook_type in self.hook_types
+
+    @property
+    def avg_time(self):
+        if not self.runs:
+            return 0.0
+
+        return self.total_time / self.runs
+
     def __repr__(self):
         return f"Sieve[{Hook.__repr__(self)}]"
 
@@ -345,3 +422,180 @@ _hook_name_to_plugin = {
 }
 
 hook_name_to_plugin = _hook_name_to_plugin.__getitem__
+
+
+def describe_event(event) -> str:
+    conn = event.conn
+    return "[{}] {}: {!r}".format(
+        conn.name if conn else None, event.type, event.irc_raw
+    )
+
+
+class HookRun:
+    """Timing information for a single run of a hook or sieve"""
+
+    __slots__ = (
+        "hook",
+        "event",
+        "launched",
+        "started",
+        "thread_id",
+        "task",
+        "reported",
+    )
+
+    def __init__(self, hook, event) -> None:
+        self.hook = hook
+        self.event = event
+        self.launched = time.perf_counter()
+        # Threaded hooks set these once they start in a worker thread
+        self.started: float | None = None
+        self.thread_id: int | None = None
+        self.task: asyncio.Future | None = None
+        # Whether the run has already been logged as slow
+        self.reported = False
+
+    def run_threaded(self, func, *args):
+        """Run `func` in a worker thread, recording when it started"""
+        self.started = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        return func(*args)
+
+    def format_stack(self) -> str:
+        """Format the current stack of the running hook, if it can be found"""
+        if self.thread_id is not None:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return ""
+
+            return "".join(traceback.format_stack(frame))
+
+        get_coro = getattr(self.task, "get_coro", None)
+        if get_coro is None:
+            return ""
+
+        # Follow the chain of awaited coroutines down from the task
+        frames = []
+        coro = get_coro()
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None)
+            if frame is None:
+                break
+
+            frames.append((frame, frame.f_lineno))
+            coro = getattr(coro, "cr_await", None)
+
+        return "".join(traceback.StackSummary.extract(frames).format())
+
+    def finish(self) -> float:
+        """Record this run in the hook's histograms, returning its wall time"""
+        hook = self.hook
+        end = time.perf_counter()
+        elapsed = end - self.launched
+        hook.wall_time.record(elapsed)
+
+        started = self.started
+        if started is None:
+            started = self.launched
+        else:
+            hook.executor_wait.record(started - self.launched)
+
+        received = getattr(self.event, "received", None)
+        if received is not None:
+            hook.queue_wait.record(started - received)
+
+        return elapsed
+
+
+class HookDict(TypedDict):
+    command: list[CommandHook]
+    on_connect: list[OnConnectHook]
+    on_start: list[OnStartHook]
+    on_stop: list[OnStopHook]
+    on_cap_available: list[OnCapAvaliableHook]
+    on_cap_ack: list[OnCapAckHook]
+    sieve: list[SieveHook]
+    event: list[EventHook]
+    regex: list[RegexHook]
+    periodic: list[PeriodicHook]
+    irc_raw: list[RawHook]
+    irc_out: list[IrcOutHook]
+    post_hook: list[PostHookHook]
+    config: list[ConfigHook]
+    perm_check: list[PermHook]
+
+
+def find_hooks(parent, module) -> HookDict:
+    hooks = defaultdict(list)
+    for func in module.__dict__.values():
+        if hasattr(func, HOOK_ATTR) and not hasattr(func, "_not_" + HOOK_ATTR):
+            # if it has cloudbot hook
+            func_hooks = getattr(func, HOOK_ATTR)
+
+            for hook_type, func_hook in func_hooks.items():
+                hooks[hook_type].append(
+                    hook_name_to_plugin(hook_type)(parent, func_hook)
+                )
+
+            # delete the hook to free memory
+            delattr(func, HOOK_ATTR)
+
+    return cast(HookDict, hooks)
+
+
+def execute_hook_threaded(hook, event):
+    """Run a synchronous hook in the current thread"""
+    event.prepare_threaded()
+
+    try:
+        return hook.arg_binder.call(event)
+    finally:
+        event.close_threaded()
+
+
+async def execute_hook_sync(hook, event):
+    """Run a coroutine hook"""
+    await event.prepare()
+
+    try:
+        return await hook.arg_binder.call(event)
+    finally:
+        await event.close()
+
+
+async def execute_hook_inline(hook, event):
+    """Run a synchronous hook directly on the event loop"""
+    start = time.perf_counter()
+    try:
+        return execute_hook_threaded(hook, event)
+    finally:
+        if hook.auto_inline:
+            duration = time.perf_counter() - start
+            if duration > INLINE_DEMOTE_TIME:
+                hook.inline = hook.auto_inline = False
+                logger.warning(
+                    "Hook %s took %.1fms on the event loop, "
+                    "moving it back to the thread pool",
+                    hook.description,
+                    duration * 1000,
+                )
+
+
+def execute_hook_probed(hook, event):
+    """
+    Run a synchronous hook in a worker thread, timing it to decide whether
+    it can run inline instead
+    """
+    start = time.perf_counter()
+    try:
+        return execute_hook_threaded(hook, event)
+    finally:
+        duration = time.perf_counter() - start
+        hook.inline_probes += 1
+        hook.inline_probe_max = max(hook.inline_probe_max, duration)
+        if hook.inline_probes >= INLINE_PROBE_RUNS:
+            if hook.inline_probe_max <= INLINE_MAX_TIME:
+                logger.debug("Running hook %s inline", hook.description)
+                hook.inline = True
+            else:
+                hook.auto_inline = False
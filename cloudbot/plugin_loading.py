@@ -0,0 +1,105 @@
+"""
+Helpers for loading all plugins at once
+"""
+
+import logging
+from types import ModuleType
+
+from cloudbot.util.formatting import gen_markdown_table
+
+logger = logging.getLogger("cloudbot")
+
+
+def needs_main_thread(exc: Exception) -> bool:
+    """
+    Whether an import failed only because it was run in a worker thread
+
+    Importing plugins which import each other from different threads can
+    deadlock (importlib raises a RuntimeError subclass), asyncio raises
+    RuntimeError when there is no event loop in the thread, and signal
+    handlers can only be installed from the main thread.
+    """
+    if isinstance(exc, RuntimeError):
+        return True
+
+    return isinstance(exc, ValueError) and "main thread" in str(exc)
+
+
+def find_plugin_dependencies(plugins) -> dict[str, set[str]]:
+    """
+    Find which of `plugins` each plugin imports from, ignoring imports which
+    would form a cycle
+
+    :return: A dict mapping each plugin title to the titles it depends on
+    """
+    by_module = {"plugins." + plugin.title: plugin.title for plugin in plugins}
+    dependencies: dict[str, set[str]] = {}
+    for plugin in plugins:
+        deps = set()
+        for obj in vars(plugin.code).values():
+            if isinstance(obj, ModuleType):
+                name = obj.__name__
+            else:
+                name = getattr(obj, "__module__", None)
+
+            title = by_module.get(name) if isinstance(name, str) else None
+            if title is not None and title != plugin.title:
+                deps.add(title)
+
+        dependencies[plugin.title] = deps
+
+    # Drop the edges which close a cycle, so no plugin waits on itself
+    visited: set[str] = set()
+    stack: list[str] = []
+
+    def _visit(title):
+        visited.add(title)
+        stack.append(title)
+        for dep in sorted(dependencies[title]):
+            if dep in stack:
+                logger.warning(
+                    "Ignoring circular plugin dependency %s -> %s", title, dep
+                )
+                dependencies[title].discard(dep)
+            elif dep not in visited:
+                _visit(dep)
+
+        stack.pop()
+
+    for title in dependencies:
+        if title not in visited:
+            _visit(title)
+
+    return dependencies
+
+
+def log_load_times(timings, loaded, tables_time, total_time) -> None:
+    """Log how long each stage of loading took for every plugin"""
+    stages = ("import", "on_start", "register")
+    rows = sorted(
+        timings.items(),
+        key=lambda item: sum(item[1].values()),
+        reverse=True,
+    )
+    table = gen_markdown_table(
+        ("Plugin", *(f"{stage} (ms)" for stage in stages), "Total (ms)"),
+        [
+            (
+                title,
+                *(
+                    "{:.1f}".format(times.get(stage, 0) * 1000)
+                    for stage in stages
+                ),
+                "{:.1f}".format(sum(times.values()) * 1000),
+            )
+            for title, times in rows
+        ],
+    )
+    logger.info(
+        "Loaded %d of %d plugins in %.2fs (creating tables took %.2fs)\n%s",
+        loaded,
+        len(timings),
+        total_time,
+        tables_time,
+        table,
+    )
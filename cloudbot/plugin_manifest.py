@@ -0,0 +1,351 @@
+"""
+A persisted description of the hooks in each plugin
+
+The manifest is written after plugins are loaded, and is keyed by a hash of
+each plugin's source, so an entry is only used while the file is unchanged.
+Unchanged plugins are registered from their entry, without searching the
+module for hooks or inspecting the hook functions' signatures again. It also
+allows registering stand-in hooks for a plugin without importing it, see
+`PluginManager.lazy_loading`.
+"""
+
+import asyncio
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, cast
+
+from sqlalchemy import Table
+
+from cloudbot.event import EventType
+from cloudbot.hook import (
+    Action,
+    _CommandHook,
+    _EventHook,
+    _Hook,
+    _RawHook,
+    _RegexHook,
+)
+from cloudbot.plugin_hooks import (
+    CommandHook,
+    EventHook,
+    Hook,
+    HookDict,
+    RawHook,
+    RegexHook,
+    hook_name_to_plugin,
+)
+from cloudbot.util import HOOK_ATTR
+
+logger = logging.getLogger("cloudbot")
+
+MANIFEST_VERSION = 2
+
+# Hooks which only run when something triggers them, plugins made up of only
+# these hook types don't need to be imported until they are used
+LAZY_HOOK_TYPES = frozenset(("command", "regex", "event", "irc_raw"))
+
+
+def file_hash(path) -> str:
+    """Hash a plugin's source, to tell whether a manifest entry is current"""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def file_hash_or_none(path) -> str | None:
+    """`file_hash`, or None if the file can't be read"""
+    try:
+        return file_hash(path)
+    except OSError:
+        return None
+
+
+def describe_hook(hook: Hook, attr: str | None = None) -> dict[str, Any]:
+    """
+    Describe a loaded hook in a form which can be stored as JSON
+
+    :param attr: The name of the hook function in the plugin's module
+    :return: The description, with "lazy" set to False if the hook has
+        options which can't be stored, like a custom lock or a regex object
+        which isn't a `re.Pattern`, so no stand-in can be built for it
+    """
+    kwargs = {
+        "permissions": list(hook.permissions),
+        "singlethread": hook.single_thread,
+        "action": hook.action.name,
+        "priority": int(hook.priority),
+        "do_sieve": hook.do_sieve,
+        "clients": list(hook.clients),
+    }
+    data: dict[str, Any] = {
+        "type": hook.type,
+        "function": hook.function_name,
+        "attr": attr,
+        "coroutine": not hook.threaded,
+        "args": list(inspect.signature(hook.function).parameters),
+        "bind_args": list(hook.arg_binder.arg_names),
+        "kwargs": kwargs,
+        "lazy": hook.type in LAZY_HOOK_TYPES,
+    }
+
+    if hook.lock is not None and not hook.single_thread:
+        data["lazy"] = False
+
+    if isinstance(hook, CommandHook):
+        kwargs["autohelp"] = hook.auto_help
+        data["aliases"] = hook.aliases
+        data["doc"] = hook.doc
+    elif isinstance(hook, RegexHook):
+        kwargs["run_on_cmd"] = hook.run_on_cmd
+        kwargs["only_no_match"] = hook.only_no_match
+        data["regexes"] = regexes = []
+        for regex in hook.regexes:
+            if isinstance(regex, re.Pattern) and isinstance(regex.pattern, str):
+                regexes.append([regex.pattern, regex.flags])
+            else:
+                data["lazy"] = False
+    elif isinstance(hook, EventHook):
+        data["types"] = sorted(event_type.name for event_type in hook.types)
+    elif isinstance(hook, RawHook):
+        data["triggers"] = sorted(hook.triggers)
+    elif hook.type == "periodic":
+        data["interval"] = getattr(hook, "interval")
+        kwargs["initial_interval"] = getattr(hook, "initial_interval")
+
+    return data
+
+
+def describe_plugin(plugin, digest: str) -> dict[str, Any]:
+    """
+    Describe all of a loaded plugin's hooks
+
+    :param digest: The `file_hash` of the source the plugin was loaded from
+    """
+    # find_hooks uses the first name a function is found under
+    attrs: dict[int, str] = {}
+    for name, obj in vars(plugin.code).items():
+        attrs.setdefault(id(obj), name)
+
+    hooks = [
+        describe_hook(hook, attrs.get(id(hook.function)))
+        for hook_list in plugin.hooks.values()
+        for hook in hook_list
+    ]
+
+    # Stand-ins don't create tables, plugins with tables are loaded normally
+    # so their tables exist before any other plugin uses them
+    lazy = bool(hooks) and not plugin.tables
+    return {
+        "hash": digest,
+        "lazy": lazy and all(data["lazy"] for data in hooks),
+        "hooks": hooks,
+    }
+
+
+def _stub_function(name: str, coroutine: bool):
+    """Create a function with the same name as a hook function"""
+
+    def stub():
+        raise RuntimeError(f"Stub for {name} called")
+
+    async def async_stub():
+        raise RuntimeError(f"Stub for {name} called")
+
+    func: Any = async_stub if coroutine else stub
+    func.__name__ = func.__qualname__ = name
+    return func
+
+
+def build_hook(plugin, data: dict[str, Any]) -> Hook:
+    """Create a stand-in for a hook from its description"""
+    func = _stub_function(data["function"], data["coroutine"])
+    func_hook: _Hook
+    kwargs = dict(data["kwargs"], action=Action[data["kwargs"]["action"]])
+    hook_type = data["type"]
+    if hook_type == "command":
+        func_hook = _CommandHook(func)
+        func_hook.add_hook(data["aliases"], kwargs)
+        func_hook.doc = data["doc"]
+    elif hook_type == "regex":
+        func_hook = _RegexHook(func)
+        func_hook.add_hook(
+            [re.compile(pattern, flags) for pattern, flags in data["regexes"]],
+            kwargs,
+        )
+    elif hook_type == "event":
+        func_hook = _EventHook(func)
+        func_hook.add_hook([EventType[name] for name in data["types"]], kwargs)
+    elif hook_type == "irc_raw":
+        func_hook = _RawHook(func)
+        func_hook.add_hook(data["triggers"], kwargs)
+    else:
+        raise ValueError(f"Can't build a stand-in for a {hook_type} hook")
+
+    func_hook.params = data["args"]
+    func_hook.bind_args = data["bind_args"]
+    return hook_name_to_plugin(hook_type)(plugin, func_hook)
+
+
+def find_cached_hooks(parent, module, entry) -> HookDict | None:
+    """
+    Find a plugin's hooks from its manifest entry, without searching the
+    module or inspecting the hook functions
+
+    :return: The hooks, or None if the module doesn't match the entry
+    """
+    # find_hooks finds each function once, under its first name
+    hooked: dict[int, str] = {}
+    for name, obj in module.__dict__.items():
+        if hasattr(obj, HOOK_ATTR) and not hasattr(obj, "_not_" + HOOK_ATTR):
+            hooked.setdefault(id(obj), name)
+
+    if set(hooked.values()) != {data["attr"] for data in entry["hooks"]}:
+        return None
+
+    found: dict[str, tuple[Any, dict[str, Any]]] = {}
+    for data in entry["hooks"]:
+        attr = data["attr"]
+        if attr not in found:
+            func = module.__dict__.get(attr)
+            if func is None or hasattr(func, "_not_" + HOOK_ATTR):
+                return None
+
+            found[attr] = (func, {})
+
+        found[attr][1][data["type"]] = data
+
+    for func, hook_data in found.values():
+        func_hooks = getattr(func, HOOK_ATTR, None)
+        if func_hooks is None or func_hooks.keys() != hook_data.keys():
+            return None
+
+    hooks = defaultdict(list)
+    for data in entry["hooks"]:
+        func = found[data["attr"]][0]
+        func_hook = getattr(func, HOOK_ATTR)[data["type"]]
+        func_hook.params = data["args"]
+        func_hook.bind_args = data["bind_args"]
+        hooks[data["type"]].append(
+            hook_name_to_plugin(data["type"])(parent, func_hook)
+        )
+
+    for func, _ in found.values():
+        # delete the hook to free memory
+        delattr(func, HOOK_ATTR)
+
+    return cast(HookDict, hooks)
+
+
+class LazyPlugin:
+    """
+    Stands in for a plugin which hasn't been imported yet, with hooks built
+    from its manifest entry. The real plugin replaces it the first time one of
+    its hooks is launched.
+    """
+
+    lazy = True
+
+    def __init__(self, filepath, filename, title, entry):
+        self.tasks: list[asyncio.Future] = []
+        self.file_path = filepath
+        self.file_name = filename
+        self.title = title
+        self.from_manifest = True
+        hooks: dict[str, list[Any]] = defaultdict(list)
+        for data in entry["hooks"]:
+            hooks[data["type"]].append(build_hook(self, data))
+
+        self.hooks = cast(HookDict, hooks)
+        self.tables: list[Table] = []
+        # Set once loading the real plugin has started
+        self.loading: asyncio.Future | None = None
+
+    @property
+    def code(self):
+        """
+        The plugin's module, imported without registering its hooks, for
+        plugins which use its attributes
+        """
+        return importlib.import_module(f"plugins.{self.title}")
+
+    def unregister_tables(self, bot):
+        """Stand-ins don't register any tables"""
+
+
+class PluginManifest:
+    """The manifest file, mapping plugin titles to their descriptions"""
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self.plugins: dict[str, dict[str, Any]] = {}
+
+    def load(self) -> None:
+        try:
+            with self.path.open(encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning(
+                "Unable to read plugin manifest %s, ignoring it",
+                self.path,
+                exc_info=True,
+            )
+            return
+
+        if data.get("version") != MANIFEST_VERSION:
+            logger.info("Plugin manifest is outdated, ignoring it")
+            return
+
+        self.plugins = data["plugins"]
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "plugins": self.plugins},
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+
+        tmp_path.replace(self.path)
+
+    def get(self, title: str, digest: str) -> dict[str, Any] | None:
+        """Get a plugin's entry, if it was recorded from the same source"""
+        entry = self.plugins.get(title)
+        if entry is None or entry["hash"] != digest:
+            return None
+
+        return entry
+
+    def update(self, plugin, digest: str) -> bool:
+        """
+        Record a loaded plugin's hooks
+
+        :return: Whether the entry changed
+        """
+        entry = describe_plugin(plugin, digest)
+        if self.plugins.get(plugin.title) == entry:
+            return False
+
+        self.plugins[plugin.title] = entry
+        return True
+
+    def prune(self, titles) -> bool:
+        """
+        Drop entries for plugins which aren't in `titles`
+
+        :return: Whether any entries were dropped
+        """
+        titles = set(titles)
+        removed = [title for title in self.plugins if title not in titles]
+        for title in removed:
+            del self.plugins[title]
+
+        return bool(removed)
@@ -0,0 +1,224 @@
+"""
+A bot-wide scheduler for work which is due at a specific time
+
+Jobs are kept in a heap ordered by their due time, with a single timer on the
+event loop armed for the earliest one, so idle jobs cost nothing but memory.
+Plugins which persist their jobs should schedule them again from an
+`on_start` hook.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Callable, Hashable
+from typing import Any
+
+logger = logging.getLogger("cloudbot")
+
+__all__ = ("ScheduledJob", "Scheduler")
+
+# Longest time the timer sleeps for before checking the wall clock again, so
+# jobs still fire on time if the system clock changes
+MAX_SLEEP = 300.0
+
+
+class ScheduledJob:
+    """A callback which should be run at `when`, a UNIX timestamp"""
+
+    __slots__ = ("key", "when", "callback", "args", "cancelled")
+
+    def __init__(
+        self,
+        key: Hashable,
+        when: float,
+        callback: Callable[..., Any],
+        args: tuple[Any, ...],
+    ) -> None:
+        self.key = key
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __repr__(self) -> str:
+        return f"ScheduledJob[{self.key!r}, when={self.when}]"
+
+
+class Scheduler:
+    """
+    Runs callbacks at a given time. Callbacks may be coroutine functions, in
+    which case they are run as a task.
+
+    Each job has a key, scheduling a job with a key which is already scheduled
+    replaces the existing job.
+
+    A Scheduler isn't thread safe, it must only be used from its event loop.
+    Hooks which schedule or cancel jobs should be coroutines, synchronous
+    hooks run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        *,
+        max_sleep: float = MAX_SLEEP,
+    ) -> None:
+        self.loop = loop
+        self.max_sleep = max_sleep
+
+        self._jobs: dict[Hashable, ScheduledJob] = {}
+        # Cancelled jobs are left in the heap until they reach the top
+        self._heap: list[tuple[float, int, ScheduledJob]] = []
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_when: float | None = None
+        self._tasks: set[asyncio.Future] = set()
+
+        self.fired = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._jobs
+
+    def get(self, key: Hashable) -> ScheduledJob | None:
+        return self._jobs.get(key)
+
+    def schedule_at(
+        self,
+        when: float,
+        callback: Callable[..., Any],
+        *args: Any,
+        key: Hashable = None,
+    ) -> Hashable:
+        """Run `callback(*args)` at the UNIX timestamp `when`
+
+        :param when: The time to run the job at, jobs in the past run as soon
+            as possible
+        :param callback: The function to run
+        :param key: Identifies the job, to cancel or replace it later. A
+            unique key is generated if it isn't given
+        :return: The job's key
+        """
+        if key is None:
+            key = ("job", next(self._counter))
+
+        self.cancel(key)
+
+        job = ScheduledJob(key, when, callback, args)
+        self._jobs[key] = job
+        heapq.heappush(self._heap, (when, next(self._counter), job))
+
+        if self._timer_when is None or when < self._timer_when:
+            self._arm()
+
+        return key
+
+    def schedule_in(
+        self,
+        delay: float,
+        callback: Callable[..., Any],
+        *args: Any,
+        key: Hashable = None,
+    ) -> Hashable:
+        """Run `callback(*args)` after `delay` seconds, see `schedule_at`"""
+        return self.schedule_at(time.time() + delay, callback, *args, key=key)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancel a scheduled job
+
+        :return: True if the job was scheduled, False otherwise
+        """
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return False
+
+        job.cancelled = True
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._compact()
+
+        return True
+
+    def _compact(self) -> None:
+        """Drop cancelled jobs from the heap"""
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+        heapq.heapify(self._heap)
+
+    def _arm(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+
+        if not heap:
+            self._timer_when = None
+            return
+
+        when = heap[0][0]
+        delay = min(max(0.0, when - time.time()), self.max_sleep)
+        self._timer_when = when
+        self._timer = self.loop.call_later(delay, self._run_due)
+
+    def _run_due(self) -> None:
+        self._timer = None
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, job = heapq.heappop(heap)
+            if job.cancelled:
+                continue
+
+            del self._jobs[job.key]
+            self._run_job(job)
+
+        self._arm()
+
+    def _run_job(self, job: ScheduledJob) -> None:
+        self.fired += 1
+        try:
+            result = job.callback(*job.args)
+        except Exception:
+            self.errors += 1
+            logger.exception("Error in scheduled job %r", job)
+            return
+
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result, loop=self.loop)
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done(job))
+
+    def _task_done(self, job: ScheduledJob) -> Callable[[asyncio.Future], None]:
+        def _done(task: asyncio.Future) -> None:
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                self.errors += 1
+                logger.error(
+                    "Error in scheduled job %r",
+                    job,
+                    exc_info=task.exception(),
+                )
+
+        return _done
+
+    def close(self) -> None:
+        """Cancel all jobs and running job tasks"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self._timer_when = None
+        for job in self._jobs.values():
+            job.cancelled = True
+
+        self._jobs.clear()
+        self._heap.clear()
+
+        for task in self._tasks:
+            task.cancel()
@@ -2,7 +2,13 @@
 database - contains variables set by cloudbot to be easily access
 """
 
-from sqlalchemy import MetaData
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any
+
+from sqlalchemy import MetaData, Table, and_, orm
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import (
     close_all_sessions,
@@ -11,7 +17,16 @@ from sqlalchemy.orm import (
     sessionmaker,
 )
 
-__all__ = ("metadata", "base", "Base", "Session", "configure")
+__all__ = (
+    "metadata",
+    "base",
+    "Base",
+    "Session",
+    "configure",
+    "DatabaseExecutorPool",
+    "LazySession",
+    "WriteBehindBuffer",
+)
 
 
 Base = declarative_base()
@@ -24,3 +39,355 @@ def configure(bind: Engine = None) -> None:
     close_all_sessions()
     Session.remove()
     Session.configure(bind=bind)
+
+
+class LazySession:
+    """
+    Stands in for a database session, only creating the real session (and
+    checking a connection out of the pool) the first time it is used
+    """
+
+    __slots__ = ("_factory", "_on_open", "_session")
+
+    def __init__(
+        self,
+        factory: Callable[[], orm.Session],
+        on_open: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        :param factory: Called to create the session on first use
+        :param on_open: Called once the session has been created
+        """
+        self._factory = factory
+        self._on_open = on_open
+        self._session: orm.Session | None = None
+
+    @property
+    def opened(self) -> bool:
+        """Whether the real session has been created"""
+        return self._session is not None
+
+    def get_session(self) -> orm.Session:
+        session = self._session
+        if session is None:
+            session = self._session = self._factory()
+            if self._on_open is not None:
+                self._on_open()
+
+        return session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get_session(), name)
+
+    # Special methods are looked up on the type, so __getattr__ doesn't
+    # forward them
+    def __enter__(self) -> orm.Session:
+        return self.get_session().__enter__()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.get_session().__exit__(*exc_info)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.get_session())
+
+    def __contains__(self, instance: object) -> bool:
+        return instance in self.get_session()
+
+    def close(self) -> None:
+        """Close the real session, if it was ever opened"""
+        session = self._session
+        if session is not None:
+            self._session = None
+            session.close()
+
+
+class PinnedExecutor(Executor):
+    """
+    An executor which runs all submitted work on a single worker thread of a
+    `DatabaseExecutorPool`, so objects tied to that thread (like a database
+    session) stay usable for as long as the executor is held
+
+    The worker is picked when work is first submitted, so events which never
+    use the database don't hold a worker.
+    """
+
+    def __init__(self, pool: "DatabaseExecutorPool") -> None:
+        self.pool = pool
+        self.worker: int | None = None
+        self.released = False
+
+    def submit(
+        self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> Future:
+        if self.released:
+            raise RuntimeError("Executor has already been released")
+
+        if self.worker is None:
+            self.worker = self.pool.pin()
+
+        return self.pool.submit_to(self.worker, fn, *args, **kwargs)
+
+    def release(self) -> None:
+        """Unpin this executor from its worker thread"""
+        if not self.released:
+            self.released = True
+            if self.worker is not None:
+                self.pool.release(self.worker)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self.release()
+
+
+class DatabaseExecutorPool:
+    """
+    A fixed size pool of single-thread workers used to run database work for
+    coroutine hooks.
+
+    Each event which needs a database session acquires a `PinnedExecutor`,
+    which keeps all of its work on one worker for the lifetime of the event.
+    Events are pinned to the worker with the least work running or queued, so
+    a slow query only delays the events already pinned to its worker.
+    """
+
+    def __init__(self, size: int = 4) -> None:
+        if size < 1:
+            raise ValueError("Database executor pool size must be at least 1")
+
+        self.size = size
+        self._workers = [
+            ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"cloudbot-db-{i}"
+            )
+            for i in range(size)
+        ]
+        self._lock = threading.Lock()
+        # Events currently pinned to each worker
+        self._pinned = [0] * size
+        # Tasks submitted to each worker that haven't started yet
+        self._queued = [0] * size
+        # Tasks currently running on each worker
+        self._running = [0] * size
+
+        self.tasks_run = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self) -> PinnedExecutor:
+        """Get an executor for a new event, see `PinnedExecutor`"""
+        return PinnedExecutor(self)
+
+    def pin(self) -> int:
+        """Pin an event to the least loaded worker"""
+        with self._lock:
+            worker = min(
+                range(self.size),
+                key=lambda i: (
+                    self._queued[i] + self._running[i],
+                    self._pinned[i],
+                ),
+            )
+            self._pinned[worker] += 1
+
+        return worker
+
+    def release(self, worker: int) -> None:
+        with self._lock:
+            self._pinned[worker] -= 1
+
+    def submit_to(
+        self, worker: int, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> Future:
+        submitted = time.monotonic()
+
+        def _run():
+            waited = time.monotonic() - submitted
+            with self._lock:
+                self._queued[worker] -= 1
+                self._running[worker] += 1
+                self.tasks_run += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running[worker] -= 1
+
+        with self._lock:
+            self._queued[worker] += 1
+
+        try:
+            return self._workers[worker].submit(_run)
+        except BaseException:
+            with self._lock:
+                self._queued[worker] -= 1
+
+            raise
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of submitted tasks which have not started running"""
+        return sum(self._queued)
+
+    @property
+    def pinned(self) -> int:
+        """The number of events currently pinned to a worker"""
+        return sum(self._pinned)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            tasks_run = self.tasks_run
+            return {
+                "size": self.size,
+                "pinned": sum(self._pinned),
+                "queue_depth": sum(self._queued),
+                "tasks_run": tasks_run,
+                "avg_wait": self.total_wait / tasks_run if tasks_run else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        for worker in self._workers:
+            worker.shutdown(wait=wait)
+
+
+class WriteBehindBuffer:
+    """
+    Buffers frequent writes to a table in memory, coalescing them by primary
+    key, so they can be written out together in a single transaction.
+
+    Rows which haven't been written yet can be read back with `get`, so
+    readers should check the buffer before querying the table.
+    """
+
+    def __init__(
+        self, table: Table, *, max_size: int = 500, max_age: float = 30.0
+    ) -> None:
+        """
+        :param table: The table to write to
+        :param max_size: The number of buffered rows which triggers a flush
+        :param max_age: The number of seconds after which buffered rows should
+            be flushed
+        """
+        self.table = table
+        self.key_columns = [column.name for column in table.primary_key]
+        if not self.key_columns:
+            raise ValueError(f"Table {table.name} has no primary key")
+
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: dict[tuple[Any, ...], dict[str, Any]] = {}
+        # Rows currently being written, still visible to readers
+        self._flushing: dict[tuple[Any, ...], dict[str, Any]] = {}
+        self._oldest: float | None = None
+
+        self.flushes = 0
+        self.rows_written = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def upsert(self, **values: Any) -> bool:
+        """Buffer an insert or update of the row identified by its primary key
+
+        :return: Whether the buffer should now be flushed
+        """
+        key = tuple(values[name] for name in self.key_columns)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                self._pending[key] = dict(values)
+            else:
+                row.update(values)
+
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+        return self.due()
+
+    def get(self, *key: Any) -> dict[str, Any] | None:
+        """Get the buffered values for a row which hasn't been written yet"""
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._flushing.get(key)
+
+            if row is None:
+                return None
+
+            return dict(row)
+
+    def due(self) -> bool:
+        """Whether the buffer has hit its size or age threshold"""
+        if len(self._pending) >= self.max_size:
+            return True
+
+        oldest = self._oldest
+        return oldest is not None and time.monotonic() - oldest >= self.max_age
+
+    def clear(self) -> None:
+        """Discard all buffered rows without writing them"""
+        with self._lock:
+            self._pending.clear()
+            self._oldest = None
+
+    def flush(self, db: orm.Session) -> int:
+        """Write all buffered rows in a single transaction
+
+        :param db: The database session to write with
+        :return: The number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self._flushing = self._pending
+                self._pending = {}
+                self._oldest = None
+
+            try:
+                if not rows:
+                    return 0
+
+                self._write(db, rows)
+            except Exception:
+                db.rollback()
+                with self._lock:
+                    # Put the rows back, without clobbering newer updates
+                    for key, values in rows.items():
+                        newer = self._pending.get(key)
+                        if newer is not None:
+                            values.update(newer)
+
+                        self._pending[key] = values
+
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+            self.flushes += 1
+            self.rows_written += len(rows)
+            return len(rows)
+
+    def _write(
+        self, db: orm.Session, rows: dict[tuple[Any, ...], dict[str, Any]]
+    ):
+        columns = self.table.c
+        for key, values in rows.items():
+            clause = and_(
+                *(
+                    columns[name] == value
+                    for name, value in zip(self.key_columns, key)
+                )
+            )
+            res = db.execute(self.table.update().where(clause).values(values))
+            if res.rowcount == 0:
+                db.execute(self.table.insert().values(values))
+
+        db.commit()
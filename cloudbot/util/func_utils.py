@@ -1,5 +1,6 @@
 import inspect
-from collections.abc import Callable, Mapping
+from collections.abc import Callable, Mapping, Sequence
+from operator import attrgetter
 from typing import Any, TypeVar
 
 
@@ -17,19 +18,89 @@ class ParameterError(Exception):
 _T = TypeVar("_T")
 
 
+def get_arg_names(func: Callable[..., Any]) -> list[str]:
+    """
+    >>> get_arg_names(lambda a, b, _c=None: None)
+    ['a', 'b']
+    """
+    sig = inspect.signature(func, follow_wrapped=False)
+    return [key for key in sig.parameters.keys() if not key.startswith("_")]
+
+
 def call_with_args(func: Callable[..., _T], arg_data: Mapping[str, Any]) -> _T:
     """
     >>> call_with_args(lambda a: a, {'a':1, 'b':2})
     1
     """
-    sig = inspect.signature(func, follow_wrapped=False)
     try:
-        args = [
-            arg_data[key]
-            for key in sig.parameters.keys()
-            if not key.startswith("_")
-        ]
+        args = [arg_data[key] for key in get_arg_names(func)]
     except KeyError as e:
         raise ParameterError(e.args[0], arg_data.keys()) from e
 
     return func(*args)
+
+
+class ArgBinder:
+    """
+    A precomputed plan for pulling a function's arguments off an object's
+    attributes, used to call hooks with data from an event without inspecting
+    the function's signature on every call
+
+    >>> from types import SimpleNamespace
+    >>> binder = ArgBinder(lambda a, b, _c=None: (a, b))
+    >>> binder.call(SimpleNamespace(a=1, b=2, c=3))
+    (1, 2)
+    """
+
+    __slots__ = ("func", "arg_names", "_getter")
+
+    def __init__(
+        self,
+        func: Callable[..., Any],
+        arg_names: Sequence[str] | None = None,
+    ) -> None:
+        """
+        :param arg_names: The result of `get_arg_names(func)`, if it is
+            already known
+        """
+        self.func = func
+        if arg_names is None:
+            arg_names = get_arg_names(func)
+
+        self.arg_names = tuple(arg_names)
+
+        getter: Callable[[Any], tuple[Any, ...]]
+        if not self.arg_names:
+            getter = _no_args
+        elif len(self.arg_names) == 1:
+            getter = _single_arg(attrgetter(self.arg_names[0]))
+        else:
+            getter = attrgetter(*self.arg_names)
+
+        self._getter = getter
+
+    def bind(self, obj: Any) -> tuple[Any, ...]:
+        """Get the arguments for this function from the attributes of `obj`"""
+        try:
+            return self._getter(obj)
+        except AttributeError as e:
+            for name in self.arg_names:
+                if not hasattr(obj, name):
+                    valid_args = obj.keys() if hasattr(obj, "keys") else ()
+                    raise ParameterError(name, valid_args) from e
+
+            raise
+
+    def call(self, obj: Any) -> Any:
+        return self.func(*self.bind(obj))
+
+
+def _no_args(_obj: Any) -> tuple[Any, ...]:
+    return ()
+
+
+def _single_arg(getter: attrgetter) -> Callable[[Any], tuple[Any, ...]]:
+    def _get(obj: Any) -> tuple[Any, ...]:
+        return (getter(obj),)
+
+    return _get
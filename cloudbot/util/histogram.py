@@ -0,0 +1,117 @@
+"""
+histogram.py
+
+Fixed size histograms for tracking latencies without keeping every sample
+"""
+
+import math
+
+
+class LatencyHistogram:
+    """
+    Counts durations in logarithmic buckets, so percentiles can be estimated
+    in constant memory. Estimates are the upper bound of the bucket the
+    percentile falls in, which is within about 20% of the real value.
+
+    >>> hist = LatencyHistogram()
+    >>> for value in (0.001, 0.002, 0.002, 0.004, 1.0):
+    ...     hist.record(value)
+    >>> hist.count
+    5
+    >>> round(hist.percentile(50), 4)
+    0.0022
+    >>> hist.percentile(100)
+    1.0
+    """
+
+    __slots__ = (
+        "min_value",
+        "max_value",
+        "buckets_per_doubling",
+        "_counts",
+        "count",
+        "total",
+        "max",
+    )
+
+    def __init__(
+        self,
+        min_value: float = 1e-5,
+        max_value: float = 100.0,
+        buckets_per_doubling: int = 4,
+    ) -> None:
+        """
+        :param min_value: Durations at or below this fall in the first bucket
+        :param max_value: Durations at or above this fall in the last bucket
+        :param buckets_per_doubling: The number of buckets between a value and
+            twice that value, higher values give more accurate estimates
+        """
+        self.min_value = min_value
+        self.max_value = max_value
+        self.buckets_per_doubling = buckets_per_doubling
+        # Allocated on the first sample, most hooks never run
+        self._counts: list[int] | None = None
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def size(self) -> int:
+        """The number of buckets"""
+        return self._bucket(self.max_value) + 1
+
+    @property
+    def mean(self) -> float:
+        if not self.count:
+            return 0.0
+
+        return self.total / self.count
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+
+        value = min(value, self.max_value)
+        return math.ceil(
+            math.log2(value / self.min_value) * self.buckets_per_doubling
+        )
+
+    def _upper_bound(self, bucket: int) -> float:
+        return self.min_value * 2 ** (bucket / self.buckets_per_doubling)
+
+    def record(self, value: float) -> None:
+        counts = self._counts
+        if counts is None:
+            counts = self._counts = [0] * self.size
+
+        counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent: float) -> float:
+        """Estimate the value below which `percent`% of samples fall"""
+        counts = self._counts
+        if counts is None:
+            return 0.0
+
+        target = self.count * percent / 100
+        last = len(counts) - 1
+        seen = 0
+        for bucket, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                if bucket == last:
+                    # The last bucket also holds everything above max_value
+                    return self.max
+
+                return min(self._upper_bound(bucket), self.max)
+
+        return self.max  # pragma: no cover
+
+    def reset(self) -> None:
+        self._counts = None
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
@@ -31,7 +31,9 @@ async def handle_available_caps(conn, caplist, event, irc_paramlist, bot):
         )
         tasks = [
             bot.plugin_manager.internal_launch(_hook, cap_event(hook=_hook))
-            for _hook in bot.plugin_manager.cap_hooks["on_available"][name_cf]
+            for _hook in bot.plugin_manager.cap_hooks["on_available"].get(
+                name_cf, ()
+            )
         ]
         results = await asyncio.gather(*tasks)
         if any(ok and (res or res is None) for ok, res in results):
@@ -86,7 +88,7 @@ async def handle_req_resp(enabled, conn, caplist, event, bot):
             cap_event = partial(CapEvent, base_event=event, cap=cap)
             tasks = [
                 bot.plugin_manager.launch(_hook, cap_event(hook=_hook))
-                for _hook in bot.plugin_manager.cap_hooks["on_ack"][cap]
+                for _hook in bot.plugin_manager.cap_hooks["on_ack"].get(cap, ())
             ]
             await asyncio.gather(*tasks)
 
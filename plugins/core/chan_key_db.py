@@ -6,15 +6,12 @@ Author:
 """
 
 from itertools import zip_longest
-from typing import Any
 
 from irclib.parser import Message
-from sqlalchemy import Column, PrimaryKeyConstraint, String, Table, and_, select
+from sqlalchemy import Column, PrimaryKeyConstraint, String, Table, select
 from sqlalchemy.orm import Session
-from sqlalchemy.sql.elements import BooleanClauseList, ClauseElement
 
 from cloudbot import hook
-from cloudbot.client import Client
 from cloudbot.clients.irc import IrcClient
 from cloudbot.util import database
 from cloudbot.util.irc import parse_mode_string
@@ -30,11 +27,17 @@ table = Table(
 )
 
 
+# Key changes are kept in memory on the client and written out in batches,
+# so sending a JOIN never waits on the database
+key_buffer = database.WriteBehindBuffer(table, max_age=10.0)
+
+
 @hook.connect(clients=["irc"])
 def load_keys(conn: IrcClient, db) -> None:
     """
     Load channel keys to the client
     """
+    flush_keys(db)
     query = select(table.c.chan, table.c.key).where(
         table.c.conn == conn.name.lower()
     )
@@ -43,10 +46,22 @@ def load_keys(conn: IrcClient, db) -> None:
         conn.set_channel_key(row.chan, row.key)
 
 
-@hook.irc_raw("MODE")
-def handle_modes(
-    irc_paramlist: list[str], conn: IrcClient, db, chan: str
-) -> None:
+@hook.periodic(key_buffer.max_age, initial_interval=key_buffer.max_age)
+def flush_keys(db: Session) -> None:
+    """
+    Write out buffered key changes
+    """
+    if key_buffer:
+        key_buffer.flush(db)
+
+
+@hook.on_stop()
+def flush_keys_on_stop(db: Session) -> None:
+    key_buffer.flush(db)
+
+
+@hook.irc_raw("MODE", inline=True)
+def handle_modes(irc_paramlist: list[str], conn: IrcClient, chan: str) -> None:
     """
     Handle mode changes
     """
@@ -59,66 +74,36 @@ def handle_modes(
     mode_changes = parse_mode_string(
         modes, mode_params, server_info.get_channel_modes(serv_info)
     )
-    updated = False
     for change in mode_changes:
         if change.char == "k":
-            updated = True
             if change.adding:
-                set_key(db, conn, chan, change.param)
+                set_key(conn, chan, change.param)
             else:
-                clear_key(db, conn, chan)
-
-    if updated:
-        load_keys(conn, db)
-
-
-def insert_or_update(
-    db: Session, tbl: Table, data: dict[str, Any], query: ClauseElement
-) -> None:
-    """
-    Insert a new row or update an existing matching row
-    """
-    result = db.execute(tbl.update().where(query).values(**data))
-    if not result.rowcount:
-        db.execute(tbl.insert().values(**data))
-
-    db.commit()
-
-
-def make_clause(conn: Client, chan: str) -> BooleanClauseList:
-    """
-    Generate a WHERE clause to match keys for this conn+channel
-    """
-    return and_(
-        table.c.conn == conn.name.lower(),
-        table.c.chan == chan.lower(),
-    )
+                clear_key(conn, chan)
 
 
-def clear_key(db: Session, conn, chan: str) -> None:
+def clear_key(conn: IrcClient, chan: str) -> None:
     """
-    Remove a channel's key from the DB
+    Remove a channel's key
     """
-    db.execute(table.delete().where(make_clause(conn, chan)))
+    set_key(conn, chan, None)
 
 
-def set_key(db: Session, conn: IrcClient, chan: str, key: str | None) -> None:
+def set_key(conn: IrcClient, chan: str, key: str | None) -> None:
     """
-    Set the key for a channel
+    Set the key for a channel, the change is written to the DB later
     """
-    insert_or_update(
-        db,
-        table,
-        {"conn": conn.name.lower(), "chan": chan.lower(), "key": key or None},
-        make_clause(conn, chan),
+    key_buffer.upsert(
+        conn=conn.name.lower(), chan=chan.lower(), key=key or None
     )
-    conn.set_channel_key(chan, key)
+    if key:
+        conn.set_channel_key(chan, key)
+    else:
+        conn.clear_channel_key(chan)
 
 
-@hook.irc_out()
-def check_send_key(
-    conn: IrcClient, parsed_line: Message, db: Session
-) -> Message:
+@hook.irc_out(inline=True)
+def check_send_key(conn: IrcClient, parsed_line: Message) -> Message:
     """
     Parse outgoing JOIN messages and store used channel keys
     """
@@ -132,6 +117,6 @@ def check_send_key(
             *map(lambda s: s.split(","), (parsed_line.parameters[0], keys))
         ):
             if key:
-                set_key(db, conn, chan, key)
+                set_key(conn, chan, key)
 
     return parsed_line
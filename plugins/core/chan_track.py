@@ -577,7 +577,7 @@ def getdata_cmd(conn, chan, nick):
     return web.paste(MappingSerializer().serialize(memb, indent=2))
 
 
-@hook.irc_raw("*", priority=Priority.HIGHEST, do_sieve=False)
+@hook.irc_raw("*", priority=Priority.HIGHEST, do_sieve=False, inline=True)
 def handle_tags(conn: IrcClient, nick: str, irc_tags: TagList) -> None:
     users = get_users(conn)
 
@@ -588,7 +588,7 @@ def handle_tags(conn: IrcClient, nick: str, irc_tags: TagList) -> None:
             user_data.account = account_tag.value
 
 
-@hook.irc_raw(["PRIVMSG", "NOTICE"], do_sieve=False)
+@hook.irc_raw(["PRIVMSG", "NOTICE"], do_sieve=False, inline=True)
 def on_msg(conn, nick, user, host, irc_paramlist):
     chan = irc_paramlist[0]
 
@@ -629,7 +629,7 @@ def clean_pms(bot):
                 pass
 
 
-@hook.irc_raw("JOIN", do_sieve=False)
+@hook.irc_raw("JOIN", do_sieve=False, inline=True)
 def on_join(nick, user, host, conn, irc_paramlist):
     chan, *other_data = irc_paramlist
 
@@ -649,7 +649,7 @@ def on_join(nick, user, host, conn, irc_paramlist):
     user_data.join_channel(chan_data)
 
 
-@hook.irc_raw("MODE", do_sieve=False)
+@hook.irc_raw("MODE", do_sieve=False, inline=True)
 def on_mode(chan, irc_paramlist, conn):
     if irc_paramlist[0].casefold() == conn.nick.casefold():
         # this is a user mode line
@@ -682,7 +682,7 @@ def on_mode(chan, irc_paramlist, conn):
         member.sort_status()
 
 
-@hook.irc_raw("PART", do_sieve=False)
+@hook.irc_raw("PART", do_sieve=False, inline=True)
 def on_part(chan, nick, conn):
     channels = get_chans(conn)
     if nick.casefold() == conn.nick.casefold():
@@ -692,12 +692,12 @@ def on_part(chan, nick, conn):
         del chan_data.users[nick]
 
 
-@hook.irc_raw("KICK", do_sieve=False)
+@hook.irc_raw("KICK", do_sieve=False, inline=True)
 def on_kick(chan, target, conn):
     on_part(chan, target, conn)
 
 
-@hook.irc_raw("QUIT", do_sieve=False)
+@hook.irc_raw("QUIT", do_sieve=False, inline=True)
 def on_quit(nick, conn):
     users = get_users(conn)
     if nick in users:
@@ -707,7 +707,7 @@ def on_quit(nick, conn):
             del chan.users[nick]
 
 
-@hook.irc_raw("NICK", do_sieve=False)
+@hook.irc_raw("NICK", do_sieve=False, inline=True)
 def on_nick(nick, irc_paramlist, conn):
     users = get_users(conn)
     chans = get_chans(conn)
@@ -729,12 +729,12 @@ def on_nick(nick, irc_paramlist, conn):
             user_chans[new_nick] = user_chans.pop(nick)
 
 
-@hook.irc_raw("ACCOUNT", do_sieve=False)
+@hook.irc_raw("ACCOUNT", do_sieve=False, inline=True)
 def on_account(conn, nick, irc_paramlist):
     get_users(conn).getuser(nick).account = irc_paramlist[0]
 
 
-@hook.irc_raw("CHGHOST", do_sieve=False)
+@hook.irc_raw("CHGHOST", do_sieve=False, inline=True)
 def on_chghost(conn, nick, irc_paramlist):
     ident, host = irc_paramlist
     user = get_users(conn).getuser(nick)
@@ -742,7 +742,7 @@ def on_chghost(conn, nick, irc_paramlist):
     user.host = host
 
 
-@hook.irc_raw("AWAY", do_sieve=False)
+@hook.irc_raw("AWAY", do_sieve=False, inline=True)
 def on_away(conn, nick, irc_paramlist):
     if irc_paramlist:
         reason = irc_paramlist[0]
@@ -754,7 +754,7 @@ def on_away(conn, nick, irc_paramlist):
     user.away_message = reason
 
 
-@hook.irc_raw("352", do_sieve=False)
+@hook.irc_raw("352", do_sieve=False, inline=True)
 def on_who(conn, irc_paramlist):
     _, _, ident, host, server, nick, status, realname = irc_paramlist
     realname = realname.split(None, 1)[1]
@@ -770,7 +770,7 @@ def on_who(conn, irc_paramlist):
     user.is_oper = is_oper
 
 
-@hook.irc_raw("311", do_sieve=False)
+@hook.irc_raw("311", do_sieve=False, inline=True)
 def on_whois_name(conn, irc_paramlist):
     _, nick, ident, host, _, realname = irc_paramlist
     user = get_users(conn).getuser(nick)
@@ -779,13 +779,13 @@ def on_whois_name(conn, irc_paramlist):
     user.realname = realname
 
 
-@hook.irc_raw("330", do_sieve=False)
+@hook.irc_raw("330", do_sieve=False, inline=True)
 def on_whois_acct(conn, irc_paramlist):
     _, nick, acct = irc_paramlist[:3]
     get_users(conn).getuser(nick).account = acct
 
 
-@hook.irc_raw("301", do_sieve=False)
+@hook.irc_raw("301", do_sieve=False, inline=True)
 def on_whois_away(conn, irc_paramlist):
     _, nick, msg = irc_paramlist
     user = get_users(conn).getuser(nick)
@@ -793,13 +793,13 @@ def on_whois_away(conn, irc_paramlist):
     user.away_message = msg
 
 
-@hook.irc_raw("312", do_sieve=False)
+@hook.irc_raw("312", do_sieve=False, inline=True)
 def on_whois_server(conn, irc_paramlist):
     _, nick, server, _ = irc_paramlist
     get_users(conn).getuser(nick).server = server
 
 
-@hook.irc_raw("313", do_sieve=False)
+@hook.irc_raw("313", do_sieve=False, inline=True)
 def on_whois_oper(conn, irc_paramlist):
     nick = irc_paramlist[1]
     get_users(conn).getuser(nick).is_oper = True
@@ -2,7 +2,7 @@ from cloudbot import hook
 from cloudbot.hook import Priority
 
 
-@hook.sieve(priority=Priority.LOWEST)
+@hook.sieve(priority=Priority.LOWEST, hook_types=["command"])
 def cmd_autohelp(bot, event, _hook):
     if (
         _hook.type == "command"
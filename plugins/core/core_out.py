@@ -15,7 +15,7 @@ NEW_LINE_TRANS_TBL = str.maketrans(
 )
 
 
-@hook.irc_out(priority=Priority.HIGHEST)
+@hook.irc_out(priority=Priority.HIGHEST, inline=True)
 def strip_newlines(line, conn):
     """
     Removes newline characters from a message
@@ -30,13 +30,13 @@ def strip_newlines(line, conn):
     return line
 
 
-@hook.irc_out(priority=Priority.HIGH)
+@hook.irc_out(priority=Priority.HIGH, inline=True)
 def truncate_line(line, conn):
     line_len = conn.config.get("max_line_length", 510)
     return line[:line_len] + "\r\n"
 
 
-@hook.irc_out(priority=Priority.LOWEST)
+@hook.irc_out(priority=Priority.LOWEST, inline=True)
 def encode_line(line, conn):
     if not isinstance(line, str):
         return line
@@ -46,7 +46,7 @@ def encode_line(line, conn):
     return line.encode(encoding, errors)
 
 
-@hook.irc_out(priority=Priority.HIGH)
+@hook.irc_out(priority=Priority.HIGH, inline=True)
 def strip_command_chars(parsed_line, conn, line):
     chars = conn.config.get("strip_cmd_chars", "!.@;$")
     if (
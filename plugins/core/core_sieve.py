@@ -19,7 +19,7 @@ def task_clear():
             del buckets[uid]
 
 
-@hook.sieve()
+@hook.sieve(report=False)
 def check_acls(bot: CloudBot, event: Event, _hook: Hook) -> Event | None:
     """
     Handle config ACLs
@@ -66,7 +66,7 @@ async def perm_sieve(bot: CloudBot, event: Event, _hook: Hook) -> Event | None:
     return event
 
 
-@hook.sieve()
+@hook.sieve(hook_types=["command"], report=False)
 def check_disabled(
     bot: CloudBot, event: CommandEvent, _hook: Hook
 ) -> Event | None:
@@ -82,7 +82,7 @@ def check_disabled(
     return event
 
 
-@hook.sieve()
+@hook.sieve(hook_types=["command", "regex"], report=False)
 def rate_limit(bot: CloudBot, event: Event, _hook: Hook) -> Event | None:
     """
     Handle rate limiting certain hooks
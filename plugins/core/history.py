@@ -18,7 +18,9 @@ def track_history(event, message_time, conn):
     history.append(data)
 
 
-@hook.event([EventType.message, EventType.action], singlethread=True)
+@hook.event(
+    [EventType.message, EventType.action], singlethread=True, inline=True
+)
 def chat_tracker(event, conn):
     if event.type is EventType.action:
         event.content = f"\x01ACTION {event.content}\x01"
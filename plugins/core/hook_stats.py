@@ -7,6 +7,7 @@ Author:
 
 from collections import defaultdict
 from collections.abc import Callable
+from operator import attrgetter
 
 from cloudbot import hook
 from cloudbot.hook import Priority
@@ -93,6 +94,45 @@ def do_hook_stats(data, hook_name):
     ]
 
 
+def format_ms(seconds):
+    return f"{seconds * 1000:.1f}"
+
+
+def do_latency_stats(plugin_manager):
+    hooks = [
+        _hook
+        for plugin in plugin_manager.plugins.values()
+        for hook_list in plugin.hooks.values()
+        for _hook in hook_list
+        if _hook.wall_time.count
+    ]
+    table = [
+        (
+            _hook.plugin.title + "." + _hook.function_name,
+            str(_hook.wall_time.count),
+            format_ms(_hook.wall_time.percentile(50)),
+            format_ms(_hook.wall_time.percentile(95)),
+            format_ms(_hook.wall_time.percentile(99)),
+            format_ms(_hook.wall_time.max),
+            format_ms(_hook.queue_wait.percentile(95)),
+            format_ms(_hook.executor_wait.percentile(95)),
+        )
+        for _hook in sorted(
+            hooks, key=lambda h: h.wall_time.percentile(99), reverse=True
+        )
+    ]
+    return (
+        "Hook",
+        "Runs",
+        "p50 (ms)",
+        "p95 (ms)",
+        "p99 (ms)",
+        "Max (ms)",
+        "Queue p95 (ms)",
+        "Executor p95 (ms)",
+    ), table
+
+
 Handler = Callable[..., tuple[tuple[str, ...], list[tuple[str, ...]]]]
 stats_funcs: dict[str, tuple[Handler, int]] = {
     "global": (do_global_stats, 0),
@@ -104,23 +144,24 @@ stats_funcs: dict[str, tuple[Handler, int]] = {
 
 @hook.command(permissions=["snoonetstaff", "botcontrol"])
 def hookstats(text, bot, notice_doc):
-    """{global|network <name>|channel <network> <channel>|hook <hook>} - Get hook usage statistics"""
+    """{global|network <name>|channel <network> <channel>|hook <hook>|latency} - Get hook usage statistics"""
     args = text.split()
     stats_type = args.pop(0).lower()
 
-    data = get_stats(bot)
+    if stats_type == "latency":
+        headers, data = do_latency_stats(bot.plugin_manager)
+    else:
+        try:
+            handler, arg_count = stats_funcs[stats_type]
+        except LookupError:
+            notice_doc()
+            return None
 
-    try:
-        handler, arg_count = stats_funcs[stats_type]
-    except LookupError:
-        notice_doc()
-        return None
+        if len(args) < arg_count:
+            notice_doc()
+            return None
 
-    if len(args) < arg_count:
-        notice_doc()
-        return None
-
-    headers, data = handler(data, *args[:arg_count])
+        headers, data = handler(get_stats(bot), *args[:arg_count])
 
     if not data:
         return "No stats available."
@@ -128,3 +169,59 @@ def hookstats(text, bot, notice_doc):
     table = gen_markdown_table(headers, data)
 
     return web.paste(table, "md", "hastebin")
+
+
+@hook.command(permissions=["snoonetstaff", "botcontrol"], autohelp=False)
+def regexstats(bot):
+    """- Get match statistics for all loaded regex hooks"""
+    entries = bot.plugin_manager.regex_dispatcher.entries
+    if not entries:
+        return "No stats available."
+
+    headers = ("Hook", "Pattern", "Checked", "Prefiltered", "Matched", "Rate")
+    data = [
+        (
+            entry.hook.plugin.title + "." + entry.hook.function_name,
+            entry.regex.pattern,
+            str(entry.checked),
+            str(entry.skipped),
+            str(entry.matched),
+            f"{entry.match_rate:.2%}",
+        )
+        for entry in sorted(entries, key=attrgetter("checked"), reverse=True)
+    ]
+    table = gen_markdown_table(headers, data)
+
+    return web.paste(table, "md", "hastebin")
+
+
+@hook.command(permissions=["snoonetstaff", "botcontrol"], autohelp=False)
+def dbstats(bot):
+    """- Get database session usage for all loaded hooks which request a session"""
+    hooks = [
+        _hook
+        for plugin in bot.plugin_manager.plugins.values()
+        for hook_list in plugin.hooks.values()
+        for _hook in hook_list
+        if _hook.db_sessions_requested
+    ]
+    if not hooks:
+        return "No stats available."
+
+    headers = ("Hook", "Sessions Requested", "Sessions Used", "Unused")
+    data = [
+        (
+            _hook.plugin.title + "." + _hook.function_name,
+            str(_hook.db_sessions_requested),
+            str(_hook.db_sessions_used),
+            "{:.2%}".format(
+                1 - _hook.db_sessions_used / _hook.db_sessions_requested
+            ),
+        )
+        for _hook in sorted(
+            hooks, key=attrgetter("db_sessions_requested"), reverse=True
+        )
+    ]
+    table = gen_markdown_table(headers, data)
+
+    return web.paste(table, "md", "hastebin")
@@ -1,6 +1,7 @@
+import re
+import threading
 from collections import OrderedDict
 
-from irclib.util.compare import match_mask
 from sqlalchemy import (
     Boolean,
     Column,
@@ -28,6 +29,121 @@ table = Table(
 
 ignore_cache: list[tuple[str, str, str]] = []
 
+# Number of hostmask results remembered by each IgnoreBucket
+RESULT_CACHE_SIZE = 1024
+
+
+class IgnoreBucket:
+    """
+    The compiled ignore masks for a single channel, or the global ignores.
+
+    Masks without wildcards are stored in a set, all wildcard masks are
+    combined into a single regex. Results are cached per hostmask, the cache
+    is dropped whenever the masks change. Buckets are checked from the event
+    loop and from threaded hooks, so the cache is guarded by a lock.
+    """
+
+    def __init__(self, masks=()):
+        self._lock = threading.Lock()
+        self.exact: frozenset[str] = frozenset()
+        self.regex: re.Pattern | None = None
+        self._results: OrderedDict[str, bool] = OrderedDict()
+        self.update(masks)
+
+    def update(self, masks):
+        """Replace the masks in this bucket"""
+        exact = set()
+        wildcards = []
+        for mask in masks:
+            if "*" in mask or "?" in mask:
+                wildcards.append(mask)
+            else:
+                exact.add(mask)
+
+        regex = None
+        if wildcards:
+            regex = re.compile(
+                "^(?:{})$".format("|".join(map(compile_mask, wildcards)))
+            )
+
+        with self._lock:
+            self.exact = frozenset(exact)
+            self.regex = regex
+            self._results = OrderedDict()
+
+    def matches(self, mask):
+        """Check a casefolded hostmask against this bucket"""
+        with self._lock:
+            if mask in self.exact:
+                return True
+
+            regex = self.regex
+            if regex is None:
+                return False
+
+            results = self._results
+            result = results.get(mask)
+            if result is not None:
+                results.move_to_end(mask)
+                return result
+
+        result = bool(regex.match(mask))
+        with self._lock:
+            # Don't cache the result if the masks changed in the meantime
+            if self._results is results:
+                results[mask] = result
+                if len(results) > RESULT_CACHE_SIZE:
+                    results.popitem(last=False)
+
+        return result
+
+
+# Regex fragments for the wildcards `match_mask` supports
+GLOB_MAP = {"?": ".", "*": ".*"}
+
+
+def compile_mask(mask):
+    """
+    Convert a banmask to a regex fragment, matching the semantics of
+    `irclib.util.compare.match_mask`
+
+    >>> compile_mask("*!*@host.?")
+    '.*!.*@host\\\\..'
+    """
+    return "".join(GLOB_MAP.get(c, re.escape(c)) for c in mask)
+
+
+# (connection, channel) -> IgnoreBucket, keyed by casefolded names
+ignore_index: dict[tuple[str, str], IgnoreBucket] = {}
+# Global ignores apply to every connection
+global_ignores = IgnoreBucket()
+# Casefolded (connection, channel, mask) -> the entry as stored
+ignore_lookup: dict[tuple[str, str, str], tuple[str, str, str]] = {}
+
+
+def build_index(entries):
+    """Rebuild the ignore index from a list of (conn, chan, mask) entries"""
+    lookup: dict[tuple[str, str, str], tuple[str, str, str]] = {}
+    channels: dict[tuple[str, str], list[str]] = {}
+    global_masks = []
+    for conn, chan, mask in entries:
+        key = (conn.casefold(), chan.casefold(), mask.casefold())
+        lookup.setdefault(key, (conn, chan, mask))
+        if chan == "*":
+            global_masks.append(key[2])
+        else:
+            channels.setdefault(key[:2], []).append(key[2])
+
+    ignore_lookup.clear()
+    ignore_lookup.update(lookup)
+
+    ignore_index.clear()
+    ignore_index.update(
+        (key, IgnoreBucket(masks)) for key, masks in channels.items()
+    )
+
+    global_ignores.update(global_masks)
+
 
 @hook.on_start()
 def load_cache(db):
@@ -40,15 +156,13 @@ def load_cache(db):
 
     ignore_cache.clear()
     ignore_cache.extend(new_cache)
+    build_index(new_cache)
 
 
 def find_ignore(conn, chan, mask):
-    search = (conn.casefold(), chan.casefold(), mask.casefold())
-    for _conn, _chan, _mask in ignore_cache:
-        if search == (_conn.casefold(), _chan.casefold(), _mask.casefold()):
-            return _conn, _chan, _mask
-
-    return None
+    return ignore_lookup.get(
+        (conn.casefold(), chan.casefold(), mask.casefold())
+    )
 
 
 def ignore_in_cache(conn, chan, mask):
@@ -86,23 +200,16 @@ def remove_ignore(db, conn, chan, mask):
 
 
 def is_ignored(conn, chan, mask):
-    chan_key = (conn.casefold(), chan.casefold())
     mask_cf = mask.casefold()
-    for _conn, _chan, _mask in ignore_cache:
-        _mask_cf = _mask.casefold()
-        if _chan == "*":
-            # this is a global ignore
-            if match_mask(mask_cf, _mask_cf):
-                return True
-        else:
-            # this is a channel-specific ignore
-            if chan_key != (_conn.casefold(), _chan.casefold()):
-                continue
+    # global ignores apply on every connection
+    if global_ignores.matches(mask_cf):
+        return True
 
-            if match_mask(mask_cf, _mask_cf):
-                return True
+    bucket = ignore_index.get((conn.casefold(), chan.casefold()))
+    if bucket is None:
+        return False
 
-    return False
+    return bucket.matches(mask_cf)
 
 
 @hook.sieve(priority=50)
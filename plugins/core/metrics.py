@@ -0,0 +1,359 @@
+"""
+Exposes bot internals in the Prometheus text format on a local HTTP endpoint
+
+Enable it with the "metrics" section of the config, then scrape
+http://<host>:<port>/metrics
+"""
+
+import asyncio
+import logging
+import os
+from functools import partial
+
+from cloudbot import hook
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger("cloudbot")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def escape_label(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+class MetricFamily:
+    """A single named metric and its samples"""
+
+    def __init__(self, name, metric_type, doc):
+        self.name = name
+        self.type = metric_type
+        self.doc = doc
+        self.samples = []
+
+    def add(self, value, suffix="", **labels):
+        self.samples.append((self.name + suffix, labels, value))
+
+    def add_histogram(self, histogram, **labels):
+        """Add a LatencyHistogram as a summary"""
+        for quantile in QUANTILES:
+            self.add(
+                histogram.percentile(quantile * 100),
+                quantile=quantile,
+                **labels,
+            )
+
+        self.add(histogram.total, "_sum", **labels)
+        self.add(histogram.count, "_count", **labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} {self.type}"
+        for name, labels, value in self.samples:
+            if labels:
+                label_str = ",".join(
+                    f'{key}="{escape_label(label)}"'
+                    for key, label in labels.items()
+                )
+                name = f"{name}{{{label_str}}}"
+
+            yield f"{name} {value}"
+
+
+def hook_name(_hook):
+    return _hook.plugin.title + "." + _hook.function_name
+
+
+def all_hooks(bot):
+    for plugin in bot.plugin_manager.plugins.values():
+        for hook_list in plugin.hooks.values():
+            yield from hook_list
+
+
+def collect_connections(bot):
+    families = {
+        "lines_in": MetricFamily(
+            "cloudbot_connection_lines_received_total",
+            "counter",
+            "Lines received from the server",
+        ),
+        "lines_out": MetricFamily(
+            "cloudbot_connection_lines_sent_total",
+            "counter",
+            "Lines sent to the server",
+        ),
+        "bytes_in": MetricFamily(
+            "cloudbot_connection_bytes_received_total",
+            "counter",
+            "Bytes received from the server",
+        ),
+        "bytes_out": MetricFamily(
+            "cloudbot_connection_bytes_sent_total",
+            "counter",
+            "Bytes sent to the server",
+        ),
+        "reconnects": MetricFamily(
+            "cloudbot_connection_reconnects_total",
+            "counter",
+            "Times the connection was re-established",
+        ),
+    }
+    connected = MetricFamily(
+        "cloudbot_connection_up",
+        "gauge",
+        "Whether the connection is currently connected",
+    )
+    queue_depth = MetricFamily(
+        "cloudbot_event_queue_depth",
+        "gauge",
+        "Events waiting to be processed",
+    )
+    processed = MetricFamily(
+        "cloudbot_events_processed_total",
+        "counter",
+        "Events processed",
+    )
+    dropped = MetricFamily(
+        "cloudbot_events_dropped_total",
+        "counter",
+        "Events dropped because the event queue was full",
+    )
+    for conn in bot.connections.values():
+        for attr, family in families.items():
+            family.add(getattr(conn, attr), conn=conn.name)
+
+        connected.add(int(bool(conn.connected)), conn=conn.name)
+
+        stats = conn.event_queue.stats()
+        queue_depth.add(stats["queue_depth"], conn=conn.name)
+        processed.add(stats["processed"], conn=conn.name)
+        for priority, count in stats["dropped"].items():
+            dropped.add(count, conn=conn.name, priority=priority)
+
+    return [
+        *families.values(),
+        connected,
+        queue_depth,
+        processed,
+        dropped,
+    ]
+
+
+def collect_hooks(bot):
+    invocations = MetricFamily(
+        "cloudbot_hook_invocations_total",
+        "counter",
+        "Hook runs, including errors",
+    )
+    errors = MetricFamily(
+        "cloudbot_hook_errors_total",
+        "counter",
+        "Hook runs which raised an error",
+    )
+    stats = bot.memory.get("hook_stats")
+    if stats:
+        for name, counts in sorted(stats["global"].items()):
+            invocations.add(counts["success"] + counts["failure"], hook=name)
+            errors.add(counts["failure"], hook=name)
+
+    wall_time = MetricFamily(
+        "cloudbot_hook_duration_seconds",
+        "summary",
+        "Time taken to run hooks",
+    )
+    queue_wait = MetricFamily(
+        "cloudbot_hook_queue_wait_seconds",
+        "summary",
+        "Time from receiving a line to running a hook for it",
+    )
+    executor_wait = MetricFamily(
+        "cloudbot_hook_executor_wait_seconds",
+        "summary",
+        "Time threaded hooks waited for a worker thread",
+    )
+    requested = MetricFamily(
+        "cloudbot_db_sessions_requested_total",
+        "counter",
+        "Database sessions prepared for hooks",
+    )
+    used = MetricFamily(
+        "cloudbot_db_sessions_used_total",
+        "counter",
+        "Database sessions hooks actually used",
+    )
+    for _hook in all_hooks(bot):
+        # A function can have several hooks of different types
+        labels = {"hook": hook_name(_hook), "type": _hook.type}
+        for family, histogram in (
+            (wall_time, _hook.wall_time),
+            (queue_wait, _hook.queue_wait),
+            (executor_wait, _hook.executor_wait),
+        ):
+            if histogram.count:
+                family.add_histogram(histogram, **labels)
+
+        if _hook.db_sessions_requested:
+            requested.add(_hook.db_sessions_requested, **labels)
+            used.add(_hook.db_sessions_used, **labels)
+
+    return [
+        invocations,
+        errors,
+        wall_time,
+        queue_wait,
+        executor_wait,
+        requested,
+        used,
+    ]
+
+
+def collect_executors(bot):
+    executor_queue = MetricFamily(
+        "cloudbot_executor_queue_length",
+        "gauge",
+        "Tasks waiting for a thread in the default executor",
+    )
+    work_queue = getattr(getattr(bot, "executor", None), "_work_queue", None)
+    if work_queue is not None:
+        executor_queue.add(work_queue.qsize())
+
+    db_queue = MetricFamily(
+        "cloudbot_db_executor_queue_length",
+        "gauge",
+        "Database tasks waiting for a worker",
+    )
+    db_pinned = MetricFamily(
+        "cloudbot_db_executor_pinned_events",
+        "gauge",
+        "Events currently holding a database worker",
+    )
+    pool = bot.db_executor_pool
+    db_queue.add(pool.queue_depth)
+    db_pinned.add(pool.pinned)
+
+    return [executor_queue, db_queue, db_pinned]
+
+
+def collect_process(bot):
+    families: list[MetricFamily] = []
+    watchdog = getattr(bot, "loop_watchdog", None)
+    if watchdog is not None:
+        lag = MetricFamily(
+            "cloudbot_loop_lag_seconds",
+            "summary",
+            "How late event loop heartbeats ran",
+        )
+        lag.add_histogram(watchdog.lag)
+        stalls = MetricFamily(
+            "cloudbot_loop_stalls_total",
+            "counter",
+            "Times the event loop was blocked for longer than the threshold",
+        )
+        stalls.add(watchdog.stalls)
+        families.extend((lag, stalls))
+
+    if psutil:
+        process = psutil.Process(os.getpid())
+        memory = MetricFamily(
+            "cloudbot_process_resident_memory_bytes",
+            "gauge",
+            "Resident memory size",
+        )
+        memory.add(process.memory_info().rss)
+        threads = MetricFamily(
+            "cloudbot_process_threads",
+            "gauge",
+            "Number of OS threads",
+        )
+        threads.add(process.num_threads())
+        families.extend((memory, threads))
+
+    return families
+
+
+collectors = (
+    collect_connections,
+    collect_hooks,
+    collect_executors,
+    collect_process,
+)
+
+
+def render_metrics(bot):
+    lines = []
+    for collector in collectors:
+        for family in collector(bot):
+            lines.extend(family.render())
+
+    return "\n".join(lines) + "\n"
+
+
+async def handle_request(bot, reader, writer):
+    try:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            asyncio.TimeoutError,
+        ):
+            return
+
+        method, _, rest = request.decode("latin-1").partition(" ")
+        path = rest.partition(" ")[0].partition("?")[0]
+        if method != "GET":
+            status, body = "405 Method Not Allowed", ""
+        elif path != "/metrics":
+            status, body = "404 Not Found", ""
+        else:
+            status, body = "200 OK", render_metrics(bot)
+
+        data = body.encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + data
+        )
+        await writer.drain()
+    except Exception:
+        logger.exception("Error handling metrics request")
+    finally:
+        writer.close()
+
+
+@hook.on_start()
+async def start_server(bot):
+    conf = bot.config.get("metrics", {})
+    if not conf.get("enabled", False):
+        return
+
+    host = conf.get("host", "127.0.0.1")
+    port = conf.get("port", 9091)
+    bot.memory["metrics_server"] = await asyncio.start_server(
+        partial(handle_request, bot), host, port
+    )
+    logger.info("Serving metrics on %s:%d", host, port)
+
+
+@hook.on_stop()
+async def stop_server(bot):
+    server = bot.memory.pop("metrics_server", None)
+    if server is None:
+        return
+
+    server.close()
+    await server.wait_closed()
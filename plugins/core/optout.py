@@ -2,12 +2,14 @@
 Bot wide hook opt-out for channels
 """
 
-from collections import defaultdict
-from collections.abc import MutableMapping
+import re
+from collections import OrderedDict, defaultdict
+from collections.abc import Iterable, MutableMapping
 from functools import total_ordering
+from heapq import merge
+from operator import itemgetter
 from threading import RLock
 
-from irclib.util.compare import match_mask
 from sqlalchemy import (
     Boolean,
     Column,
@@ -38,6 +40,24 @@ optout_cache: MutableMapping[str, list["OptOut"]] = DefaultKeyFoldDict(list)
 
 cache_lock = RLock()
 
+# Number of (channel, hook) decisions remembered by each OptOutIndex
+DECISION_CACHE_SIZE = 4096
+
+
+# Regex fragments for the wildcards `match_mask` supports
+GLOB_MAP = {"?": ".", "*": ".*"}
+
+
+def compile_mask(pattern):
+    """Compile a glob pattern with the semantics of `irclib`'s `match_mask`"""
+    return re.compile(
+        "^{}$".format("".join(GLOB_MAP.get(c, re.escape(c)) for c in pattern))
+    )
+
+
+def is_wildcard(pattern):
+    return "*" in pattern or "?" in pattern
+
 
 @total_ordering
 class OptOut:
@@ -45,6 +65,8 @@ class OptOut:
         self.channel = channel.casefold()
         self.hook = hook_pattern.casefold()
         self.allow = allow
+        self._chan_regex = compile_mask(self.channel)
+        self._hook_regex = compile_mask(self.hook)
 
     def __lt__(self, other):
         if isinstance(other, OptOut):
@@ -67,12 +89,70 @@ class OptOut:
         )
 
     def match(self, channel, hook_name):
-        return self.match_chan(channel) and match_mask(
-            hook_name.casefold(), self.hook
-        )
+        return self.match_chan(channel) and self.match_hook(hook_name)
 
     def match_chan(self, channel):
-        return match_mask(channel.casefold(), self.channel)
+        return bool(self._chan_regex.match(channel.casefold()))
+
+    def match_hook(self, hook_name):
+        return bool(self._hook_regex.match(hook_name.casefold()))
+
+
+class OptOutIndex:
+    """
+    The optouts for a single connection, indexed by channel.
+
+    Optouts with a literal channel are looked up by name, only optouts with
+    wildcard channels are matched against the channel. Resolved decisions are
+    remembered per (channel, hook name), the index is rebuilt whenever the
+    connection's optout list changes.
+    """
+
+    def __init__(self, optouts):
+        self.optouts = optouts
+        self.size = len(optouts)
+
+        self._by_chan: dict[str, list[tuple[int, OptOut]]] = {}
+        self._wild_chan: list[tuple[int, OptOut]] = []
+        for i, opt in enumerate(optouts):
+            if is_wildcard(opt.channel):
+                self._wild_chan.append((i, opt))
+            else:
+                self._by_chan.setdefault(opt.channel, []).append((i, opt))
+
+        self._decisions: OrderedDict[tuple[str, str], OptOut | None] = (
+            OrderedDict()
+        )
+
+    def is_current(self, optouts):
+        return self.optouts is optouts and self.size == len(optouts)
+
+    def find(self, chan, hook_name):
+        """Find the first optout matching `chan` and `hook_name`, if any"""
+        key = (chan.casefold(), hook_name.casefold())
+        decisions = self._decisions
+        try:
+            result = decisions[key]
+        except KeyError:
+            result = decisions[key] = self._find(*key)
+            if len(decisions) > DECISION_CACHE_SIZE:
+                decisions.popitem(last=False)
+        else:
+            decisions.move_to_end(key)
+
+        return result
+
+    def _find(self, chan, hook_name):
+        candidates: Iterable[tuple[int, OptOut]] = self._by_chan.get(chan, [])
+        if self._wild_chan:
+            # Keep the original list order, so the most specific optout wins
+            candidates = merge(candidates, self._wild_chan, key=itemgetter(0))
+
+        for _, opt in candidates:
+            if opt.match(chan, hook_name):
+                return opt
+
+        return None
 
 
 async def check_channel_permissions(event, chan, *perms):
@@ -99,12 +179,23 @@ def get_channel_optouts(conn_name, chan=None) -> list[OptOut]:
         ]
 
 
-def get_first_matching_optout(conn_name, chan, hook_name) -> OptOut | None:
-    for optout in get_conn_optouts(conn_name):
-        if optout.match(chan, hook_name):
-            return optout
+optout_index: dict[str, OptOutIndex] = {}
+
+
+def get_optout_index(conn_name) -> OptOutIndex:
+    conn_cf = conn_name.casefold()
+    with cache_lock:
+        optouts = optout_cache[conn_cf]
+        index = optout_index.get(conn_cf)
+        if index is None or not index.is_current(optouts):
+            index = optout_index[conn_cf] = OptOutIndex(optouts)
 
-    return None
+        return index
+
+
+def get_first_matching_optout(conn_name, chan, hook_name) -> OptOut | None:
+    with cache_lock:
+        return get_optout_index(conn_name).find(chan, hook_name)
 
 
 def format_optout_list(opts):
@@ -183,9 +274,10 @@ def load_cache(db):
     with cache_lock:
         optout_cache.clear()
         optout_cache.update(new_cache)
+        optout_index.clear()
 
 
-@hook.sieve(priority=Priority.HIGHEST)
+@hook.sieve(priority=Priority.HIGHEST, report=False)
 def optout_sieve(bot, event, _hook):
     if not event.chan or not event.conn:
         return event
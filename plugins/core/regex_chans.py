@@ -120,7 +120,7 @@ def change_status(db, event, status):
     set_status(db, event.conn.name, channel, status)
 
 
-@hook.sieve()
+@hook.sieve(hook_types=["regex"], report=False)
 def sieve_regex(
     bot: "CloudBot", event: "Event", _hook: "Hook"
 ) -> Optional["Event"]:
@@ -35,18 +35,33 @@ table = Table(
 
 ReminderCacheEntry = tuple[str, datetime, datetime, str, str]
 
-reminder_cache: list[ReminderCacheEntry] = []
+# Pending reminders by (network, user), then by the time they were added.
+# Each one is also a job in the bot's scheduler, see `job_key`
+reminder_cache: dict[tuple[str, str], dict[datetime, ReminderCacheEntry]] = {}
 
+# Seconds to wait before trying to deliver a reminder again, if its
+# connection isn't ready yet
+RETRY_DELAY = 30
 
-async def delete_reminder(async_call, db, network, remind_time, user):
+
+def job_key(network, user, added_time):
+    return "remind", network, user, added_time
+
+
+def delete_reminder(db, network, remind_time, user):
     query = (
         table.delete()
         .where(table.c.network == network.lower())
         .where(table.c.remind_time == remind_time)
         .where(table.c.added_user == user.lower())
     )
-    await async_call(db.execute, query)
-    await async_call(db.commit)
+    db.execute(query)
+    db.commit()
+
+
+def _delete_delivered(network, remind_time, user):
+    with database.Session.session_factory() as db:
+        delete_reminder(db, network, remind_time, user)
 
 
 async def delete_all(async_call, db, network, user):
@@ -81,17 +96,49 @@ async def add_reminder(
     await async_call(db.commit)
 
 
+def schedule_reminder(bot, reminder, when=None):
+    """Add a reminder to the cache and schedule its delivery
+
+    :param when: The UNIX timestamp to deliver the reminder at, defaults to
+        the reminder's time
+    """
+    network, remind_time, added_time, user, _message = reminder
+    reminder_cache.setdefault((network, user), {})[added_time] = reminder
+    if when is None:
+        when = remind_time.timestamp()
+
+    bot.scheduler.schedule_at(
+        when,
+        send_reminder,
+        bot,
+        reminder,
+        key=job_key(network, user, added_time),
+    )
+
+
+def unschedule_reminders(bot, network, user):
+    """Remove all of a user's reminders from the cache and the scheduler"""
+    reminders = reminder_cache.pop((network, user), {})
+    for added_time in reminders:
+        bot.scheduler.cancel(job_key(network, user, added_time))
+
+    return len(reminders)
+
+
 @hook.on_start()
-async def load_cache(async_call, db):
-    new_cache = []
+async def load_cache(bot, async_call, db):
+    for network, user in list(reminder_cache):
+        unschedule_reminders(bot, network, user)
+
+    for reminder in await async_call(_load_cache_db, db):
+        schedule_reminder(bot, reminder)
 
-    for network, remind_time, added_time, user, message in await async_call(
-        _load_cache_db, db
-    ):
-        new_cache.append((network, remind_time, added_time, user, message))
 
-    reminder_cache.clear()
-    reminder_cache.extend(new_cache)
+@hook.on_stop()
+async def unschedule_all(bot):
+    """Cancel every pending reminder, they're loaded again on start"""
+    for network, user in list(reminder_cache):
+        unschedule_reminders(bot, network, user)
 
 
 def _load_cache_db(db):
@@ -108,65 +155,62 @@ def _load_cache_db(db):
     ]
 
 
-@hook.periodic(30, initial_interval=30)
-async def check_reminders(bot, async_call, db):
-    current_time = datetime.now()
-
-    for reminder in reminder_cache:
-        network, remind_time, added_time, user, message = reminder
-        if remind_time <= current_time:
-            if network not in bot.connections:
-                # connection is invalid
-                continue
+async def send_reminder(bot, reminder):
+    network, remind_time, added_time, user, message = reminder
+    conn = bot.connections.get(network)
+    if conn is None:
+        # The network isn't configured, keep the reminder stored in case it
+        # is added again, it is scheduled again when the plugin is loaded
+        return
 
-            conn = bot.connections[network]
+    if not conn.ready:
+        # The connection may come back, try again later
+        schedule_reminder(bot, reminder, time.time() + RETRY_DELAY)
+        return
 
-            if not conn.ready:
-                return
+    current_time = datetime.now()
+    remind_text = colors.parse(time_since(added_time, count=2))
+    alert = colors.parse(
+        "{}, you have a reminder from $(b){}$(clear) ago!".format(
+            user, remind_text
+        )
+    )
 
-            remind_text = colors.parse(time_since(added_time, count=2))
-            alert = colors.parse(
-                "{}, you have a reminder from $(b){}$(clear) ago!".format(
-                    user, remind_text
-                )
-            )
+    conn.message(user, alert)
+    conn.message(user, f'"{message}"')
 
-            conn.message(user, alert)
-            conn.message(user, f'"{message}"')
+    delta = current_time - remind_time
+    if delta > timedelta(minutes=30):
+        late_time = time_since(remind_time, count=2)
+        late = (
+            "(I'm sorry for delivering this message $(b){}$(clear) late,"
+            " it seems I was unable to deliver it on time)".format(late_time)
+        )
+        conn.message(user, colors.parse(late))
 
-            delta = current_time - remind_time
-            if delta > timedelta(minutes=30):
-                late_time = time_since(remind_time, count=2)
-                late = (
-                    "(I'm sorry for delivering this message $(b){}$(clear) late,"
-                    " it seems I was unable to deliver it on time)".format(
-                        late_time
-                    )
-                )
-                conn.message(user, colors.parse(late))
+    reminders = reminder_cache.get((network, user), {})
+    reminders.pop(added_time, None)
+    if not reminders:
+        reminder_cache.pop((network, user), None)
 
-            await delete_reminder(async_call, db, network, remind_time, user)
-            await load_cache(async_call, db)
+    await bot.loop.run_in_executor(
+        None, _delete_delivered, network, remind_time, user
+    )
 
 
 @hook.command("remind", "reminder", "in")
-async def remind(text, nick, chan, db, conn, event, async_call):
+async def remind(text, nick, chan, db, conn, event, async_call, bot):
     """<1 minute, 30 seconds>: <do task> - reminds you to <do task> in <1 minute, 30 seconds>"""
-
-    count = len(
-        [
-            x
-            for x in reminder_cache
-            if x[0] == conn.name and x[3] == nick.lower()
-        ]
-    )
+    network = conn.name.lower()
+    user = nick.lower()
+    count = len(reminder_cache.get((network, user), ()))
 
     if text == "clear":
         if count == 0:
             return "You have no reminders to delete."
 
-        await delete_all(async_call, db, conn.name, nick)
-        await load_cache(async_call, db)
+        await delete_all(async_call, db, network, user)
+        unschedule_reminders(bot, network, user)
         return f"Deleted all ({count}) reminders for {nick}!"
 
     # split the input on the first ":"
@@ -208,14 +252,14 @@ async def remind(text, nick, chan, db, conn, event, async_call):
     await add_reminder(
         async_call,
         db,
-        conn.name,
-        nick,
+        network,
+        user,
         chan,
         message,
         remind_time,
         current_time,
     )
-    await load_cache(async_call, db)
+    schedule_reminder(bot, (network, remind_time, current_time, user, message))
 
     remind_text = format_time(seconds, count=2)
     output = 'Alright, I\'ll remind you "{}" in $(b){}$(clear)!'.format(
@@ -27,6 +27,10 @@ table = Table(
 )
 
 
+# Seen updates happen for every channel message, so write them in batches
+seen_buffer = database.WriteBehindBuffer(table)
+
+
 def track_seen(event, db):
     """Tracks messages for the .seen command"""
     # keep private messages private
@@ -34,28 +38,15 @@ def track_seen(event, db):
     if event.chan[:1] == "#" and not re.findall(
         "^s/.*/.*/$", event.content.lower()
     ):
-        res = db.execute(
-            table.update()
-            .where(
-                and_(
-                    table.c.name == event.nick.lower(),
-                    table.c.chan == event.chan,
-                )
-            )
-            .values(time=now, quote=event.content, host=str(event.mask))
+        due = seen_buffer.upsert(
+            name=event.nick.lower(),
+            time=now,
+            quote=event.content,
+            chan=event.chan,
+            host=str(event.mask),
         )
-        if res.rowcount == 0:
-            db.execute(
-                table.insert().values(
-                    name=event.nick.lower(),
-                    time=now,
-                    quote=event.content,
-                    chan=event.chan,
-                    host=str(event.mask),
-                )
-            )
-
-        db.commit()
+        if due:
+            seen_buffer.flush(db)
 
 
 @hook.event([EventType.message, EventType.action], singlethread=True)
@@ -66,6 +57,30 @@ def chat_tracker(event, db):
     track_seen(event, db)
 
 
+@hook.periodic(seen_buffer.max_age, initial_interval=seen_buffer.max_age)
+def flush_seen(db):
+    """Write out buffered seen data, even if no new messages arrive"""
+    if seen_buffer:
+        seen_buffer.flush(db)
+
+
+@hook.on_stop()
+def flush_seen_on_stop(db):
+    seen_buffer.flush(db)
+
+
+def get_last_seen(db, nick, chan):
+    buffered = seen_buffer.get(nick, chan)
+    if buffered is not None:
+        return buffered["time"], buffered["quote"]
+
+    return db.execute(
+        select(table.c.time, table.c.quote).where(
+            and_(table.c.name == nick, table.c.chan == chan)
+        )
+    ).fetchone()
+
+
 @hook.command()
 def seen(text, nick, chan, db, event):
     """<nick> <channel> - tells when a nickname was last in active in one of my channels"""
@@ -79,17 +94,13 @@ def seen(text, nick, chan, db, event):
     if not event.is_nick_valid(text):
         return "I can't look up that name, its impossible to use!"
 
-    last_seen = db.execute(
-        select(table.c.name, table.c.time, table.c.quote).where(
-            and_(table.c.name == text.lower(), table.c.chan == chan)
-        )
-    ).fetchone()
+    last_seen = get_last_seen(db, text.lower(), chan)
 
     if not last_seen:
         return f"I've never seen {text} talking in this channel."
 
-    reltime = timeformat.time_since(last_seen[1])
-    msg = last_seen[2]
+    reltime = timeformat.time_since(last_seen[0])
+    msg = last_seen[1]
     if msg.startswith("\1ACTION"):
         stripped = msg.strip("\1 ")[6:].strip()
         return "{} was last seen {} ago: * {} {}".format(
@@ -1,13 +1,19 @@
 import asyncio
 from asyncio import CancelledError
 from typing import TYPE_CHECKING, Any
-from unittest.mock import MagicMock, call
+from unittest.mock import MagicMock, call, patch
 
 import pytest
+from irclib.parser import Message
 
-from cloudbot.client import ClientConnectError
+from cloudbot import hook
+from cloudbot.client import ClientConnectError, EventPriority, EventQueue
 from cloudbot.clients import irc
 from cloudbot.event import Event, EventType
+from cloudbot.plugin import PluginManager
+from cloudbot.plugin_hooks import IrcOutHook
+from cloudbot.util import colors
+from plugins.core import core_out
 from tests.util.async_mock import AsyncMock
 
 if TYPE_CHECKING:
@@ -22,6 +28,9 @@ def make_mock_conn(*, name="testconn"):
     conn.loop = loop
     conn.describe_server.return_value = "server.name:port"
     conn.auto_reconnect.return_value = asyncio.Future(loop=loop)
+    conn.config = {}
+    conn.event_queue = EventQueue(conn)
+    conn.lines_in = conn.bytes_in = conn.lines_out = conn.bytes_out = 0
 
     return conn
 
@@ -39,7 +48,7 @@ def test_send_not_connected(mock_db):
 
 
 @pytest.mark.asyncio
-async def test_send_closed(mock_db):
+async def test_send_closed(mock_db, caplog_bot):
     bot = MagicMock(loop=asyncio.get_running_loop())
     client = irc.IrcClient(
         bot, "irc", "foo", "bar", config={"connection": {"server": "server"}}
@@ -48,9 +57,14 @@ async def test_send_closed(mock_db):
     client._protocol = proto
     proto._connected = False
     proto._connecting = False
+    caplog_bot.clear()
     client._send("foobar")
-    with pytest.raises(ValueError):
-        await TestLineParsing.wait_tasks(client)
+    await TestLineParsing.wait_tasks(client)
+    assert caplog_bot.record_tuples == [
+        ("cloudbot", 40, "[foo] Error occurred while sending line")
+    ]
+    assert len(client.send_queue) == 0
+    assert client.send_queue.sent == 0
 
 
 class TestLineParsing:
@@ -82,6 +96,8 @@ class TestLineParsing:
             out.append(self._filter_event(e))
 
         conn.bot.process = func
+        # A catch-all hook makes sure no lines are skipped
+        conn.bot.plugin_manager.catch_all_triggers = [MagicMock()]
 
         proto = irc._IrcProtocol(conn)
         return conn, out, proto
@@ -99,47 +115,49 @@ class TestLineParsing:
             {
                 "irc_tags": None,
                 "chan": "server.host",
-                "content": None,
-                "content_raw": None,
+                "content": "hi",
+                "content_raw": "hi",
                 "db": None,
                 "db_executor": None,
                 "hook": None,
                 "host": "",
-                "irc_command": "COMMAND",
+                "irc_command": "PRIVMSG",
                 "irc_ctcp_text": None,
-                "irc_paramlist": ["this", "is", "a command"],
+                "irc_paramlist": ["me", "hi"],
                 "irc_prefix": "server.host",
-                "irc_raw": ":server.host COMMAND this is :a command",
+                "irc_raw": ":server.host PRIVMSG me :hi",
                 "mask": "server.host",
                 "nick": "server.host",
                 "target": None,
-                "type": EventType.other,
+                "type": EventType.message,
                 "user": "",
             },
             {
                 "irc_tags": None,
                 "chan": "server.host",
-                "content": "hi",
-                "content_raw": "hi",
+                "content": None,
+                "content_raw": None,
                 "db": None,
                 "db_executor": None,
                 "hook": None,
                 "host": "",
-                "irc_command": "PRIVMSG",
+                "irc_command": "COMMAND",
                 "irc_ctcp_text": None,
-                "irc_paramlist": ["me", "hi"],
+                "irc_paramlist": ["this", "is", "a command"],
                 "irc_prefix": "server.host",
-                "irc_raw": ":server.host PRIVMSG me :hi",
+                "irc_raw": ":server.host COMMAND this is :a command",
                 "mask": "server.host",
                 "nick": "server.host",
                 "target": None,
-                "type": EventType.message,
+                "type": EventType.other,
                 "user": "",
             },
         ]
 
         assert caplog_bot.record_tuples == []
         assert conn.mock_calls == []
+        assert conn.lines_in == 2
+        assert conn.bytes_in == 70
 
     @pytest.mark.asyncio
     async def test_broken_line_doesnt_interrupt(self, caplog_bot):
@@ -151,26 +169,6 @@ class TestLineParsing:
         await self.wait_tasks(conn)
 
         assert out == [
-            {
-                "chan": "server\x02.host",
-                "content": None,
-                "content_raw": None,
-                "db": None,
-                "db_executor": None,
-                "hook": None,
-                "host": "",
-                "irc_command": "CMD",
-                "irc_ctcp_text": None,
-                "irc_paramlist": ["this", "is", "a command"],
-                "irc_prefix": "server\x02.host",
-                "irc_raw": ":server\x02.host CMD this is :a command",
-                "irc_tags": None,
-                "mask": "server\x02.host",
-                "nick": "server\x02.host",
-                "target": None,
-                "type": EventType.other,
-                "user": "",
-            },
             {
                 "chan": "server.host",
                 "content": "hi",
@@ -191,6 +189,26 @@ class TestLineParsing:
                 "type": EventType.message,
                 "user": "",
             },
+            {
+                "chan": "server\x02.host",
+                "content": None,
+                "content_raw": None,
+                "db": None,
+                "db_executor": None,
+                "hook": None,
+                "host": "",
+                "irc_command": "CMD",
+                "irc_ctcp_text": None,
+                "irc_paramlist": ["this", "is", "a command"],
+                "irc_prefix": "server\x02.host",
+                "irc_raw": ":server\x02.host CMD this is :a command",
+                "irc_tags": None,
+                "mask": "server\x02.host",
+                "nick": "server\x02.host",
+                "target": None,
+                "type": EventType.other,
+                "user": "",
+            },
         ]
         assert caplog_bot.record_tuples == [
             (
@@ -202,6 +220,49 @@ class TestLineParsing:
         ]
         assert conn.mock_calls == [("describe_server", (), {})]
 
+    @pytest.mark.asyncio
+    async def test_long_line(self, caplog_bot):
+        conn, out, proto = self.make_proto()
+        conn.config["max_recv_line_length"] = 512
+        proto = irc._IrcProtocol(conn)
+        proto.data_received(
+            b":server NOTICE me :" + b"a" * 512 + b"\r\n"
+            b":server PING hi\r\n"
+            b":server NOTICE me :\xe3\x81\x82 \x80\r\n"
+        )
+
+        conn.send.assert_called_with("PONG hi", log=False)
+        await self.wait_tasks(conn)
+        assert [e["irc_command"] for e in out] == ["PING", "NOTICE"]
+        assert out[1]["content_raw"] == irc.decode(b"\xe3\x81\x82 \x80")
+        assert caplog_bot.record_tuples == [
+            (
+                "cloudbot",
+                30,
+                "[testconn] Dropped 1 line(s) longer than 512 bytes from "
+                "server.name:port",
+            )
+        ]
+
+    @pytest.mark.asyncio
+    async def test_long_tagged_line(self, caplog_bot):
+        conn, out, proto = self.make_proto()
+        # The outgoing line limit doesn't apply to incoming lines
+        conn.config["max_line_length"] = 510
+        proto = irc._IrcProtocol(conn)
+        line = "@label=" + "a" * 512 + " :nick!user@host PRIVMSG #chan :hi"
+        with patch.object(
+            proto, "_make_event", wraps=proto._make_event
+        ) as make_event:
+            proto.data_received(line.encode() + b"\r\n")
+
+        assert make_event.call_args.args[0] == line
+        await self.wait_tasks(conn)
+        assert [(e["irc_command"], e["content"]) for e in out] == [
+            ("PRIVMSG", "hi")
+        ]
+        assert caplog_bot.record_tuples == []
+
     @pytest.mark.asyncio
     async def test_pong(self, caplog_bot):
         conn, _, proto = self.make_proto()
@@ -455,6 +516,49 @@ class TestLineParsing:
         assert conn.mock_calls == []
 
 
+def test_line_framer_split_reads():
+    framer = irc.LineFramer()
+    data = b":a PRIVMSG #b :c\r\n:d NOTICE e :f\r\n"
+    lines = []
+    for i in range(len(data)):
+        lines.extend(framer.feed(data[i : i + 1]))
+
+    assert lines == [b":a PRIVMSG #b :c", b":d NOTICE e :f"]
+    assert len(framer) == 0
+
+
+def test_line_framer_long_lines():
+    framer = irc.LineFramer(10)
+    assert framer.feed(b"a" * 11 + b"\r\nshort\r\n") == [b"short"]
+    assert framer.dropped == 1
+
+    # A line which is too long is dropped even before its end arrives
+    assert framer.feed(b"b" * 8) == []
+    assert framer.feed(b"b" * 8) == []
+    assert len(framer) <= 10
+    assert framer.feed(b"b" * 8 + b"\r") == []
+    assert framer.feed(b"\nok\r\n") == [b"ok"]
+    assert framer.dropped == 2
+
+    framer.feed(b"partial")
+    framer.clear()
+    assert framer.feed(b"new\r\n") == [b"new"]
+
+
+def test_line_framer_burst():
+    line = b":server 353 me = #chan :" + b"nick " * 80
+    count = (1024 * 1024) // len(line)
+    data = (line + b"\r\n") * count
+    framer = irc.LineFramer()
+    lines = []
+    for i in range(0, len(data), 4096):
+        lines.extend(framer.feed(data[i : i + 4096]))
+
+    assert len(lines) == count
+    assert set(lines) == {line}
+    assert len(framer) == 0
+
+
 class TestConnect:
     async def make_client(self) -> irc.IrcClient:
         bot = MagicMock(loop=asyncio.get_running_loop(), config={})
@@ -639,6 +743,27 @@ class TestConnect:
             ("plugin_manager.connect_hooks.__iter__", (), {})
         ]
 
+    @pytest.mark.asyncio()
+    async def test_count_reconnects(self, caplog_bot, mock_db):
+        client = await self.make_client()
+        client.loop.create_connection = mock = MagicMock()
+
+        def make_future():
+            fut: "Future[Tuple[MagicMock, MagicMock]]" = asyncio.Future(
+                loop=client.loop
+            )
+            fut.set_result((MagicMock(), MagicMock(connected=False)))
+            return fut
+
+        mock.side_effect = lambda *args, **kwargs: make_future()
+
+        await client.connect()
+        assert client.reconnects == 0
+
+        await client.connect()
+        await client.connect()
+        assert client.reconnects == 2
+
 
 class TestProtocol:
     @pytest.mark.asyncio
@@ -659,12 +784,24 @@ class TestProtocol:
         proto = irc._IrcProtocol(conn)
         proto._connected = True
         proto._connecting = True
+        conn.event_queue.put("stale")
+        conn.event_queue.clear = MagicMock(wraps=conn.event_queue.clear)
         proto.connection_lost(None)
 
         assert proto._connected is False
         assert proto._connecting is True
+        assert conn.event_queue.queue_depth == 0
+        conn.event_queue.clear.assert_called_once_with()
         assert caplog_bot.record_tuples == []
-        assert conn.mock_calls == [call.auto_reconnect()]
+        assert conn.mock_calls == [
+            call.send_queue.discard(proto),
+            call.auto_reconnect(),
+        ]
+
+
+def make_out_hook(func, **kwargs):
+    hook.irc_out(**kwargs)(func)
+    return IrcOutHook(MagicMock(title="test"), hook._get_hook(func, "irc_out"))
 
 
 class TestSend:
@@ -673,8 +810,12 @@ class TestSend:
         conn = make_mock_conn()
         proto = irc._IrcProtocol(conn)
         proto.connection_made(MagicMock())
-        sieve = object()
-        proto.bot.plugin_manager.out_sieves = [sieve]
+
+        def sieve(line):
+            raise NotImplementedError
+
+        out_hook = make_out_hook(sieve, inline=False)
+        proto.bot.plugin_manager.out_sieves = [out_hook]
         proto.bot.plugin_manager.internal_launch = launch = MagicMock()
         fut = proto.loop.create_future()
         fut.set_result((False, None))
@@ -682,7 +823,7 @@ class TestSend:
 
         await proto.send("PRIVMSG #foo bar")
         assert len(launch.mock_calls) == 1
-        assert launch.mock_calls[0][1][0] is sieve
+        assert launch.mock_calls[0][1][0] is out_hook
 
         assert caplog_bot.record_tuples == [
             (
@@ -693,3 +834,109 @@ class TestSend:
             ("cloudbot", 10, "Line was: PRIVMSG #foo bar"),
             ("cloudbot", 10, "[testconn|out] >> b'PRIVMSG #foo bar\\r\\n'"),
         ]
+
+    @pytest.mark.asyncio()
+    async def test_send_inline_sieve_error(self, caplog_bot):
+        conn = make_mock_conn()
+        proto = irc._IrcProtocol(conn)
+        proto.connection_made(MagicMock())
+
+        def sieve(line):
+            raise NotImplementedError
+
+        proto.bot.plugin_manager = PluginManager(proto.bot)
+        proto.bot.plugin_manager.register_hooks(
+            [make_out_hook(sieve, inline=True)]
+        )
+        caplog_bot.clear()
+        await proto.send("PRIVMSG #foo bar")
+        proto._transport.write.assert_called_once_with(b"PRIVMSG #foo bar\r\n")
+        assert caplog_bot.record_tuples[0] == (
+            "cloudbot",
+            40,
+            "Error in hook test:sieve",
+        )
+
+    @pytest.mark.asyncio()
+    async def test_send_pipeline(self):
+        conn = make_mock_conn()
+        conn.config = {"strip_cmd_chars": "."}
+        proto = irc._IrcProtocol(conn)
+        proto.connection_made(MagicMock())
+        proto.bot.plugin_manager = PluginManager(proto.bot)
+
+        parsed_lines = []
+
+        def track_parsed(parsed_line):
+            parsed_lines.append(parsed_line)
+            return parsed_line
+
+        hooks = [
+            make_out_hook(func, inline=True)
+            for func in (
+                core_out.strip_newlines,
+                core_out.truncate_line,
+                core_out.strip_command_chars,
+                track_parsed,
+                core_out.encode_line,
+            )
+        ]
+        proto.bot.plugin_manager.register_hooks(hooks)
+
+        with patch.object(Message, "parse", wraps=Message.parse) as parse:
+            await proto.send("PRIVMSG #foo :.bar\n")
+            await proto.send("JOIN #foo")
+
+        assert parse.call_count == 2
+        # strip_command_chars returned a new message, which was reused
+        assert parsed_lines[0].parameters[-1] == (
+            colors.parse("$(red)[!!]$(clear) ") + ".bar\r\n"
+        )
+        assert proto._transport.write.mock_calls[1] == call(b"JOIN #foo\r\n")
+        pipeline = proto._out_pipeline
+        assert pipeline is not None and pipeline.hooks == tuple(hooks)
+
+        await proto.send("JOIN #bar")
+        assert proto._out_pipeline is pipeline
+
+        proto.bot.plugin_manager.unregister_hooks(hooks[-1:])
+        await proto.send("JOIN #bar")
+        assert proto._out_pipeline is not pipeline
+
+    @pytest.mark.asyncio()
+    async def test_send_pipeline_drop(self):
+        conn = make_mock_conn()
+        proto = irc._IrcProtocol(conn)
+        proto.connection_made(MagicMock())
+        proto.bot.plugin_manager = PluginManager(proto.bot)
+
+        def drop(line):
+            return None
+
+        proto.bot.plugin_manager.register_hooks(
+            [make_out_hook(drop, inline=True)]
+        )
+        await proto.send("PRIVMSG #foo bar")
+        assert proto._transport.write.mock_calls == []
+
+
+@pytest.mark.parametrize(
+    "line,priority",
+    [
+        ("PING :foo", EventPriority.STATE),
+        (":server 353 me = #foo :a b c", EventPriority.STATE),
+        (":nick!user@host JOIN #foo", EventPriority.STATE),
+        (":nick!user@host PRIVMSG #foo :.cmd", EventPriority.COMMAND),
+        (":nick!user@host PRIVMSG #foo :me: cmd", EventPriority.COMMAND),
+        (":nick!user@host PRIVMSG me :cmd", EventPriority.COMMAND),
+        (":nick!user@host PRIVMSG #foo :hello", EventPriority.OTHER),
+        (":nick!user@host NOTICE #foo :.hello", EventPriority.OTHER),
+    ],
+)
+@pytest.mark.asyncio
+async def test_event_priority(line, priority):
+    conn = make_mock_conn()
+    conn.nick = "me"
+    proto = irc._IrcProtocol(conn)
+    event = proto.parse_line(line)
+    assert irc.get_event_priority(conn, event) is priority
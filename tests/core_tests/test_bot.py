@@ -104,6 +104,7 @@ async def test_start_plugin_reload(tmp_path):
     bot.running = True
     bot.plugin_reloading_enabled = True
     bot.config_reloading_enabled = True
+    bot.loop_watchdog_enabled = True
     bot.connections = {}
     bot.plugin_dir = plugin_dir = tmp_path / "plugins"
     await CloudBot._init_routine(bot)
@@ -112,6 +113,7 @@ async def test_start_plugin_reload(tmp_path):
         call.plugin_reloader.start(str(plugin_dir)),
         call.config_reloader.start(),
         call.observer.start(),
+        call.loop_watchdog.start(),
     ]
 
 
@@ -147,7 +149,7 @@ class TestProcessing:
             run_hooks.append(hook)
 
         full_hook = RawHook(plugin, hook._get_hook(coro, "irc_raw"))
-        bot.plugin_manager.catch_all_triggers.append(full_hook)
+        bot.plugin_manager.register_hooks([full_hook])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -184,8 +186,7 @@ class TestProcessing:
 
         full_hook = RawHook(plugin, hook._get_hook(coro, "irc_raw"))
         full_hook1 = RawHook(plugin, hook._get_hook(coro1, "irc_raw"))
-        bot.plugin_manager.catch_all_triggers.append(full_hook)
-        bot.plugin_manager.catch_all_triggers.append(full_hook1)
+        bot.plugin_manager.register_hooks([full_hook, full_hook1])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -218,8 +219,7 @@ class TestProcessing:
 
         full_hook = CommandHook(plugin, hook._get_hook(coro, "command"))
 
-        for cmd in full_hook.aliases:
-            bot.plugin_manager.commands[cmd] = full_hook
+        bot.plugin_manager.register_hooks([full_hook])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -252,8 +252,7 @@ class TestProcessing:
 
         full_hook = CommandHook(plugin, hook._get_hook(coro, "command"))
 
-        for cmd in full_hook.aliases:
-            bot.plugin_manager.commands[cmd] = full_hook
+        bot.plugin_manager.register_hooks([full_hook])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -287,10 +286,7 @@ class TestProcessing:
             run_hooks.append(hook)
 
         full_event_hook = EventHook(plugin, hook._get_hook(coro, "event"))
-        for event_type in full_event_hook.types:
-            bot.plugin_manager.event_type_hooks[event_type].append(
-                full_event_hook
-            )
+        bot.plugin_manager.register_hooks([full_event_hook])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -329,15 +325,7 @@ class TestProcessing:
 
         full_event_hook = EventHook(plugin, hook._get_hook(coro, "event"))
         full_event_hook1 = EventHook(plugin, hook._get_hook(coro1, "event"))
-        for event_type in full_event_hook.types:
-            bot.plugin_manager.event_type_hooks[event_type].append(
-                full_event_hook
-            )
-
-        for event_type in full_event_hook1.types:
-            bot.plugin_manager.event_type_hooks[event_type].append(
-                full_event_hook1
-            )
+        bot.plugin_manager.register_hooks([full_event_hook, full_event_hook1])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -369,7 +357,7 @@ class TestProcessing:
             run_hooks.append(hook)
 
         full_hook = RawHook(plugin, hook._get_hook(coro, "irc_raw"))
-        bot.plugin_manager.raw_triggers["PRIVMSG"].append(full_hook)
+        bot.plugin_manager.register_hooks([full_hook])
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
             [
@@ -405,8 +393,7 @@ class TestProcessing:
 
         full_hook = RawHook(plugin, hook._get_hook(coro, "irc_raw"))
         full_hook1 = RawHook(plugin, hook._get_hook(coro1, "irc_raw"))
-        bot.plugin_manager.raw_triggers["PRIVMSG"].append(full_hook)
-        bot.plugin_manager.raw_triggers["PRIVMSG"].append(full_hook1)
+        bot.plugin_manager.register_hooks([full_hook, full_hook1])
 
         await CloudBot.process(bot, event)
         assert sorted(run_hooks, key=id) == sorted(
@@ -433,7 +420,7 @@ async def test_reload_config(mock_bot_factory):
     plugin = MagicMock()
     config_hook = ConfigHook(plugin, hook._get_hook(coro, "config"))
 
-    bot.plugin_manager.config_hooks.append(config_hook)
+    bot.plugin_manager.register_hooks([config_hook])
 
     bot.config.load_config.assert_not_called()
     await CloudBot.reload_config(bot)
@@ -503,6 +490,7 @@ async def test_reloaders(tmp_path, config_enabled, plugin_enabled, unset_bot):
         bot = CloudBot(loop=asyncio.get_running_loop(), base_dir=tmp_path)
         assert bot.config_reloading_enabled is config_enabled
         assert bot.plugin_reloading_enabled is plugin_enabled
+        assert not bot.loop_watchdog_enabled
         bot.observer.stop()
 
 
@@ -1,8 +1,9 @@
+import asyncio
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 
-from cloudbot.client import Client
+from cloudbot.client import Client, EventPriority
 
 
 class MockClient(Client):  # pylint: disable=abstract-method
@@ -120,3 +121,121 @@ async def test_auto_reconnect(mock_bot_factory, mock_db):
     assert client.connected is False
     await client.auto_reconnect()
     assert client.connected is True
+
+
+@pytest.mark.asyncio
+async def test_event_queue_priority(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    client = MockClient(
+        bot, "foo", "foobot", config={"event_queue_size": 3, "event_workers": 1}
+    )
+    queue = client.event_queue
+    assert (queue.max_size, queue.workers) == (3, 1)
+
+    processed = []
+
+    async def process(event):
+        processed.append(event)
+
+    bot.process = process
+
+    assert queue.put("other1")
+    assert queue.put("command", EventPriority.COMMAND)
+    assert queue.put("other2")
+    # Full, so the newest lower priority event is dropped to make room
+    assert queue.put("state", EventPriority.STATE)
+    assert not queue.put("other3")
+    assert queue.put("state2", EventPriority.STATE)
+
+    assert queue.queue_depth == 3
+    assert queue.active_workers == 1
+
+    await asyncio.gather(*queue._tasks)
+
+    assert processed == ["state", "state2", "command"]
+    assert queue.stats() == {
+        "queue_depth": 0,
+        "max_depth": 3,
+        "active_workers": 0,
+        "processed": 3,
+        "dropped": {"state": 0, "command": 0, "other": 3},
+    }
+
+
+@pytest.mark.asyncio
+async def test_event_queue_state_over_limit(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    client = MockClient(bot, "foo", "foobot", config={"event_queue_size": 1})
+    queue = client.event_queue
+
+    async def process(event):
+        pass
+
+    bot.process = process
+
+    assert queue.put("command", EventPriority.COMMAND)
+    assert not queue.put("command2", EventPriority.COMMAND)
+    assert queue.put("state", EventPriority.STATE)
+    assert queue.put("state2", EventPriority.STATE)
+    assert queue.queue_depth == 2
+    assert queue.dropped[EventPriority.COMMAND] == 2
+
+    queue.clear()
+    assert queue.queue_depth == 0
+    await asyncio.gather(*queue._tasks)
+
+
+@pytest.mark.asyncio
+async def test_event_queue_concurrency(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    client = MockClient(bot, "foo", "foobot", config={"event_workers": 2})
+    queue = client.event_queue
+    release = asyncio.Event()
+    running = 0
+    peak = 0
+
+    async def process(event):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await release.wait()
+        running -= 1
+
+    bot.process = process
+
+    for i in range(5):
+        queue.put(i)
+
+    await asyncio.sleep(0.01)
+    # Only one event per worker is being processed, the rest stay queued
+    assert running == peak == 2
+    assert queue.active_workers == 2
+    assert queue.queue_depth == 3
+    assert queue.processed == 0
+
+    release.set()
+    await asyncio.gather(*queue._tasks)
+    assert peak == 2
+    assert queue.processed == 5
+
+
+@pytest.mark.asyncio
+async def test_event_queue_error(mock_bot_factory, mock_db, caplog):
+    bot = mock_bot_factory(db=mock_db)
+    client = MockClient(bot, "foo", "foobot")
+
+    async def process(event):
+        raise ValueError(event)
+
+    bot.process = process
+
+    caplog.clear()
+    client.event_queue.put("foo")
+    client.event_queue.put("bar")
+    await asyncio.gather(*client.event_queue._tasks)
+
+    assert client.event_queue.processed == 2
+    assert caplog.messages == [
+        "[foo] Error occurred while processing event",
+        "[foo] Error occurred while processing event",
+    ]
@@ -0,0 +1,230 @@
+import re
+from unittest.mock import MagicMock
+
+import pytest
+
+from cloudbot import hook
+from cloudbot.dispatch import (
+    CommandDispatcher,
+    RegexDispatcher,
+    RegexEntry,
+    build_cmd_regex,
+    get_prefilter,
+)
+from cloudbot.plugin import PluginManager
+from cloudbot.plugin_hooks import CommandHook, RegexHook
+
+
+class MockConn:
+    def __init__(self, nick, config=None):
+        self.nick = nick
+        self.config = config or {}
+
+
+def make_command(*names):
+    @hook.command(*names)
+    def func():
+        raise NotImplementedError
+
+    return CommandHook(MagicMock(), hook._get_hook(func, "command"))
+
+
+@pytest.mark.parametrize(
+    "text,is_pm,command,args",
+    [
+        (".foo bar", False, "foo", "bar"),
+        ("!foo bar", False, "foo", "bar"),
+        ("Bot: foo bar", False, "foo", "bar"),
+        ("bot, foo", False, "foo", ""),
+        ("foo bar", False, None, None),
+        ("foo bar", True, "foo", "bar"),
+    ],
+)
+def test_match(text, is_pm, command, args):
+    dispatcher = CommandDispatcher({}, "Bot", ".!", 0)
+    match = dispatcher.match(text, is_pm=is_pm)
+    if command is None:
+        assert match is None
+    else:
+        assert match.group("command") == command
+        assert match.group("text") == args
+
+
+def test_build_regex_escapes():
+    regex = build_cmd_regex("[", "a|b", is_pm=False)
+    assert regex.match("[foo")
+    assert regex.match("a|b: foo")
+    assert not regex.match("a: foo")
+
+
+def test_lookup_aliases():
+    cmd = make_command("foo", "fooz")
+    other = make_command("bar")
+    dispatcher = CommandDispatcher(
+        {"foo": cmd, "fooz": cmd, "bar": other}, "Bot", ".", 0
+    )
+    assert dispatcher.lookup("fooz") == (cmd, ["fooz"])
+    assert dispatcher.lookup("fo") == (None, ["foo", "fooz"])
+    assert dispatcher.lookup("ba") == (other, ["bar"])
+    assert dispatcher.lookup("z") == (None, [])
+
+
+def test_dispatcher_cache():
+    manager = PluginManager(MagicMock())
+    conn = MockConn("Bot")
+    manager.register_hooks([make_command("foo")])
+
+    dispatcher = manager.get_command_dispatcher(conn)
+    assert manager.get_command_dispatcher(conn) is dispatcher
+
+    conn.nick = "OtherBot"
+    new_dispatcher = manager.get_command_dispatcher(conn)
+    assert new_dispatcher is not dispatcher
+    assert new_dispatcher.match("OtherBot: foo", is_pm=False)
+
+    conn.config["command_prefix"] = "!"
+    assert manager.get_command_dispatcher(conn) is not new_dispatcher
+    dispatcher = manager.get_command_dispatcher(conn)
+
+    manager.register_hooks([make_command("bar")])
+    dispatcher = manager.get_command_dispatcher(conn)
+    assert dispatcher.lookup("bar")[0] is manager.commands["bar"]
+
+    other_conn = MockConn("Bot")
+    assert manager.get_command_dispatcher(other_conn) is not dispatcher
+
+    # A dispatcher for an older snapshot only has that snapshot's commands
+    snapshot = manager.registry
+    manager.register_hooks([make_command("baz")])
+    old_dispatcher = manager.get_command_dispatcher(conn, snapshot)
+    assert old_dispatcher.lookup("baz")[0] is None
+    assert old_dispatcher.lookup("bar")[0] is snapshot.commands["bar"]
+    assert manager.get_command_dispatcher(conn).lookup("baz")[0] is not None
+
+
+def make_regex_hook(*regexes, **kwargs):
+    @hook.regex(list(regexes), **kwargs)
+    def func():
+        raise NotImplementedError
+
+    return RegexHook(MagicMock(), hook._get_hook(func, "regex"))
+
+
+@pytest.mark.parametrize(
+    "pattern,literal,anchored",
+    [
+        (r"^s/(.*)/(.*)/?", "s/", True),
+        (r"\As/", "s/", True),
+        (r"(?m)^s/", "s/", False),
+        (r"^.*\+\+$", "++", False),
+        (r"(?i)HTTPS?://", "http", False),
+        (r"(?i)^\?foo", "?foo", True),
+        (r"(?i)ſtraße", None, False),
+        (r"(?:foo|bar)", None, False),
+        (r"(?i:foo)bar", "bar", False),
+        (r"(foo)+x", "foo", False),
+        (r"(foo)*x", "x", False),
+        (r"[abc]+", None, False),
+        (r"ab+c", "ab", False),
+        (r"^a{2,}b", "a", True),
+        (r"^a?bc", "bc", False),
+        (r"(?P<name>foo)bar", "foo", False),
+        (r"[]x]yz", "yz", False),
+        (r"\d+ apples", " apples", False),
+        (r"a{b", "a{b", False),
+        (r"(?#comment)foo", "foo", False),
+        (r"foo(?=bar)", "foo", False),
+        (r"foo|bar", None, False),
+        (r"\x41bc", None, False),
+        (r"(?x) f o o  # comment", "foo", False),
+        (r"(?x) foo \  bar", "foo bar", False),
+        (r"a\.b\tc", "a.b\tc", False),
+    ],
+)
+def test_get_prefilter(pattern, literal, anchored):
+    assert get_prefilter(re.compile(pattern)) == (literal, anchored)
+
+
+def test_get_prefilter_non_pattern():
+    assert get_prefilter(MagicMock()) == (None, False)
+    assert get_prefilter(re.compile(b"foo")) == (None, False)
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"^.*\+\+$",
+        r"(?i)^\?foo",
+        r"(?i)https?://\S+",
+        r"^s/(.*)/(.*)/?",
+        r"(?i)KEY",
+        r"foo(bar)+",
+        r"ab+c",
+        r"^a{2,}b",
+        r"^a?bc",
+        r"[]x]yz",
+        r"\d+ apples",
+    ],
+)
+@pytest.mark.parametrize(
+    "text",
+    [
+        "foo++",
+        "?FOO bar",
+        "see HTTPS://example.com",
+        "s/a/b/",
+        "the Key",
+        "ſ the key",
+        "foobarbar",
+        "",
+        "nothing here",
+        "abbbc",
+        "aab",
+        "bc and abc",
+        "]yz",
+        "12 apples",
+    ],
+)
+def test_prefilter_equivalent(pattern, text):
+    regex = re.compile(pattern)
+    entry = RegexEntry(regex, make_regex_hook(regex))
+    folded = text.lower() if text.isascii() else None
+    assert bool(entry.search(text, folded)) == bool(regex.search(text))
+
+
+def test_regex_dispatch_flags():
+    first = make_regex_hook(r"foo", priority=-1)
+    on_cmd = make_regex_hook(r"foo", run_on_cmd=True)
+    no_match = make_regex_hook(r"o", only_no_match=True)
+    other = make_regex_hook(r"bar", only_no_match=True)
+    dispatcher = RegexDispatcher(
+        [
+            (regex, h)
+            for h in (first, on_cmd, no_match, other)
+            for regex in h.regexes
+        ]
+    )
+
+    assert [h for h, _ in dispatcher.search("foo")] == [first, on_cmd]
+    assert [h for h, _ in dispatcher.search("foo", matched_command=True)] == [
+        on_cmd
+    ]
+    assert [h for h, _ in dispatcher.search("bar")] == [other]
+    assert [h for h, _ in dispatcher.search("o")] == [no_match]
+
+
+def test_regex_dispatch_counters():
+    hook_a = make_regex_hook(r"^s/")
+    hook_b = make_regex_hook(r"bar")
+    pairs = [(regex, h) for h in (hook_a, hook_b) for regex in h.regexes]
+    dispatcher = RegexDispatcher(pairs)
+
+    list(dispatcher.search("s/a/b"))
+    list(dispatcher.search("foo bar"))
+    entry_a, entry_b = dispatcher.entries
+    assert (entry_a.checked, entry_a.skipped, entry_a.matched) == (2, 1, 1)
+    assert entry_a.match_rate == 0.5
+    assert (entry_b.checked, entry_b.skipped, entry_b.matched) == (2, 1, 1)
+
+    rebuilt = RegexDispatcher(pairs[1:], previous=dispatcher)
+    assert rebuilt.entries == [entry_b]
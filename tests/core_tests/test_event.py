@@ -1,10 +1,23 @@
+import threading
+import tracemalloc
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 from irclib.parser import Message
 
+from cloudbot import event as event_mod
 from cloudbot import hook
-from cloudbot.event import Event, IrcOutEvent
+from cloudbot.event import (
+    CommandEvent,
+    CommandEventView,
+    Event,
+    EventType,
+    EventView,
+    IrcOutEvent,
+    RegexEvent,
+    RegexEventView,
+)
+from cloudbot.plugin_hooks import EventHook
 from tests.util.mock_module import MockModule
 
 
@@ -233,3 +246,202 @@ async def test_irc_out_prepare_error():
         await event.prepare()
 
     assert event.parsed_line is None
+
+
+@pytest.mark.asyncio()
+async def test_prepare_db_pinned(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    _hook = MagicMock(required_args=["db"])
+    event = Event(bot=bot, hook=_hook)
+    other = Event(bot=bot, hook=_hook)
+    await event.prepare()
+    await other.prepare()
+    assert bot.db_executor_pool.pinned == 0
+    assert event.db is not other.db
+    assert event.db.bind is mock_db.engine
+
+    thread = await event.async_call(threading.get_ident)
+    assert await event.async_call(threading.get_ident) == thread
+    await other.async_call(threading.get_ident)
+    assert bot.db_executor_pool.pinned == 2
+
+    await event.close()
+    await other.close()
+    assert event.db is None
+    assert event.db_executor is None
+    assert bot.db_executor_pool.pinned == 0
+
+
+@pytest.mark.asyncio()
+async def test_prepare_db_error(mock_bot_factory):
+    bot = mock_bot_factory()
+    event = Event(bot=bot, hook=MagicMock(required_args=["db"]))
+    with patch("cloudbot.event.Session") as mocked:
+        mocked.session_factory.side_effect = ValueError()
+        await event.prepare()
+        with pytest.raises(ValueError):
+            getattr(event.db, "query")
+
+    assert not event.db.opened
+    await event.close()
+    assert event.db_executor is None
+    assert bot.db_executor_pool.pinned == 0
+
+
+def make_db_hook():
+    @hook.event(EventType.message)
+    def func(db):
+        raise NotImplementedError
+
+    return EventHook(MagicMock(), hook._get_hook(func, "event"))
+
+
+@pytest.mark.asyncio()
+async def test_prepare_db_lazy(mock_bot_factory, mock_db):
+    bot = mock_bot_factory(db=mock_db)
+    _hook = make_db_hook()
+    unused = Event(bot=bot, hook=_hook)
+    used = Event(bot=bot, hook=_hook)
+    await unused.prepare()
+    await used.prepare()
+    assert not unused.db.opened
+    assert not used.db.opened
+
+    assert used.db.bind is mock_db.engine
+    assert used.db.opened
+    assert used.db.get_session() is used.db.get_session()
+
+    await unused.close()
+    await used.close()
+    assert unused.db is None
+    assert used.db is None
+    assert bot.db_executor_pool.pinned == 0
+    assert (_hook.db_sessions_requested, _hook.db_sessions_used) == (2, 1)
+
+
+def test_prepare_db_lazy_threaded(mock_db):
+    _hook = make_db_hook()
+    unused = Event(hook=_hook)
+    unused.prepare_threaded()
+    assert not unused.db.opened
+    unused.close_threaded()
+    assert unused.db is None
+
+    used = Event(hook=_hook)
+    used.prepare_threaded()
+    assert used.db.get_bind() is mock_db.engine
+    used.close_threaded()
+    assert used.db is None
+    assert (_hook.db_sessions_requested, _hook.db_sessions_used) == (2, 1)
+
+
+def make_base_event():
+    return Event(
+        bot=MagicMock(),
+        conn=MagicMock(),
+        event_type=EventType.message,
+        content="foo bar",
+        content_raw="foo bar",
+        channel="#foo",
+        nick="nick",
+        user="user",
+        host="host",
+        mask="nick!user@host",
+        irc_raw=":nick!user@host PRIVMSG #foo :foo bar",
+        irc_command="PRIVMSG",
+        irc_paramlist=["#foo", "foo bar"],
+    )
+
+
+def test_event_view():
+    base = make_base_event()
+    _hook = make_db_hook()
+    view = EventView(_hook, base)
+    copy = Event(hook=_hook, base_event=base)
+
+    assert dict(view) == dict(copy)
+    assert len(view) == len(copy)
+    assert view.hook is _hook
+    assert view.chan == "#foo"
+    assert view["nick"] == "nick"
+    assert view.event is view
+
+    view.content = "changed"
+    assert view.content == "changed"
+    assert view["content"] == "changed"
+    assert base.content == "foo bar"
+    assert len(view) == len(copy)
+
+    assert not hasattr(view, "__dict__")
+    with pytest.raises(AttributeError):
+        setattr(view, "extra", 1)
+
+    with pytest.raises(AttributeError):
+        getattr(view, "not_a_field")
+
+    with pytest.raises(KeyError):
+        _ = view["not_a_field"]
+
+
+def test_command_event_view():
+    base = make_base_event()
+    base.conn.config = {}
+    _hook = MagicMock(doc="<foo> - bar")
+    view = CommandEventView(
+        _hook, base, text="bar", triggered_command="foo", cmd_prefix="."
+    )
+    copy = CommandEvent(
+        hook=_hook,
+        text="bar",
+        triggered_command="foo",
+        cmd_prefix=".",
+        base_event=base,
+    )
+    assert isinstance(view, CommandEvent)
+    assert dict(view) == dict(copy)
+
+    view.notice_doc()
+    base.conn.notice.assert_called_once_with("nick", ".foo <foo> - bar")
+
+
+def test_regex_event_view():
+    base = make_base_event()
+    _hook = MagicMock()
+    match = MagicMock()
+    view = RegexEventView(_hook, base, match=match)
+    assert isinstance(view, RegexEvent)
+    assert dict(view) == dict(
+        RegexEvent(hook=_hook, match=match, base_event=base)
+    )
+
+
+def test_event_view_size():
+    base = make_base_event()
+    _hook = make_db_hook()
+    # Ignore allocations made by threads left over from other tests
+    filters = [
+        tracemalloc.Filter(True, __file__),
+        tracemalloc.Filter(True, event_mod.__file__),
+    ]
+
+    def allocated_since(start):
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        return sum(
+            stat.size_diff for stat in snapshot.compare_to(start, "lineno")
+        )
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.take_snapshot().filter_traces(filters)
+        copies = [Event(hook=_hook, base_event=base) for _ in range(100)]
+        copy_size = allocated_since(start)
+        del copies
+
+        start = tracemalloc.take_snapshot().filter_traces(filters)
+        views = [EventView(_hook, base) for _ in range(100)]
+        view_size = allocated_since(start)
+        del views
+    finally:
+        tracemalloc.stop()
+
+    assert view_size < copy_size * 0.7
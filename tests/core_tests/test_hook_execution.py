@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+from cloudbot import hook, plugin_hooks
+from cloudbot.event import CommandEvent
+from tests.util.mock_module import MockModule
+
+
+@pytest_asyncio.fixture()
+async def mock_bot(mock_bot_factory, tmp_path):
+    tmp_base = tmp_path / "tmp"
+    tmp_base.mkdir(exist_ok=True)
+
+    yield mock_bot_factory(base_dir=tmp_base)
+
+
+@pytest.fixture()
+def mock_manager(mock_bot):
+    yield mock_bot.plugin_manager
+
+
+async def load_inline_hooks(mock_manager, patch_import_module):
+    threads = {}
+
+    @hook.command("explicit", inline=True, do_sieve=False)
+    def explicit_cb():
+        threads["explicit"] = threading.get_ident()
+
+    @hook.command("auto", do_sieve=False)
+    def auto_cb():
+        threads["auto"] = threading.get_ident()
+
+    @hook.command("never", inline=False, do_sieve=False)
+    def never_cb():
+        threads["never"] = threading.get_ident()
+
+    @hook.command("withdb", do_sieve=False)
+    def db_cb(db):
+        threads["withdb"] = threading.get_ident()
+
+    patch_import_module.return_value = MockModule(
+        explicit_cb=explicit_cb, auto_cb=auto_cb, never_cb=never_cb, db_cb=db_cb
+    )
+
+    await mock_manager.load_plugin(
+        mock_manager.bot.base_dir / "plugins/test.py"
+    )
+    return threads
+
+
+async def launch_command(mock_manager, name):
+    event = CommandEvent(
+        bot=mock_manager.bot,
+        hook=mock_manager.commands[name],
+        cmd_prefix=".",
+        text="",
+        triggered_command=name,
+    )
+    assert await mock_manager.launch(event.hook, event)
+
+
+@pytest.mark.asyncio
+async def test_inline_hooks(mock_manager, patch_import_module, monkeypatch):
+    monkeypatch.setattr(plugin_hooks, "INLINE_PROBE_RUNS", 2)
+    mock_manager.bot.config["auto_inline_hooks"] = True
+    threads = await load_inline_hooks(mock_manager, patch_import_module)
+    commands = mock_manager.commands
+    loop_thread = threading.get_ident()
+
+    assert commands["explicit"].inline
+    assert not commands["explicit"].auto_inline
+    assert commands["auto"].auto_inline
+    assert not commands["never"].auto_inline
+    assert not commands["withdb"].auto_inline
+
+    for _ in range(2):
+        for name in ("explicit", "auto", "never", "withdb"):
+            await launch_command(mock_manager, name)
+
+        assert threads["explicit"] == loop_thread
+        assert threads["auto"] != loop_thread
+        assert threads["never"] != loop_thread
+        assert threads["withdb"] != loop_thread
+
+    assert commands["auto"].inline
+    await launch_command(mock_manager, "auto")
+    assert threads["auto"] == loop_thread
+
+
+@pytest.mark.asyncio
+async def test_inline_hooks_demote(
+    mock_manager, patch_import_module, monkeypatch, caplog
+):
+    monkeypatch.setattr(plugin_hooks, "INLINE_PROBE_RUNS", 1)
+    mock_manager.bot.config["auto_inline_hooks"] = True
+    await load_inline_hooks(mock_manager, patch_import_module)
+    auto = mock_manager.commands["auto"]
+
+    await launch_command(mock_manager, "auto")
+    assert auto.inline
+
+    monkeypatch.setattr(plugin_hooks, "INLINE_DEMOTE_TIME", -1)
+    caplog.clear()
+    await launch_command(mock_manager, "auto")
+    assert not auto.inline
+    assert not auto.auto_inline
+    assert "moving it back to the thread pool" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_inline_hooks_slow_probe(
+    mock_manager, patch_import_module, monkeypatch
+):
+    monkeypatch.setattr(plugin_hooks, "INLINE_PROBE_RUNS", 1)
+    monkeypatch.setattr(plugin_hooks, "INLINE_MAX_TIME", -1)
+    mock_manager.bot.config["auto_inline_hooks"] = True
+    await load_inline_hooks(mock_manager, patch_import_module)
+    auto = mock_manager.commands["auto"]
+
+    await launch_command(mock_manager, "auto")
+    assert not auto.inline
+    assert not auto.auto_inline
+
+
+@pytest.mark.asyncio
+async def test_auto_inline_disabled(
+    mock_manager, patch_import_module, monkeypatch
+):
+    monkeypatch.setattr(plugin_hooks, "INLINE_PROBE_RUNS", 1)
+    threads = await load_inline_hooks(mock_manager, patch_import_module)
+    loop_thread = threading.get_ident()
+    auto = mock_manager.commands["auto"]
+
+    for _ in range(3):
+        await launch_command(mock_manager, "auto")
+        assert threads["auto"] != loop_thread
+
+    assert not auto.inline
+    assert auto.inline_probes == 0
+
+
+@pytest.mark.asyncio
+async def test_hook_latency(mock_manager, patch_import_module):
+    await load_inline_hooks(mock_manager, patch_import_module)
+    commands = mock_manager.commands
+
+    await launch_command(mock_manager, "explicit")
+    await launch_command(mock_manager, "never")
+
+    explicit = commands["explicit"]
+    never = commands["never"]
+    assert explicit.wall_time.count == never.wall_time.count == 1
+    assert explicit.executor_wait.count == 0
+    assert never.executor_wait.count == 1
+    assert never.wall_time.max >= never.executor_wait.max
+    # Plain events don't record when their line was received
+    assert explicit.queue_wait.count == never.queue_wait.count == 0
+
+    event = CommandEvent(
+        bot=mock_manager.bot,
+        hook=never,
+        cmd_prefix=".",
+        text="",
+        triggered_command="never",
+    )
+    event.received = time.perf_counter() - 1  # type: ignore[attr-defined]
+    assert await mock_manager.launch(never, event)
+    assert never.queue_wait.count == 1
+    assert never.queue_wait.max >= 1
+
+
+async def load_slow_hooks(mock_manager, patch_import_module):
+    @hook.command("slowasync", do_sieve=False)
+    async def slow_async_cb():
+        await asyncio.sleep(0.2)
+
+    @hook.command("slowthread", inline=False, do_sieve=False)
+    def slow_thread_cb():
+        time.sleep(0.2)
+
+    @hook.command("slowinline", inline=True, do_sieve=False)
+    def slow_inline_cb():
+        time.sleep(0.02)
+
+    patch_import_module.return_value = MockModule(
+        slow_async_cb=slow_async_cb,
+        slow_thread_cb=slow_thread_cb,
+        slow_inline_cb=slow_inline_cb,
+    )
+
+    await mock_manager.load_plugin(
+        mock_manager.bot.base_dir / "plugins/test.py"
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "name,func_name",
+    [("slowasync", "slow_async_cb"), ("slowthread", "slow_thread_cb")],
+)
+async def test_slow_hook_stack(
+    mock_manager, patch_import_module, caplog, name, func_name
+):
+    mock_manager.slow_hook_threshold = 0.05
+    await load_slow_hooks(mock_manager, patch_import_module)
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, "cloudbot"):
+        await launch_command(mock_manager, name)
+
+    records = [
+        record
+        for record in caplog.records
+        if "has been running for over" in record.getMessage()
+    ]
+    assert len(records) == 1
+    message = records[0].getMessage()
+    assert func_name in message
+    assert "sleep" in message
+
+
+@pytest.mark.asyncio
+async def test_slow_hook_inline(mock_manager, patch_import_module, caplog):
+    mock_manager.slow_hook_threshold = 0.01
+    await load_slow_hooks(mock_manager, patch_import_module)
+
+    loop = mock_manager.bot.loop
+    caplog.clear()
+    with (
+        caplog.at_level(logging.WARNING, "cloudbot"),
+        patch.object(loop, "call_later", wraps=loop.call_later) as call_later,
+    ):
+        await launch_command(mock_manager, "slowinline")
+
+    # No timer is armed for inline hooks
+    assert not [
+        c
+        for c in call_later.mock_calls
+        if mock_manager._report_slow_hook in c.args
+    ]
+    assert "slow_inline_cb took" in caplog.text
+    assert "has been running for over" not in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_slow_hook_disabled(mock_manager, patch_import_module, caplog):
+    mock_manager.slow_hook_threshold = 0
+    await load_slow_hooks(mock_manager, patch_import_module)
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, "cloudbot"):
+        await launch_command(mock_manager, "slowinline")
+
+    assert "slow_inline_cb" not in caplog.text
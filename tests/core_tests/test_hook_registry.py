@@ -0,0 +1,155 @@
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+from cloudbot import hook
+from cloudbot.event import EventType
+from cloudbot.hook import Priority
+from cloudbot.hook_registry import HookRegistry
+from cloudbot.plugin_hooks import (
+    CommandHook,
+    EventHook,
+    PermHook,
+    RawHook,
+    RegexHook,
+    SieveHook,
+)
+
+
+def make_hook(hook_cls, hook_type, decorator):
+    def func():
+        raise NotImplementedError
+
+    decorator(func)
+    return hook_cls(MagicMock(title="test"), hook._get_hook(func, hook_type))
+
+
+def make_command(*names):
+    return make_hook(CommandHook, "command", hook.command(*names))
+
+
+def make_raw(*triggers, **kwargs):
+    return make_hook(RawHook, "irc_raw", hook.irc_raw(triggers, **kwargs))
+
+
+def test_priority_order():
+    low = make_raw("PRIVMSG", priority=Priority.LOW)
+    normal = make_raw("PRIVMSG")
+    normal2 = make_raw("PRIVMSG")
+    high = make_raw("PRIVMSG", priority=Priority.HIGH)
+
+    registry = HookRegistry().with_hooks([low, normal])
+    registry = registry.with_hooks([high, normal2])
+
+    # Hooks with the same priority stay in the order they were added
+    assert registry.raw_triggers["PRIVMSG"] == (high, normal, normal2, low)
+
+
+def test_snapshots_unchanged():
+    event_hook = make_hook(
+        EventHook, "event", hook.event([EventType.message, EventType.join])
+    )
+    catch_all = make_raw("*")
+    empty = HookRegistry()
+
+    registry = empty.with_hooks([event_hook, catch_all])
+    assert registry.version == 1
+    assert empty.version == 0
+    assert not empty.event_type_hooks
+    assert not empty.catch_all_triggers
+    assert registry.event_type_hooks == {
+        EventType.message: (event_hook,),
+        EventType.join: (event_hook,),
+    }
+    assert registry.catch_all_triggers == (catch_all,)
+
+    removed = registry.without_hooks([event_hook])
+    assert removed.version == 2
+    # Keys without any hooks are dropped
+    assert not removed.event_type_hooks
+    assert EventType.join in registry.event_type_hooks
+    # Collections which weren't changed are shared
+    assert removed.catch_all_triggers is registry.catch_all_triggers
+
+    with pytest.raises(TypeError):
+        registry.event_type_hooks[EventType.part] = ()  # type: ignore[index]
+
+
+def test_command_conflict(caplog):
+    cmd = make_command("foo", "bar")
+    other = make_command("foo", "baz")
+
+    registry = HookRegistry().with_hooks([cmd])
+    assert registry.commands_version == 1
+    with caplog.at_level(logging.WARNING, "cloudbot"):
+        registry = registry.with_hooks([other])
+
+    assert registry.commands == {"foo": cmd, "bar": cmd, "baz": other}
+    assert registry.commands_version == 2
+    assert caplog.record_tuples == [
+        (
+            "cloudbot",
+            logging.WARNING,
+            "Plugin test attempted to register command foo which was already "
+            "registered by test. Ignoring new assignment.",
+        )
+    ]
+
+    # Removing the hook which lost the conflict keeps the winner's alias
+    registry = registry.without_hooks([other])
+    assert registry.commands == {"foo": cmd, "bar": cmd}
+    assert registry.commands_version == 3
+    assert registry.with_hooks([]).commands_version == 3
+
+
+def test_replace_hooks():
+    old = make_command("foo", "bar")
+    new = make_command("foo", "bar")
+    other = make_command("baz")
+
+    registry = HookRegistry().with_hooks([old, other])
+    replaced = registry.replace_hooks([old], [new])
+    assert replaced.version == registry.version + 1
+    assert replaced.commands == {"foo": new, "bar": new, "baz": other}
+    assert replaced.commands_version == registry.commands_version + 1
+    assert registry.commands == {"foo": old, "bar": old, "baz": other}
+
+
+def test_regex_dispatcher():
+    regex_hook = make_hook(RegexHook, "regex", hook.regex("foo"))
+    other_hook = make_hook(RegexHook, "regex", hook.regex("bar"))
+
+    registry = HookRegistry().with_hooks([regex_hook])
+    (entry,) = registry.regex_dispatcher.entries
+    updated = registry.with_hooks([other_hook])
+    assert updated.regex_dispatcher.entries[0] is entry
+    assert [
+        match_hook
+        for match_hook, _ in updated.regex_dispatcher.search("foo bar")
+    ] == [regex_hook, other_hook]
+
+    assert (
+        updated.with_hooks([make_command("x")]).regex_dispatcher
+        is updated.regex_dispatcher
+    )
+
+
+def test_sieve_chain():
+    @hook.sieve(hook_types=["command"])
+    def sieve_func(_bot, _event, _hook):
+        raise NotImplementedError
+
+    sieve = SieveHook(MagicMock(), hook._get_hook(sieve_func, "sieve"))
+    perm_hook = make_hook(PermHook, "perm_check", hook.permission("foo"))
+
+    registry = HookRegistry().with_hooks([sieve, perm_hook])
+    chain = registry.get_sieve_chain("command")
+    assert chain == (sieve,)
+    assert registry.get_sieve_chain("regex") == ()
+    assert registry.with_hooks([]).get_sieve_chain("command") is chain
+
+    removed = registry.without_hooks([sieve])
+    assert removed.get_sieve_chain("command") == ()
+    assert registry.get_sieve_chain("command") is chain
+    assert removed.perm_hooks == {"foo": (perm_hook,)}
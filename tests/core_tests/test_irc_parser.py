@@ -0,0 +1,198 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from irclib.parser import Message
+
+from cloudbot import hook
+from cloudbot.clients import irc
+from cloudbot.clients.irc_line import IrcLineEvent
+from cloudbot.event import Event, EventType
+from cloudbot.plugin import PluginManager
+from cloudbot.plugin_hooks import CommandHook, EventHook, RawHook
+from tests.util import get_data_file
+
+
+@pytest.fixture(scope="module")
+def traffic():
+    with get_data_file("irc_traffic.txt").open(encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def make_proto(plugin_manager=None):
+    conn = MagicMock()
+    conn.name = "testconn"
+    conn.nick = "BotNick"
+    conn.config = {}
+    conn.loop = asyncio.get_running_loop()
+    if plugin_manager is not None:
+        conn.bot.plugin_manager = plugin_manager
+
+    return irc._IrcProtocol(conn)
+
+
+@pytest.mark.asyncio
+async def test_parse_traffic(traffic):
+    proto = make_proto()
+    for line in traffic:
+        message = Message.parse(line)
+        event = proto.parse_line(line)
+        assert event.irc_raw == line
+        assert event.irc_command == message.command
+        assert event.irc_paramlist == message.parameters
+        assert event.irc_tags == message.tags
+        prefix = message.prefix
+        if prefix is None:
+            assert event.mask is event.nick is event.irc_prefix is None
+        else:
+            assert event.mask == event.irc_prefix == prefix.mask
+            assert (event.nick, event.user, event.host) == (
+                prefix.nick,
+                prefix.user,
+                prefix.host,
+            )
+
+        # Copies see the same values
+        copy = Event(hook=MagicMock(), base_event=event)
+        assert {k: v for k, v in copy.items() if k != "hook"} == {
+            k: v for k, v in event.items() if k != "hook"
+        }
+
+
+@pytest.mark.asyncio
+async def test_lazy_fields():
+    proto = make_proto()
+    event = proto.parse_line(
+        "@time=now :nick!user@host PRIVMSG #Chan :\x07hi there"
+    )
+    assert isinstance(event, IrcLineEvent)
+    assert event.type is EventType.message
+    assert not hasattr(event, "__dict__") or not event.__dict__
+
+    with pytest.raises(AttributeError):
+        object.__getattribute__(event, "content")
+
+    assert event.content == "hi there"
+    assert object.__getattribute__(event, "content") == "hi there"
+    assert event.chan == "#chan"
+    assert event["nick"] == "nick"
+
+    event.chan = "#other"
+    assert event.chan == "#other"
+
+    with pytest.raises(AttributeError):
+        getattr(event, "not_a_field")
+
+    with pytest.raises(KeyError):
+        _ = event["not_a_field"]
+
+    assert len(event) == len(IrcLineEvent.fields)
+    assert set(event) == set(IrcLineEvent.fields)
+
+
+def make_command(*names):
+    @hook.command(*names)
+    def func():
+        raise NotImplementedError
+
+    return CommandHook(MagicMock(), hook._get_hook(func, "command"))
+
+
+def make_raw_hook(*triggers):
+    @hook.irc_raw(list(triggers))
+    def func():
+        raise NotImplementedError
+
+    return RawHook(MagicMock(), hook._get_hook(func, "irc_raw"))
+
+
+def make_event_hook(*types):
+    @hook.event(list(types))
+    def func():
+        raise NotImplementedError
+
+    return EventHook(MagicMock(), hook._get_hook(func, "event"))
+
+
+def test_hooks_want_command():
+    manager = PluginManager(MagicMock())
+    assert not irc.hooks_want_command(manager, "PRIVMSG")
+    assert not irc.hooks_want_command(manager, "001")
+
+    manager.register_hooks([make_raw_hook("001")])
+    assert irc.hooks_want_command(manager, "001")
+    assert not irc.hooks_want_command(manager, "002")
+
+    manager.register_hooks([make_event_hook(EventType.join)])
+    assert irc.hooks_want_command(manager, "JOIN")
+    assert not irc.hooks_want_command(manager, "PART")
+
+    manager.register_hooks([make_event_hook(EventType.other)])
+    assert irc.hooks_want_command(manager, "PRIVMSG")
+    assert irc.hooks_want_command(manager, "002")
+
+    manager = PluginManager(MagicMock())
+    manager.register_hooks([make_command("foo")])
+    assert irc.hooks_want_command(manager, "PRIVMSG")
+    assert not irc.hooks_want_command(manager, "NOTICE")
+
+    manager.register_hooks([make_raw_hook("*")])
+    assert irc.hooks_want_command(manager, "NOTICE")
+
+
+@pytest.mark.asyncio
+async def test_skip_unwanted_lines(traffic):
+    manager = PluginManager(MagicMock())
+    manager.register_hooks([make_raw_hook("PRIVMSG")])
+    proto = make_proto(manager)
+    proto.data_received(("\r\n".join(traffic) + "\r\n").encode())
+
+    privmsgs = sum(" PRIVMSG " in line for line in traffic)
+    pings = sum(line.startswith("PING ") for line in traffic)
+    assert proto.conn.event_queue.put.call_count == privmsgs + pings
+    assert proto.skipped_lines == len(traffic) - privmsgs - pings
+    proto.conn.send.assert_called_once_with("PONG irc.example.net", log=False)
+
+
+def parsed_fields(event):
+    parsed = set()
+    for name in IrcLineEvent.lazy_fields:
+        try:
+            object.__getattribute__(event, name)
+        except AttributeError:
+            continue
+
+        parsed.add(name)
+
+    return parsed
+
+
+@pytest.mark.asyncio
+async def test_lazy_traffic(traffic):
+    """
+    Lazy fields are only parsed when they're accessed, and then match what
+    `Message.parse` gives for recorded traffic
+    """
+    proto = make_proto()
+    proto.conn.send = lambda *args, **kwargs: None
+
+    for line in traffic:
+        event = proto.parse_line(line)
+        message = Message.parse(line)
+        # Messages are checked for CTCP and pings are answered up front
+        if event.irc_command == "PRIVMSG":
+            parsed = {"content_raw", "irc_paramlist"}
+        elif event.irc_command == "PING":
+            parsed = {"irc_paramlist"}
+        else:
+            parsed = set()
+
+        assert parsed_fields(event) == parsed
+
+        assert event.irc_paramlist == message.parameters
+        assert event.nick == (message.prefix and message.prefix.nick)
+        parsed |= {"irc_paramlist", "nick"}
+        assert parsed_fields(event) == parsed
+
+        dict(event)
+        assert parsed_fields(event) == set(IrcLineEvent.lazy_fields)
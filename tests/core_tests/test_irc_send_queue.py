@@ -0,0 +1,124 @@
+import asyncio
+from asyncio import CancelledError
+from unittest.mock import MagicMock, call
+
+import pytest
+
+from cloudbot.clients import irc
+
+
+def make_send_client(config=None):
+    bot = MagicMock(loop=asyncio.get_running_loop())
+    bot.plugin_manager.out_sieves = []
+    client = irc.IrcClient(
+        bot,
+        "irc",
+        "foo",
+        "bar",
+        config={"connection": {"server": "server"}, **(config or {})},
+    )
+    proto = irc._IrcProtocol(client)
+    proto._connected = True
+    proto._transport = MagicMock()
+    client._protocol = proto
+    return client, proto._transport
+
+
+@pytest.mark.asyncio
+async def test_send_queue_order(mock_db):
+    client, transport = make_send_client()
+    client._send("PRIVMSG #foo :a")
+    client._send("PRIVMSG #foo :b")
+    client._send("PONG :server")
+    client._send("NOTICE #foo :c")
+
+    assert client.send_queue.stats()["queued"] == {"protocol": 1, "chat": 3}
+
+    await client.send_queue._task
+
+    assert transport.write.mock_calls == [
+        call(b"PONG :server\r\n"),
+        call(b"PRIVMSG #foo :a\r\n"),
+        call(b"PRIVMSG #foo :b\r\n"),
+        call(b"NOTICE #foo :c\r\n"),
+    ]
+    stats = client.send_queue.stats()
+    assert stats["queue_length"] == 0
+    assert stats["sent"] == 4
+    assert stats["max_latency"] >= stats["avg_latency"] > 0
+    assert client.lines_out == 4
+    assert client.bytes_out == 64
+
+
+@pytest.mark.asyncio
+async def test_send_queue_flood_control(mock_db):
+    client, transport = make_send_client(
+        {"flood_control": {"tokens": 2, "restore_rate": 100}}
+    )
+    for i in range(4):
+        client._send(f"PRIVMSG #foo :{i}")
+
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert len(transport.write.mock_calls) == 2
+    assert len(client.send_queue) == 2
+
+    client._send("PONG :server")
+    await client.send_queue._task
+    assert transport.write.mock_calls[2] == call(b"PONG :server\r\n")
+    assert len(transport.write.mock_calls) == 5
+
+
+@pytest.mark.asyncio
+async def test_send_queue_no_flood_control(mock_db):
+    client, transport = make_send_client(
+        {"flood_control": {"tokens": 1, "restore_rate": 0, "enabled": False}}
+    )
+    for i in range(4):
+        client._send(f"PRIVMSG #foo :{i}")
+
+    await client.send_queue._task
+    assert len(transport.write.mock_calls) == 4
+
+
+@pytest.mark.asyncio
+async def test_send_queue_connection_lost(mock_db):
+    client, transport = make_send_client(
+        {"flood_control": {"tokens": 1, "restore_rate": 100}}
+    )
+    old_proto = client._protocol
+    client._send("PRIVMSG #foo :old")
+    client._send("PRIVMSG #foo :old2")
+    await asyncio.sleep(0)
+    assert transport.write.mock_calls == [call(b"PRIVMSG #foo :old\r\n")]
+
+    new_client, new_transport = make_send_client()
+    client._protocol = new_client._protocol
+    new_client._protocol.conn = client
+    client._send("PRIVMSG #foo :new")
+
+    old_proto.connection_lost(None)
+    assert len(client.send_queue) == 1
+
+    await client.send_queue._task
+    assert transport.write.mock_calls == [call(b"PRIVMSG #foo :old\r\n")]
+    assert new_transport.write.mock_calls == [call(b"PRIVMSG #foo :new\r\n")]
+
+
+@pytest.mark.asyncio
+async def test_send_queue_close(mock_db):
+    client, transport = make_send_client(
+        {"flood_control": {"tokens": 1, "restore_rate": 1}}
+    )
+    client._send("PRIVMSG #foo :a")
+    client._send("PRIVMSG #foo :b")
+    await asyncio.sleep(0)
+    task = client.send_queue._task
+    assert task is not None
+
+    client.close()
+    assert len(client.send_queue) == 0
+    with pytest.raises(CancelledError):
+        await task
+
+    assert transport.write.mock_calls == [call(b"PRIVMSG #foo :a\r\n")]
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from cloudbot.loop_watchdog import LoopWatchdog
+
+
+def make_watchdog(*conns, **kwargs):
+    bot = MagicMock()
+    bot.loop = asyncio.get_running_loop()
+    bot.connections = {conn.name: conn for conn in conns}
+    return LoopWatchdog(bot, **kwargs)
+
+
+def make_conn(name, connected=True):
+    conn = MagicMock()
+    conn.name = name
+    conn.connected = connected
+    return conn
+
+
+def blocking_call():
+    time.sleep(0.5)
+
+
+@pytest.mark.asyncio
+async def test_detect_stall():
+    conn = make_conn("foo")
+    watchdog = make_watchdog(conn, interval=0.02, threshold=0.1)
+    watchdog.start()
+    try:
+
+        async def blocker():
+            blocking_call()
+
+        await asyncio.sleep(0.05)
+        await asyncio.create_task(blocker(), name="blocker-task")
+        # Let the report run now that the loop is free
+        await asyncio.sleep(0.05)
+    finally:
+        watchdog.stop()
+
+    assert not watchdog.running
+    assert watchdog.stalls == 1
+    stall = watchdog.last_stall
+    assert stall is not None
+    assert stall.lag >= 0.1
+    assert stall.task_name == "blocker-task"
+    assert "in blocking_call" in stall.location
+    assert "blocker" in stall.format()
+    assert watchdog.lag.max >= 0.1
+
+    conn.admin_log.assert_called_once()
+    message = conn.admin_log.call_args[0][0]
+    assert "blocker-task" in message
+    assert "blocking_call" in message
+
+
+@pytest.mark.asyncio
+async def test_no_stall():
+    conn = make_conn("foo")
+    watchdog = make_watchdog(conn, interval=0.01, threshold=0.5)
+    watchdog.start()
+    watchdog.start()
+    try:
+        await asyncio.sleep(0.1)
+    finally:
+        watchdog.stop()
+
+    watchdog.stop()
+    assert watchdog.stalls == 0
+    assert watchdog.last_stall is None
+    assert watchdog.lag.count > 0
+    conn.admin_log.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_check():
+    watchdog = make_watchdog(interval=1, threshold=1)
+    assert watchdog.check() is None
+
+    watchdog._last_beat = time.monotonic() - 5
+    stall = watchdog.check()
+    assert stall is not None
+    # The loop thread was never recorded, so there's no stack
+    assert stall.location == "unknown location"
+    assert stall.task_name != "no task"
+
+    # Only reported once per stall
+    assert watchdog.check() is None
+    assert watchdog.stalls == 1
+
+
+@pytest.mark.asyncio
+async def test_report():
+    connected = make_conn("foo")
+    disconnected = make_conn("bar", connected=False)
+    watchdog = make_watchdog(connected, disconnected)
+    watchdog._last_beat = time.monotonic() - 5
+
+    stall = watchdog.check()
+    assert stall is not None
+    stall.task = None
+    watchdog.report(stall)
+
+    connected.admin_log.assert_called_once_with(
+        "Event loop was blocked for over {:.2f}s by no task at unknown "
+        "location".format(stall.lag),
+        console=False,
+    )
+    disconnected.admin_log.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_report_rate_limit():
+    conn = make_conn("foo")
+    watchdog = make_watchdog(conn, report_interval=60)
+
+    def stall():
+        watchdog._reported = False
+        watchdog._last_beat = time.monotonic() - 5
+        found = watchdog.check()
+        assert found is not None
+        return found
+
+    watchdog.report(stall())
+    watchdog.report(stall())
+    watchdog.report(stall())
+    conn.admin_log.assert_called_once()
+    assert watchdog.stalls == 3
+
+    watchdog._last_report = time.monotonic() - 61
+    watchdog.report(stall())
+    assert conn.admin_log.call_count == 2
+    message = conn.admin_log.call_args[0][0]
+    assert message.endswith("(2 more stalls since the last report)")
@@ -0,0 +1,394 @@
+import asyncio
+import logging
+import re
+import threading
+from functools import partial
+from types import ModuleType
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import Column, String, Table, inspect
+
+from cloudbot import hook
+from cloudbot import plugin as plugin_mod
+from cloudbot.event import CommandEvent
+from cloudbot.plugin import PluginManager
+from cloudbot.plugin_loading import find_plugin_dependencies
+from cloudbot.util import database, func_utils
+
+
+@pytest_asyncio.fixture()
+async def mock_bot(mock_bot_factory, tmp_path):
+    tmp_base = tmp_path / "tmp"
+    tmp_base.mkdir(exist_ok=True)
+
+    yield mock_bot_factory(base_dir=tmp_base)
+
+
+@pytest.fixture()
+def mock_manager(mock_bot):
+    yield mock_bot.plugin_manager
+
+
+def make_module(name: str, **attrs: Any) -> ModuleType:
+    """Create a plugin module with the given attributes"""
+    module = ModuleType(name)
+    vars(module).update(attrs)
+    return module
+
+
+def make_plugin_dir(mock_bot, *names):
+    plugin_dir = mock_bot.base_dir / "plugins"
+    plugin_dir.mkdir(exist_ok=True)
+    (plugin_dir / "__init__.py").touch()
+    for name in names:
+        (plugin_dir / f"{name}.py").touch()
+
+    return plugin_dir
+
+
+@pytest.mark.asyncio
+async def test_load_all_staged(
+    mock_bot_factory, mock_db, patch_import_module, caplog
+):
+    bot = mock_bot_factory(db=mock_db)
+    manager = bot.plugin_manager
+    order = []
+    found = []
+
+    @hook.on_start()
+    async def base_start():
+        await asyncio.sleep(0.05)
+        order.append("base")
+
+    base = make_module(
+        "plugins.base",
+        table=Table(
+            "staged_test",
+            database.metadata,
+            Column("a", String, primary_key=True),
+        ),
+        base_start=base_start,
+    )
+
+    @hook.on_start()
+    def dependent_start():
+        order.append("dependent")
+        # The plugin it depends on can be found, but isn't registered yet
+        found.append(manager.find_plugin("base"))
+        found.append(manager.commands.get("dep"))
+
+    @hook.command("dep")
+    def dep_cmd():
+        raise NotImplementedError
+
+    @hook.on_start()
+    def other_start():
+        order.append("other")
+
+    modules = {
+        "plugins.base": base,
+        "plugins.dependent": make_module(
+            "plugins.dependent",
+            base=base,
+            dependent_start=dependent_start,
+            dep_cmd=dep_cmd,
+        ),
+        "plugins.other": make_module("plugins.other", other_start=other_start),
+    }
+    patch_import_module.side_effect = modules.__getitem__
+    plugin_dir = make_plugin_dir(bot, "base", "dependent", "other")
+
+    with caplog.at_level(logging.INFO, "cloudbot"):
+        await manager.load_all(plugin_dir)
+
+    assert sorted(order) == ["base", "dependent", "other"]
+    assert order.index("base") < order.index("dependent")
+    assert sorted(plugin.title for plugin in manager.plugins.values()) == [
+        "base",
+        "dependent",
+        "other",
+    ]
+    assert manager.commands["dep"].function is dep_cmd
+    base_plugin = manager.find_plugin("base")
+    assert found == [base_plugin, None]
+    assert base_plugin is not None
+    assert base_plugin.code is base
+    assert inspect(bot.db_engine).has_table("staged_test")
+    assert "Loaded 3 of 3 plugins in" in caplog.text
+    assert "| dependent " in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_load_all_import_errors(
+    mock_manager, mock_bot, patch_import_module, caplog
+):
+    @hook.command("mainonly")
+    def main_only_cmd():
+        raise NotImplementedError
+
+    main_only = make_module("plugins.main_only", main_only_cmd=main_only_cmd)
+
+    attempts = []
+
+    def _import(name):
+        attempts.append(name)
+        if name == "plugins.broken":
+            raise ValueError("broken plugin")
+
+        if threading.current_thread() is not threading.main_thread():
+            raise ValueError(
+                "signal only works in main thread of the main interpreter"
+            )
+
+        return main_only
+
+    patch_import_module.side_effect = _import
+    plugin_dir = make_plugin_dir(mock_bot, "broken", "main_only")
+
+    with caplog.at_level(logging.INFO, "cloudbot"):
+        await mock_manager.load_all(plugin_dir)
+
+    assert [plugin.title for plugin in mock_manager.plugins.values()] == [
+        "main_only"
+    ]
+    assert "mainonly" in mock_manager.commands
+    assert "Error loading broken:" in caplog.text
+    assert "Error loading main_only" not in caplog.text
+    # Only thread related errors are retried on the event loop
+    assert sorted(attempts) == [
+        "plugins.broken",
+        "plugins.main_only",
+        "plugins.main_only",
+    ]
+    assert caplog.text.count("Error loading broken:") == 1
+    assert "Loaded 1 of 2 plugins in" in caplog.text
+
+
+def test_find_plugin_dependencies(caplog):
+    def func():
+        raise NotImplementedError
+
+    func.__module__ = "plugins.a"
+
+    # a and b import each other, c imports a function from a
+    mod_b = make_module("plugins.b")
+    mod_a = make_module("plugins.a", b=mod_b)
+    vars(mod_b)["a"] = mod_a
+    modules = {
+        "a": mod_a,
+        "b": mod_b,
+        "c": make_module("plugins.c", func=func),
+        "d": make_module("plugins.d", logging=logging, mock=MagicMock()),
+    }
+
+    plugins = [
+        MagicMock(title=title, code=mod) for title, mod in modules.items()
+    ]
+
+    assert find_plugin_dependencies(plugins) == {
+        "a": {"b"},
+        "b": set(),
+        "c": {"a"},
+        "d": set(),
+    }
+    assert "Ignoring circular plugin dependency b -> a" in caplog.text
+
+
+def import_lazy_module(name, calls):
+    """Create the test plugin modules, fresh for every import"""
+
+    @hook.command("lazycmd", "lc", permissions=["botcontrol"])
+    def lazy_cmd(text, _unused=None):
+        """<text> - Echo text"""
+        calls.append(text)
+        return text
+
+    @hook.regex(re.compile(r"^lazy (\w+)", re.I))
+    async def lazy_regex(match):
+        calls.append(match.group(1))
+
+    @hook.on_start()
+    def start():
+        calls.append("started")
+
+    @hook.command("startcmd")
+    def start_cmd():
+        raise NotImplementedError
+
+    modules = {
+        "plugins.cmds": make_module(
+            "plugins.cmds", lazy_cmd=lazy_cmd, lazy_regex=lazy_regex
+        ),
+        "plugins.starter": make_module(
+            "plugins.starter", start=start, start_cmd=start_cmd
+        ),
+    }
+    return modules[name]
+
+
+@pytest.mark.asyncio
+async def test_lazy_loading(mock_bot, patch_import_module, caplog):
+    mock_bot.config["plugin_loading"] = {"lazy_loading": True}
+    calls: list[str] = []
+    patch_import_module.side_effect = partial(import_lazy_module, calls=calls)
+    plugin_dir = make_plugin_dir(mock_bot, "cmds", "starter")
+
+    # Plugins are loaded normally until they are in the manifest
+    await mock_bot.plugin_manager.load_all(plugin_dir)
+    assert not any(p.lazy for p in mock_bot.plugin_manager.plugins.values())
+    assert (mock_bot.data_path / "plugin_manifest.json").exists()
+    await mock_bot.plugin_manager.unload_all()
+
+    calls.clear()
+    patch_import_module.reset_mock()
+    manager = mock_bot.plugin_manager = PluginManager(mock_bot)
+    with caplog.at_level(logging.INFO, "cloudbot"):
+        await manager.load_all(plugin_dir)
+
+    assert calls == ["started"]
+    patch_import_module.assert_called_once_with("plugins.starter")
+    assert "Deferred importing 1 plugins until they are used" in caplog.text
+
+    cmds = manager.find_plugin("cmds")
+    assert cmds.lazy
+    stub = manager.commands["lc"]
+    assert stub is manager.commands["lazycmd"]
+    assert stub.plugin is cmds
+    assert stub.doc == "<text> - Echo text"
+    assert stub.permissions == ["botcontrol"]
+    assert stub.required_args == ["text"]
+    assert stub.threaded
+    ((regex_hook, _),) = manager.regex_dispatcher.search("LAZY stuff")
+    assert regex_hook.plugin is cmds
+
+    event = CommandEvent(
+        bot=mock_bot,
+        hook=stub,
+        cmd_prefix=".",
+        text="hello",
+        triggered_command="lc",
+    )
+    assert await manager.launch(stub, event)
+    assert calls == ["started", "hello"]
+    assert "Loading plugin cmds on first use" in caplog.text
+
+    real = manager.find_plugin("cmds")
+    assert not real.lazy
+    assert event.hook is manager.commands["lc"] is not stub
+    assert manager.commands["lc"].function.__name__ == "lazy_cmd"
+    ((regex_hook, _),) = manager.regex_dispatcher.search("lazy x")
+    assert regex_hook.plugin is real
+
+    # Hooks looked up before the plugin was loaded still work
+    assert await manager.launch(stub, event)
+    assert calls == ["started", "hello", "hello"]
+
+
+@pytest.mark.asyncio
+async def test_lazy_loading_swap(mock_bot, patch_import_module):
+    mock_bot.config["plugin_loading"] = {"lazy_loading": True}
+    calls: list[str] = []
+    patch_import_module.side_effect = partial(import_lazy_module, calls=calls)
+    plugin_dir = make_plugin_dir(mock_bot, "cmds", "starter")
+    await mock_bot.plugin_manager.load_all(plugin_dir)
+    await mock_bot.plugin_manager.unload_all()
+
+    manager = mock_bot.plugin_manager = PluginManager(mock_bot)
+    await manager.load_all(plugin_dir)
+    stub = manager.commands["lc"]
+
+    importing = threading.Event()
+    release = threading.Event()
+    threads = []
+
+    def _import(name):
+        threads.append(threading.current_thread())
+        importing.set()
+        assert release.wait(5)
+        return import_lazy_module(name, calls)
+
+    patch_import_module.side_effect = _import
+    event = CommandEvent(
+        bot=mock_bot,
+        hook=stub,
+        cmd_prefix=".",
+        text="hello",
+        triggered_command="lc",
+    )
+    task = asyncio.ensure_future(manager.launch(stub, event))
+    assert await mock_bot.loop.run_in_executor(None, importing.wait, 5)
+
+    # The stand-in handles commands until the real plugin is ready
+    assert manager.commands["lc"] is stub
+    assert manager.find_plugin("cmds").lazy
+    version = manager.registry.version
+
+    release.set()
+    assert await task
+    assert threads[0] is not threading.main_thread()
+    assert manager.registry.version == version + 1
+    assert manager.commands["lc"] is event.hook is not stub
+    assert not manager.find_plugin("cmds").lazy
+
+
+@pytest.mark.asyncio
+async def test_lazy_loading_changed_file(mock_bot, patch_import_module):
+    mock_bot.config["plugin_loading"] = {"lazy_loading": True}
+    patch_import_module.side_effect = partial(import_lazy_module, calls=[])
+    plugin_dir = make_plugin_dir(mock_bot, "cmds", "starter")
+
+    await mock_bot.plugin_manager.load_all(plugin_dir)
+    (plugin_dir / "cmds.py").write_text("# changed\n")
+    await mock_bot.plugin_manager.load_all(plugin_dir)
+    assert not mock_bot.plugin_manager.find_plugin("cmds").lazy
+
+    await mock_bot.plugin_manager.load_all(plugin_dir)
+    assert mock_bot.plugin_manager.find_plugin("cmds").lazy
+
+
+@pytest.mark.asyncio
+async def test_manifest_cache(mock_bot, patch_import_module):
+    calls: list[str] = []
+    patch_import_module.side_effect = partial(import_lazy_module, calls=calls)
+    plugin_dir = make_plugin_dir(mock_bot, "cmds", "starter")
+    manager = mock_bot.plugin_manager
+
+    await manager.load_all(plugin_dir)
+    assert not any(p.from_manifest for p in manager.plugins.values())
+
+    with (
+        patch.object(plugin_mod, "find_hooks", side_effect=AssertionError),
+        patch.object(func_utils, "get_arg_names", side_effect=AssertionError),
+    ):
+        await manager.load_all(plugin_dir)
+        await manager.load_plugin(plugin_dir / "cmds.py")
+
+    assert all(p.from_manifest for p in manager.plugins.values())
+    assert calls == ["started", "started"]
+    cmd = manager.commands["lc"]
+    assert cmd.function.__name__ == "lazy_cmd"
+    assert cmd.required_args == ["text"]
+    assert cmd.arg_binder.arg_names == ("text",)
+    assert cmd.doc == "<text> - Echo text"
+    assert manager.find_plugin("cmds").hooks["regex"]
+
+    # The module no longer matches its entry
+    def _import(name):
+        module = import_lazy_module(name, calls)
+        if name == "plugins.cmds":
+            del module.lazy_regex
+
+        return module
+
+    patch_import_module.side_effect = _import
+    await manager.load_plugin(plugin_dir / "cmds.py")
+    plugin = manager.find_plugin("cmds")
+    assert not plugin.from_manifest
+    assert not plugin.hooks["regex"]
+    assert manager.manifest.plugins["cmds"]["hooks"][0]["function"] == (
+        "lazy_cmd"
+    )
+    assert len(manager.manifest.plugins["cmds"]["hooks"]) == 1
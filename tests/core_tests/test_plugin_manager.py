@@ -592,7 +592,7 @@ async def test_unload_raw_hooks(
 
     await mock_manager.unload_plugin(str(plugin_file))
 
-    assert len(mock_manager.raw_triggers["PRIVMSG"]) == 0
+    assert "PRIVMSG" not in mock_manager.raw_triggers
     assert caplog.record_tuples == [
         ("cloudbot", 20, "Unloaded all plugins from test")
     ]
@@ -633,7 +633,7 @@ async def test_unload_event_hooks(
 
     await mock_manager.unload_plugin(str(plugin_file))
 
-    assert len(mock_manager.event_type_hooks[EventType.notice]) == 0
+    assert EventType.notice not in mock_manager.event_type_hooks
     assert caplog.record_tuples == [
         ("cloudbot", 20, "Unloaded all plugins from test")
     ]
@@ -739,6 +739,81 @@ async def test_launch(
     assert post_called == expected_post
 
 
+@pytest.mark.asyncio
+async def test_sieve_chain(mock_manager, patch_import_module):
+    calls = []
+    post_called = []
+
+    @hook.command("test")
+    def foo_cb():
+        calls.append("command")
+
+    @hook.sieve(hook_types=["regex"])
+    def regex_sieve(_bot, _event, _hook):
+        raise NotImplementedError
+
+    @hook.sieve(priority=1, report=False)
+    def inline_sieve(_bot, _event, _hook):
+        calls.append("inline")
+        return _event
+
+    @hook.sieve(priority=2, inline=False)
+    def threaded_sieve(_bot, _event, _hook):
+        calls.append("threaded")
+        return _event
+
+    @hook.post_hook()
+    def post_hook(launched_hook):
+        post_called.append(launched_hook.function_name)
+
+    mod = MockModule()
+    mod.regex_sieve = regex_sieve  # type: ignore[attr-defined]
+    mod.inline_sieve = inline_sieve  # type: ignore[attr-defined]
+    mod.threaded_sieve = threaded_sieve  # type: ignore[attr-defined]
+    mod.foo_cb = foo_cb  # type: ignore[attr-defined]
+    mod.post_hook = post_hook  # type: ignore[attr-defined]
+
+    patch_import_module.return_value = mod
+
+    plugin_file = mock_manager.bot.base_dir / "plugins/test.py"
+    await mock_manager.load_plugin(plugin_file)
+
+    chain = mock_manager.get_sieve_chain("command")
+    assert [s.function_name for s in chain] == [
+        "inline_sieve",
+        "threaded_sieve",
+    ]
+    assert mock_manager.get_sieve_chain("command") is chain
+    assert [s.function_name for s in mock_manager.get_sieve_chain("regex")] == [
+        "regex_sieve",
+        "inline_sieve",
+        "threaded_sieve",
+    ]
+
+    inline, threaded = chain
+    assert inline.inline and not threaded.inline
+
+    event = CommandEvent(
+        bot=mock_manager.bot,
+        hook=mock_manager.commands["test"],
+        cmd_prefix=".",
+        text="",
+        triggered_command="test",
+    )
+    assert await mock_manager.launch(event.hook, event)
+
+    assert calls == ["inline", "threaded", "command"]
+    assert post_called == ["threaded_sieve", "foo_cb"]
+    assert inline.runs == threaded.runs == 1
+    assert inline.total_time > 0
+    assert inline.wall_time.count == threaded.wall_time.count == 1
+    assert inline.executor_wait.count == 0
+    assert threaded.executor_wait.count == 1
+
+    await mock_manager.unload_plugin(plugin_file)
+    assert mock_manager.get_sieve_chain("command") == ()
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     "do_sieve,sieve_allow,single_thread,sieve_error",
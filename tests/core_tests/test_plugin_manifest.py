@@ -0,0 +1,176 @@
+import re
+from typing import cast
+from unittest.mock import MagicMock
+
+from cloudbot import hook
+from cloudbot.event import EventType
+from cloudbot.hook import Priority
+from cloudbot.plugin_hooks import CommandHook, EventHook, OnStartHook, RegexHook
+from cloudbot.plugin_manifest import (
+    PluginManifest,
+    build_hook,
+    describe_hook,
+    describe_plugin,
+    find_cached_hooks,
+)
+from tests.util.mock_module import MockModule
+
+
+def test_round_trip():
+    @hook.command("foo", "bar", autohelp=False, priority=Priority.HIGH)
+    async def example(text, nick, _private=None):
+        """<text> - Does foo
+
+        More details
+        """
+        raise NotImplementedError
+
+    @hook.regex(["a+", re.compile("b+", re.I)], run_on_cmd=True)
+    @hook.event([EventType.join, EventType.part], clients="irc")
+    def multi(match):
+        raise NotImplementedError
+
+    plugin = MagicMock()
+    hooks = [
+        CommandHook(plugin, hook._get_hook(example, "command")),
+        RegexHook(plugin, hook._get_hook(multi, "regex")),
+        EventHook(plugin, hook._get_hook(multi, "event")),
+    ]
+    for original in hooks:
+        data = describe_hook(original)
+        assert data is not None
+        copy = build_hook(plugin, data)
+        assert type(copy) is type(original)
+        for attr in (
+            "type",
+            "function_name",
+            "required_args",
+            "threaded",
+            "permissions",
+            "action",
+            "priority",
+            "clients",
+        ):
+            assert getattr(copy, attr) == getattr(original, attr)
+
+        assert copy.arg_binder.arg_names == original.arg_binder.arg_names
+
+    cmd = build_hook(plugin, describe_hook(hooks[0]))
+    assert isinstance(cmd, CommandHook)
+    assert cmd.aliases == ["foo", "bar"]
+    assert cmd.doc == "<text> - Does foo"
+    assert not cmd.auto_help
+
+    regex = build_hook(plugin, describe_hook(hooks[1]))
+    assert isinstance(regex, RegexHook)
+    assert [(r.pattern, r.flags) for r in regex.regexes] == [
+        (r.pattern, r.flags) for r in cast(RegexHook, hooks[1]).regexes
+    ]
+    assert regex.run_on_cmd
+
+    event = build_hook(plugin, describe_hook(hooks[2]))
+    assert isinstance(event, EventHook)
+    assert event.types == {EventType.join, EventType.part}
+    assert event.clients == ["irc"]
+
+
+def test_not_lazy():
+    @hook.on_start()
+    def start():
+        raise NotImplementedError
+
+    @hook.command(lock=MagicMock())
+    def locked():
+        raise NotImplementedError
+
+    @hook.command()
+    def cmd():
+        raise NotImplementedError
+
+    plugin = MagicMock(
+        code=MockModule(start=start, locked=locked, cmd=cmd), tables=[]
+    )
+    locked_hook = CommandHook(plugin, hook._get_hook(locked, "command"))
+    cmd_hook = CommandHook(plugin, hook._get_hook(cmd, "command"))
+    start_hook = OnStartHook(plugin, hook._get_hook(start, "on_start"))
+    assert not describe_hook(locked_hook)["lazy"]
+    assert describe_hook(cmd_hook, "cmd")["lazy"]
+
+    plugin.hooks = {"command": [locked_hook, cmd_hook], "on_start": []}
+    data = describe_plugin(plugin, "abc")
+    assert not data["lazy"]
+    assert [hook_data["attr"] for hook_data in data["hooks"]] == [
+        "locked",
+        "cmd",
+    ]
+
+    plugin.hooks = {"command": [cmd_hook], "on_start": [start_hook]}
+    assert not describe_plugin(plugin, "abc")["lazy"]
+
+    plugin.hooks = {"command": [cmd_hook], "on_start": []}
+    assert describe_plugin(plugin, "abc")["lazy"]
+
+    plugin.tables = [MagicMock()]
+    assert not describe_plugin(plugin, "abc")["lazy"]
+    plugin.tables = []
+
+    plugin.hooks = {"command": [], "on_start": []}
+    assert not describe_plugin(plugin, "abc")["lazy"]
+
+
+def test_find_cached_hooks():
+    def make_code(**extra):
+        @hook.command()
+        def cmd():
+            raise NotImplementedError
+
+        return MockModule(cmd=cmd, alias=cmd, **extra)
+
+    code = make_code()
+    plugin = MagicMock(code=code, tables=[])
+    func_hook = hook._get_hook(vars(code)["cmd"], "command")
+    plugin.hooks = {"command": [CommandHook(plugin, func_hook)]}
+    entry = describe_plugin(plugin, "abc")
+
+    hooks = find_cached_hooks(plugin, make_code(), entry)
+    assert hooks is not None
+    assert [cmd.function_name for cmd in hooks["command"]] == ["cmd"]
+
+    @hook.command()
+    def other():
+        raise NotImplementedError
+
+    # A hook the entry doesn't know about
+    assert find_cached_hooks(plugin, make_code(other=other), entry) is None
+
+
+def test_manifest_file(tmp_path, caplog):
+    path = tmp_path / "data" / "manifest.json"
+    manifest = PluginManifest(path)
+    manifest.load()
+    assert manifest.plugins == {}
+
+    @hook.command()
+    def cmd():
+        raise NotImplementedError
+
+    plugin = MagicMock(title="test", code=MockModule(cmd=cmd))
+    plugin.hooks = {
+        "command": [CommandHook(plugin, hook._get_hook(cmd, "command"))]
+    }
+    assert manifest.update(plugin, "abc")
+    assert not manifest.update(plugin, "abc")
+    manifest.save()
+
+    loaded = PluginManifest(path)
+    loaded.load()
+    assert loaded.get("test", "abc") == manifest.plugins["test"]
+    assert loaded.get("test", "def") is None
+    assert loaded.get("other", "abc") is None
+
+    loaded.prune(["other"])
+    assert loaded.plugins == {}
+
+    path.write_text("{")
+    PluginManifest(path).load()
+    assert "Unable to read plugin manifest" in caplog.text
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+
+import pytest
+import pytest_asyncio
+
+from cloudbot.scheduler import Scheduler
+
+
+@pytest_asyncio.fixture()
+async def scheduler():
+    sched = Scheduler(asyncio.get_running_loop())
+    yield sched
+    sched.close()
+
+
+async def wait_for(predicate, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "Timed out"
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_fires_in_order(scheduler):
+    fired: list[str] = []
+    now = time.time()
+    scheduler.schedule_at(now + 0.06, fired.append, "c")
+    scheduler.schedule_at(now + 0.02, fired.append, "a")
+    scheduler.schedule_at(now + 0.04, fired.append, "b")
+    assert len(scheduler) == 3
+
+    await wait_for(lambda: len(fired) == 3)
+    assert fired == ["a", "b", "c"]
+    assert len(scheduler) == 0
+    assert scheduler.fired == 3
+    assert time.time() >= now + 0.06
+
+
+@pytest.mark.asyncio
+async def test_past_job_runs_immediately(scheduler):
+    fired: list[int] = []
+    scheduler.schedule_at(0, fired.append, 1)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert fired == [1]
+
+
+@pytest.mark.asyncio
+async def test_cancel(scheduler):
+    fired: list[str] = []
+    scheduler.schedule_in(0.01, fired.append, "a", key="a")
+    scheduler.schedule_in(0.02, fired.append, "b", key="b")
+    assert "a" in scheduler
+    assert scheduler.cancel("a")
+    assert not scheduler.cancel("a")
+    assert "a" not in scheduler
+
+    await wait_for(lambda: fired)
+    assert fired == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_replace(scheduler):
+    fired: list[str] = []
+    scheduler.schedule_in(10, fired.append, "old", key="job")
+    scheduler.schedule_in(0.01, fired.append, "new", key="job")
+    assert len(scheduler) == 1
+    job = scheduler.get("job")
+    assert job is not None
+    assert job.args == ("new",)
+
+    await wait_for(lambda: fired)
+    await asyncio.sleep(0.02)
+    assert fired == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_generated_keys(scheduler):
+    key1 = scheduler.schedule_in(10, print)
+    key2 = scheduler.schedule_in(10, print)
+    assert key1 != key2
+    assert len(scheduler) == 2
+
+
+@pytest.mark.asyncio
+async def test_compact(scheduler):
+    for i in range(200):
+        scheduler.schedule_in(100 + i, print, key=i)
+
+    for i in range(199):
+        scheduler.cancel(i)
+
+    assert len(scheduler) == 1
+    assert len(scheduler._heap) < 100
+
+
+@pytest.mark.asyncio
+async def test_max_sleep():
+    scheduler = Scheduler(asyncio.get_running_loop(), max_sleep=0.01)
+    try:
+        scheduler.schedule_in(100, print)
+        timer = scheduler._timer
+        assert timer is not None
+        await asyncio.sleep(0.03)
+        # The timer woke up, found nothing due and was armed again
+        assert scheduler._timer is not timer
+        assert len(scheduler) == 1
+    finally:
+        scheduler.close()
+
+    assert scheduler._timer is None
+
+
+@pytest.mark.asyncio
+async def test_coroutine_job(scheduler, caplog):
+    done = asyncio.get_running_loop().create_future()
+
+    async def job(value):
+        await asyncio.sleep(0)
+        done.set_result(value)
+
+    async def bad_job():
+        raise ValueError("async failure")
+
+    scheduler.schedule_in(0, job, 5)
+    scheduler.schedule_in(0, bad_job)
+    assert await asyncio.wait_for(done, 1) == 5
+
+    await wait_for(lambda: scheduler.errors)
+    assert "async failure" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_job_error(scheduler, caplog):
+    fired: list[int] = []
+
+    def bad_job():
+        raise ValueError("sync failure")
+
+    scheduler.schedule_in(0, bad_job)
+    scheduler.schedule_in(0.01, fired.append, 1)
+    with caplog.at_level(logging.ERROR, "cloudbot"):
+        await wait_for(lambda: fired)
+
+    assert scheduler.errors == 1
+    assert "sync failure" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_close_cancels_tasks():
+    scheduler = Scheduler(asyncio.get_running_loop())
+    started = asyncio.Event()
+
+    async def job():
+        started.set()
+        await asyncio.sleep(10)
+
+    scheduler.schedule_in(0, job)
+    scheduler.schedule_in(10, print)
+    await asyncio.wait_for(started.wait(), 1)
+
+    assert len(scheduler._tasks) == 1
+    task = next(iter(scheduler._tasks))
+    scheduler.close()
+    assert len(scheduler) == 0
+    with pytest.raises(asyncio.CancelledError):
+        await task
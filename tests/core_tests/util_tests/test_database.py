@@ -1,3 +1,9 @@
+import threading
+
+import pytest
+from sqlalchemy import Column, Integer, PrimaryKeyConstraint, String, Table
+
+from cloudbot.permissions import Group
 from cloudbot.util import database
 
 
@@ -7,3 +13,196 @@ def test_database(mock_db):
     engine = mock_db.engine
     database.configure(engine)
     assert database.Session().bind is engine
+
+
+def test_lazy_session_special_methods(mock_db):
+    Group.__table__.create(mock_db.engine)
+    opened = []
+    session = database.LazySession(
+        database.Session.session_factory, lambda: opened.append(True)
+    )
+    assert not session.opened
+
+    group = Group(name="admins")
+    assert group not in session
+    assert not list(session)
+    assert opened == [True]
+
+    with session as real_session:
+        assert real_session is session.get_session()
+        real_session.add(group)
+        assert group in session
+        assert list(session) == [group]
+        real_session.commit()
+
+    assert mock_db.get_data(Group.__table__) == [("admins", False)]
+    session.close()
+    assert not session.opened
+
+
+def test_executor_pool_pinning():
+    pool = database.DatabaseExecutorPool(2)
+    try:
+        first = pool.acquire()
+        second = pool.acquire()
+        third = pool.acquire()
+        # Nothing is pinned until work is submitted
+        assert first.worker is None
+        assert pool.pinned == 0
+
+        threads = {}
+        for executor in (first, second):
+            thread = executor.submit(threading.get_ident).result()
+            threads[executor.worker] = thread
+
+        assert {first.worker, second.worker} == {0, 1}
+        assert pool.pinned == 2
+        for _ in range(2):
+            thread = third.submit(threading.get_ident).result()
+            assert thread == threads[third.worker]
+
+        assert threads[0] != threads[1]
+        assert pool.pinned == 3
+
+        first.release()
+        first.release()
+        assert pool.pinned == 2
+        with pytest.raises(RuntimeError):
+            first.submit(print)
+
+        unused = pool.acquire()
+        unused.release()
+        assert pool.pinned == 2
+
+        stats = pool.stats()
+        assert stats["tasks_run"] == 4
+        assert stats["queue_depth"] == 0
+        assert stats["pinned"] == 2
+    finally:
+        pool.shutdown()
+
+
+def test_executor_pool_least_loaded():
+    pool = database.DatabaseExecutorPool(2)
+    started = threading.Event()
+    block = threading.Event()
+
+    def _wait():
+        started.set()
+        block.wait(5)
+
+    try:
+        slow = pool.acquire()
+        slow_future = slow.submit(_wait)
+        started.wait(5)
+        idle = pool.acquire()
+        idle.submit(threading.get_ident).result(5)
+        assert idle.worker != slow.worker
+
+        # Both workers have one event pinned, the idle one is picked
+        other = pool.acquire()
+        other.submit(threading.get_ident).result(5)
+        assert other.worker == idle.worker
+        assert not slow_future.done()
+    finally:
+        block.set()
+        pool.shutdown()
+
+
+def test_executor_pool_queue_depth():
+    pool = database.DatabaseExecutorPool(1)
+    executor = pool.acquire()
+    started = threading.Event()
+    block = threading.Event()
+
+    def _wait():
+        started.set()
+        block.wait(5)
+
+    try:
+        first = executor.submit(_wait)
+        started.wait(5)
+        second = executor.submit(lambda: 1)
+        assert pool.queue_depth == 1
+        block.set()
+        first.result()
+        assert second.result() == 1
+        assert pool.queue_depth == 0
+        assert pool.stats()["max_wait"] > 0
+    finally:
+        block.set()
+        pool.shutdown()
+
+
+def test_executor_pool_size():
+    with pytest.raises(ValueError):
+        database.DatabaseExecutorPool(0)
+
+
+def make_buffer_table():
+    return Table(
+        "buffered",
+        database.metadata,
+        Column("a", String),
+        Column("b", String),
+        Column("value", Integer),
+        PrimaryKeyConstraint("a", "b"),
+    )
+
+
+def test_write_behind_coalesce(mock_db):
+    table = make_buffer_table()
+    table.create(mock_db.engine)
+    mock_db.add_row(table, a="x", b="y", value=1)
+    buffer = database.WriteBehindBuffer(table, max_size=3)
+
+    assert not buffer.upsert(a="x", b="y", value=2)
+    assert not buffer.upsert(a="x", b="y", value=3)
+    assert not buffer.upsert(a="x", b="z", value=4)
+    assert len(buffer) == 2
+    assert buffer.get("x", "y") == {"a": "x", "b": "y", "value": 3}
+    assert buffer.get("x", "q") is None
+    assert mock_db.get_data(table) == [("x", "y", 1)]
+
+    assert buffer.flush(database.Session()) == 2
+    assert buffer.flush(database.Session()) == 0
+    assert buffer.get("x", "y") is None
+    assert len(buffer) == 0
+    assert mock_db.get_data(table) == [("x", "y", 3), ("x", "z", 4)]
+    assert buffer.flushes == 1
+    assert buffer.rows_written == 2
+
+
+def test_write_behind_due(mock_db, freeze_time):
+    table = make_buffer_table()
+    buffer = database.WriteBehindBuffer(table, max_size=2, max_age=10)
+    assert not buffer.due()
+    assert not buffer.upsert(a="x", b="y", value=1)
+    freeze_time.tick(11)
+    assert buffer.due()
+    buffer.clear()
+    assert not buffer.due()
+    buffer.upsert(a="x", b="y", value=1)
+    assert buffer.upsert(a="x", b="z", value=1)
+
+
+def test_write_behind_error(mock_db):
+    table = make_buffer_table()
+    buffer = database.WriteBehindBuffer(table)
+    buffer.upsert(a="x", b="y", value=1)
+    session = database.Session()
+    with pytest.raises(Exception):
+        # Table doesn't exist yet
+        buffer.flush(session)
+
+    buffer.upsert(a="x", b="y", value=2)
+    assert buffer.get("x", "y")["value"] == 2
+    table.create(mock_db.engine)
+    assert buffer.flush(session) == 1
+    assert mock_db.get_data(table) == [("x", "y", 2)]
+
+
+def test_write_behind_no_key():
+    table = Table("no_key", database.metadata, Column("a", String))
+    with pytest.raises(ValueError):
+        database.WriteBehindBuffer(table)
@@ -1,5 +1,9 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
 import pytest
 
+from cloudbot.event import CommandEvent, Event
 from cloudbot.util import func_utils
 
 
@@ -15,3 +19,74 @@ def test_call_with_args():
 
     with pytest.raises(func_utils.ParameterError):
         func_utils.call_with_args(func, {})
+
+
+def test_arg_binder():
+    def func(arg1, arg2=None, _arg3=None):
+        return arg1, arg2, _arg3
+
+    binder = func_utils.ArgBinder(func)
+    assert binder.arg_names == ("arg1", "arg2")
+    event = SimpleNamespace(nick="foo", arg1=1, arg2=3)
+    assert binder.bind(event) == (1, 3)
+    assert binder.call(event) == (1, 3, None)
+
+
+def test_arg_binder_single_and_empty():
+    assert func_utils.ArgBinder(lambda nick: nick).call(Event(nick="a")) == "a"
+    assert func_utils.ArgBinder(lambda: 5).call(Event()) == 5
+
+
+def test_arg_binder_missing():
+    binder = func_utils.ArgBinder(lambda nick, foo: None)
+    with pytest.raises(func_utils.ParameterError) as exc:
+        binder.call(Event(nick="a"))
+
+    assert exc.value.name == "foo"
+    assert "nick" in exc.value.valid_args
+
+
+def _no_args():
+    return ()
+
+
+def _all_args(bot, conn, chan, nick, text, event, _extra=None):
+    return bot, conn, chan, nick, text, event, _extra
+
+
+def _single_arg(nick):
+    return nick
+
+
+@pytest.mark.parametrize("func", [_no_args, _all_args, _single_arg])
+def test_arg_binder_matches_call_with_args(func):
+    event = CommandEvent(
+        hook=MagicMock(),
+        text="text",
+        triggered_command="foo",
+        cmd_prefix=".",
+        bot=MagicMock(),
+        conn=MagicMock(),
+        channel="#bar",
+        nick="foo",
+    )
+    binder = func_utils.ArgBinder(func)
+    assert binder.arg_names == tuple(func_utils.get_arg_names(func))
+    assert binder.call(event) == func_utils.call_with_args(func, event)
+
+
+def test_arg_binder_missing_matches_call_with_args():
+    def func(nick, missing):
+        raise NotImplementedError
+
+    event = Event(nick="foo")
+    with pytest.raises(func_utils.ParameterError) as bound_exc:
+        func_utils.ArgBinder(func).call(event)
+
+    with pytest.raises(func_utils.ParameterError) as plain_exc:
+        func_utils.call_with_args(func, event)
+
+    assert bound_exc.value.name == plain_exc.value.name == "missing"
+    assert sorted(bound_exc.value.valid_args) == sorted(
+        plain_exc.value.valid_args
+    )
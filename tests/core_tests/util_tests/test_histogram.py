@@ -0,0 +1,48 @@
+import pytest
+
+from cloudbot.util.histogram import LatencyHistogram
+
+
+def test_empty():
+    hist = LatencyHistogram()
+    assert hist.count == 0
+    assert hist.mean == 0.0
+    assert hist.percentile(50) == 0.0
+    assert hist.percentile(99) == 0.0
+
+
+def test_percentiles():
+    hist = LatencyHistogram()
+    for i in range(1, 101):
+        hist.record(i / 1000)
+
+    assert hist.count == 100
+    assert hist.mean == pytest.approx(0.0505)
+    assert hist.max == 0.1
+    for percent in (50, 95, 99):
+        real = percent / 1000
+        # Estimates are the upper bound of a bucket
+        assert real <= hist.percentile(percent) <= real * 1.2
+
+    assert hist.percentile(100) == hist.max
+
+
+def test_bounds():
+    hist = LatencyHistogram(min_value=0.001, max_value=1.0)
+    hist.record(0)
+    hist.record(1e-9)
+    hist.record(50.0)
+    assert hist.count == 3
+    assert hist.max == 50.0
+    assert hist.percentile(50) == 0.001
+    assert hist.percentile(100) == 50.0
+    assert len(hist._counts or []) == hist.size
+
+
+def test_reset():
+    hist = LatencyHistogram()
+    hist.record(0.5)
+    hist.reset()
+    assert hist.count == 0
+    assert hist.max == 0.0
+    assert hist.percentile(50) == 0.0
@@ -35,9 +35,13 @@ async def test_chainlist(mock_db, mock_bot_factory):
     def func():
         raise NotImplementedError
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        Plugin("test/foo.py", "foo.py", "foo", MockModule()),
-        _get_hook(func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                Plugin("test/foo.py", "foo.py", "foo", MockModule()),
+                _get_hook(func, "command"),
+            )
+        ]
     )
     db = mock_db.session()
     chain.commands.create(mock_db.engine)
@@ -101,14 +105,22 @@ async def test_chainallow_del_hook_not_set(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -133,14 +145,22 @@ async def test_chainallow_del_hook(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -169,14 +189,22 @@ async def test_chainallow_add_hook_no_arg(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -203,14 +231,22 @@ async def test_chainallow_add_hook_allow(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -239,14 +275,22 @@ async def test_chainallow_add_hook_allow_update(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -283,14 +327,22 @@ async def test_chainallow_add_hook_deny(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -319,14 +371,22 @@ async def test_chainallow_add_hook_bad_arg(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -353,14 +413,22 @@ async def test_chainallow_add_cmd(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -387,14 +455,22 @@ async def test_chainallow_add_partial_cmd(mock_db, mock_bot_factory):
 
     mock_bot: MockBot = mock_bot_factory(db=mock_db)
     plugin = Plugin("plugins/foo.py", "foo.py", "foo", MockModule())
-    mock_bot.plugin_manager.commands["foo"] = CommandHook(
-        plugin,
-        _get_hook(hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(hook_func, "command"),
+            )
+        ]
     )
 
-    mock_bot.plugin_manager.commands["bar"] = CommandHook(
-        plugin,
-        _get_hook(other_hook_func, "command"),
+    mock_bot.plugin_manager.register_hooks(
+        [
+            CommandHook(
+                plugin,
+                _get_hook(other_hook_func, "command"),
+            )
+        ]
     )
 
     chain.commands.create(mock_db.engine)
@@ -7,6 +7,13 @@ from plugins.core import chan_key_db, server_info
 from tests.util.mock_irc_client import MockIrcClient
 
 
+@pytest.fixture(autouse=True)
+def clear_buffer():
+    chan_key_db.key_buffer.clear()
+    yield
+    chan_key_db.key_buffer.clear()
+
+
 def make_conn(mock_bot_factory, loop=None):
     bot = mock_bot_factory(loop=loop)
     conn = MockIrcClient(
@@ -52,34 +59,33 @@ async def test_handle_modes(mock_bot_factory, mock_db):
     server_info.handle_chan_modes(
         "IXZbegw,k,FHJLWdfjlx,ABCDKMNOPQRSTcimnprstuz", serv_info
     )
-    assert (
-        chan_key_db.handle_modes(["#foo", "+o", "foo"], conn, db, "#foo")
-        is None
-    )
+    assert chan_key_db.handle_modes(["#foo", "+o", "foo"], conn, "#foo") is None
     assert conn.get_channel_key("#foo") is None
 
     assert (
-        chan_key_db.handle_modes(
-            ["#foo", "+ok", "foo", "beep"], conn, db, "#foo"
-        )
+        chan_key_db.handle_modes(["#foo", "+ok", "foo", "beep"], conn, "#foo")
         is None
     )
     assert conn.get_channel_key("#foo") == "beep"
 
+    chan_key_db.flush_keys(db)
+    assert mock_db.get_data(chan_key_db.table) == [("conn", "#foo", "beep")]
+
     assert (
-        chan_key_db.handle_modes(
-            ["#foo", "-ok", "foo", "beep"], conn, db, "#foo"
-        )
+        chan_key_db.handle_modes(["#foo", "-ok", "foo", "beep"], conn, "#foo")
         is None
     )
     assert conn.get_channel_key("#foo") is None
 
     assert (
-        chan_key_db.handle_modes([conn.nick, "-ok"], conn, db, "server.host")
+        chan_key_db.handle_modes([conn.nick, "-ok"], conn, "server.host")
         is None
     )
     assert conn.get_channel_key("#foo") is None
 
+    chan_key_db.flush_keys_on_stop(db)
+    assert mock_db.get_data(chan_key_db.table) == [("conn", "#foo", None)]
+
 
 @pytest.mark.asyncio
 async def test_check_send_key(mock_bot_factory, mock_db):
@@ -87,16 +93,36 @@ async def test_check_send_key(mock_bot_factory, mock_db):
     db = mock_db.session()
     chan_key_db.table.create(mock_db.engine)
     msg = Message(None, None, "JOIN", ["#foo,#bar", "bing"])
-    assert chan_key_db.check_send_key(conn, msg, db) is msg
+    assert chan_key_db.check_send_key(conn, msg) is msg
     assert conn.get_channel_key("#foo") == "bing"
 
     msg = Message(None, None, "PRIVMSG", ["#foo,#bar", "bing"])
-    assert chan_key_db.check_send_key(conn, msg, db) is msg
+    assert chan_key_db.check_send_key(conn, msg) is msg
 
     msg = Message(None, None, "JOIN", ["#foo,#bar"])
-    assert chan_key_db.check_send_key(conn, msg, db) is msg
+    assert chan_key_db.check_send_key(conn, msg) is msg
     assert conn.get_channel_key("#foo") == "bing"
 
+    # Nothing is written until the buffer is flushed
+    assert mock_db.get_data(chan_key_db.table) == []
+    assert len(chan_key_db.key_buffer) == 1
+
+    chan_key_db.flush_keys(db)
+    assert mock_db.get_data(chan_key_db.table) == [("conn", "#foo", "bing")]
+
+
+@pytest.mark.asyncio
+async def test_load_keys_pending(mock_bot_factory, mock_db):
+    conn = make_conn(mock_bot_factory)
+    db = mock_db.session()
+    chan_key_db.table.create(mock_db.engine)
+    chan_key_db.set_key(conn, "#foo", "bar")
+    conn.clear_channel_keys()
+
+    chan_key_db.load_keys(conn, db)
+    assert conn.get_channel_key("#foo") == "bar"
+    assert len(chan_key_db.key_buffer) == 0
+
 
 @pytest.mark.asyncio
 async def test_key_use(mock_bot_factory, mock_db):
@@ -1,10 +1,19 @@
 from unittest.mock import MagicMock
 
+import pytest
+
 from cloudbot.event import CommandEvent, Event, EventType
 from plugins import seen
 from tests.util.mock_conn import MockConn
 
 
+@pytest.fixture(autouse=True)
+def clear_buffer():
+    seen.seen_buffer.clear()
+    yield
+    seen.seen_buffer.clear()
+
+
 def test_seen_track_correction(mock_db, freeze_time):
     seen.table.create(mock_db.engine)
     db = mock_db.session()
@@ -18,6 +27,7 @@ def test_seen_track_correction(mock_db, freeze_time):
     )
     res = seen.chat_tracker(event, db)
     assert res is None
+    seen.flush_seen(db)
     assert mock_db.get_data(seen.table) == []
 
 
@@ -34,6 +44,7 @@ def test_seen_track_pm(mock_db, freeze_time):
     )
     res = seen.chat_tracker(event, db)
     assert res is None
+    seen.flush_seen(db)
     assert mock_db.get_data(seen.table) == []
 
 
@@ -50,6 +61,7 @@ def test_seen_track(mock_db, freeze_time):
     )
     res = seen.chat_tracker(event, db)
     assert res is None
+    seen.flush_seen(db)
     assert mock_db.get_data(seen.table) == [
         ("bar", 1566497676.0, "foo", "#foo", "None")
     ]
@@ -81,6 +93,7 @@ def test_seen_track_update(mock_db, freeze_time):
     )
     res = seen.chat_tracker(event, db)
     assert res is None
+    seen.flush_seen(db)
     assert mock_db.get_data(seen.table) == [
         ("bar", 1566497676.0, "foo", "#foo", "None")
     ]
@@ -99,6 +112,7 @@ def test_seen_track_action(mock_db, freeze_time):
     )
     res = seen.chat_tracker(event, db)
     assert res is None
+    seen.flush_seen(db)
     assert mock_db.get_data(seen.table) == [
         ("bar", 1566497676.0, "\x01ACTION foo\x01", "#foo", "None")
     ]
@@ -247,3 +261,70 @@ def test_seen_action(mock_db, freeze_time):
     assert (
         res == "other was last seen 49 years and 8 months ago: * other foobar"
     )
+
+
+def test_seen_unflushed(mock_db, freeze_time):
+    seen.table.create(mock_db.engine)
+    chan = "#foo"
+    mock_db.add_row(
+        seen.table,
+        name="other",
+        time=123,
+        quote="foo",
+        chan=chan,
+        host="foo.bar",
+    )
+
+    db = mock_db.session()
+    conn = MockConn()
+    event = Event(
+        conn=conn,
+        channel=chan,
+        content="new message",
+        nick="Other",
+        event_type=EventType.message,
+    )
+    seen.chat_tracker(event, db)
+    assert mock_db.get_data(seen.table) == [
+        ("other", 123.0, "foo", "#foo", "foo.bar")
+    ]
+
+    event = CommandEvent(
+        conn=conn,
+        channel=chan,
+        content="foo",
+        nick="bar",
+        hook=MagicMock(),
+        text="other",
+        triggered_command="seen",
+        cmd_prefix=".",
+    )
+    res = seen.seen(event.text, event.nick, event.chan, db, event)
+    assert res == "other was last seen 0 minutes ago saying: new message"
+
+    seen.flush_seen_on_stop(db)
+    assert mock_db.get_data(seen.table) == [
+        ("other", 1566497676.0, "new message", "#foo", "None")
+    ]
+
+
+def test_seen_flush_when_full(mock_db, freeze_time, monkeypatch):
+    seen.table.create(mock_db.engine)
+    monkeypatch.setattr(seen.seen_buffer, "max_size", 2)
+    db = mock_db.session()
+    conn = MockConn()
+    for nick in ("a", "a", "b"):
+        event = Event(
+            conn=conn,
+            channel="#foo",
+            content=nick,
+            nick=nick,
+            event_type=EventType.message,
+        )
+        seen.chat_tracker(event, db)
+
+    assert len(seen.seen_buffer) == 0
+    assert mock_db.get_data(seen.table) == [
+        ("a", 1566497676.0, "a", "#foo", "None"),
+        ("b", 1566497676.0, "b", "#foo", "None"),
+    ]
@@ -13,6 +13,7 @@ from plugins.core import chan_track, server_info
 class MockConn:
     def __init__(self, bot=None, loop=None):
         self.name = "foo"
+        self.config: dict[str, Any] = {}
         self.memory: dict[str, Any] = {
             "server_info": {
                 "statuses": {},
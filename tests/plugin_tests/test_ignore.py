@@ -1,3 +1,4 @@
+import threading
 from unittest.mock import MagicMock
 
 import pytest
@@ -253,3 +254,82 @@ def test_unignore_command(mock_db):
     assert not ignore.is_ignored("testconn", "#chan", "nick!user@host")
 
     event.reset_mock()
+
+
+def test_ignore_index(mock_db):
+    setup_db(mock_db)
+
+    sess = mock_db.session()
+
+    for i in range(500):
+        ignore.add_ignore(sess, "testconn", "#chan", f"nick{i}!user@host")
+
+    ignore.add_ignore(sess, "testconn", "#chan", "*!*@*.Evil.?")
+
+    bucket = ignore.ignore_index[("testconn", "#chan")]
+    assert len(bucket.exact) == 500
+    assert bucket.regex is not None
+
+    assert ignore.is_ignored("testconn", "#chan", "NICK42!user@host")
+    assert not ignore.is_ignored("testconn", "#chan", "nick42!user@otherhost")
+    assert ignore.is_ignored("testconn", "#chan", "a!b@c.evil.x")
+    assert not ignore.is_ignored("testconn", "#chan", "a!b@c.evil.xy")
+    assert not ignore.is_ignored("testconn", "#chan", "a!b@cXevil.x")
+
+    assert ignore.find_ignore("TestConn", "#Chan", "*!*@*.evil.?") == (
+        "testconn",
+        "#chan",
+        "*!*@*.Evil.?",
+    )
+    assert ignore.find_ignore("testconn", "#chan", "*!*@*") is None
+
+
+def test_ignore_result_cache(mock_db, monkeypatch):
+    setup_db(mock_db)
+    monkeypatch.setattr(ignore, "RESULT_CACHE_SIZE", 2)
+
+    sess = mock_db.session()
+
+    ignore.add_ignore(sess, "testconn", "#chan", "*!*@host")
+
+    bucket = ignore.ignore_index[("testconn", "#chan")]
+    for nick in ("a", "b", "c", "b"):
+        bucket.matches(f"{nick}!user@host")
+
+    assert list(bucket._results) == ["c!user@host", "b!user@host"]
+
+    ignore.remove_ignore(sess, "testconn", "#chan", "*!*@host")
+
+    assert ("testconn", "#chan") not in ignore.ignore_index
+    assert not ignore.is_ignored("testconn", "#chan", "b!user@host")
+
+
+def test_ignore_bucket_threads(monkeypatch):
+    monkeypatch.setattr(ignore, "RESULT_CACHE_SIZE", 4)
+    bucket = ignore.IgnoreBucket(["*!*@bad", "nick!user@host"])
+    errors = []
+
+    def _check(offset):
+        try:
+            for i in range(2000):
+                host = "bad" if i % 2 else "good"
+                mask = f"{(i + offset) % 16}!user@{host}"
+                assert bucket.matches(mask) == (host == "bad")
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=_check, args=(offset,)) for offset in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(bucket._results) <= 4
+
+    bucket.update(["*!*@good"])
+    assert bucket.matches("1!user@good")
+    assert not bucket.matches("1!user@bad")
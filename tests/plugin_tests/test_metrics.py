@@ -0,0 +1,148 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from cloudbot.client import EventQueue
+from cloudbot.util.histogram import LatencyHistogram
+from plugins.core import hook_stats, metrics
+
+
+def make_conn(name):
+    conn = MagicMock()
+    conn.name = name
+    conn.connected = True
+    conn.lines_in = 3
+    conn.lines_out = 2
+    conn.bytes_in = 300
+    conn.bytes_out = 200
+    conn.reconnects = 1
+    conn.event_queue = EventQueue(conn)
+    return conn
+
+
+def make_hook():
+    _hook = MagicMock()
+    _hook.plugin.title = "test"
+    _hook.function_name = "func"
+    _hook.type = "command"
+    _hook.wall_time = LatencyHistogram()
+    _hook.queue_wait = LatencyHistogram()
+    _hook.executor_wait = LatencyHistogram()
+    _hook.wall_time.record(0.5)
+    _hook.db_sessions_requested = 4
+    _hook.db_sessions_used = 1
+    return _hook
+
+
+@pytest.fixture()
+def metrics_bot(mock_bot):
+    mock_bot.memory = {}
+    mock_bot.connections = {"net": make_conn("net")}
+    plugin = MagicMock()
+    plugin.hooks = {"command": [make_hook()]}
+    mock_bot.plugin_manager.plugins = {"test": plugin}
+    stats = hook_stats.get_stats(mock_bot)
+    stats["global"]["test.func"]["success"] += 2
+    stats["global"]["test.func"]["failure"] += 1
+    yield mock_bot
+
+
+def test_escape_label():
+    assert metrics.escape_label('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+@pytest.mark.asyncio
+async def test_render_metrics(metrics_bot):
+    lines = metrics.render_metrics(metrics_bot).splitlines()
+    assert "# TYPE cloudbot_connection_lines_received_total counter" in lines
+    assert 'cloudbot_connection_lines_received_total{conn="net"} 3' in lines
+    assert 'cloudbot_connection_bytes_sent_total{conn="net"} 200' in lines
+    assert 'cloudbot_connection_reconnects_total{conn="net"} 1' in lines
+    assert 'cloudbot_connection_up{conn="net"} 1' in lines
+    assert 'cloudbot_event_queue_depth{conn="net"} 0' in lines
+    assert (
+        'cloudbot_events_dropped_total{conn="net",priority="other"} 0' in lines
+    )
+    assert 'cloudbot_hook_invocations_total{hook="test.func"} 3' in lines
+    assert 'cloudbot_hook_errors_total{hook="test.func"} 1' in lines
+    labels = 'hook="test.func",type="command"'
+    assert f"cloudbot_hook_duration_seconds_count{{{labels}}} 1" in lines
+    assert f"cloudbot_hook_duration_seconds_sum{{{labels}}} 0.5" in lines
+    assert (
+        f'cloudbot_hook_duration_seconds{{quantile="0.99",{labels}}} 0.5'
+        in lines
+    )
+    # Empty histograms are left out
+    assert not any(
+        line.startswith("cloudbot_hook_queue_wait_seconds{") for line in lines
+    )
+    assert f"cloudbot_db_sessions_requested_total{{{labels}}} 4" in lines
+    assert f"cloudbot_db_sessions_used_total{{{labels}}} 1" in lines
+    assert "cloudbot_db_executor_queue_length 0" in lines
+    assert "cloudbot_loop_stalls_total 0" in lines
+    assert "cloudbot_loop_lag_seconds_count 0" in lines
+
+
+@pytest.mark.asyncio
+async def test_render_metrics_hook_types(metrics_bot):
+    # The same function registered as a command and a regex hook
+    regex_hook = make_hook()
+    regex_hook.type = "regex"
+    plugin = metrics_bot.plugin_manager.plugins["test"]
+    plugin.hooks["regex"] = [regex_hook]
+
+    lines = [
+        line
+        for line in metrics.render_metrics(metrics_bot).splitlines()
+        if line.startswith("cloudbot_hook_duration_seconds_count")
+    ]
+    assert lines == [
+        'cloudbot_hook_duration_seconds_count{hook="test.func",type="command"} 1',
+        'cloudbot_hook_duration_seconds_count{hook="test.func",type="regex"} 1',
+    ]
+
+
+async def fetch(port, request):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    data = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    headers, _, body = data.decode().partition("\r\n\r\n")
+    return headers.split("\r\n")[0], body
+
+
+@pytest.mark.asyncio
+async def test_server(metrics_bot):
+    metrics_bot.config["metrics"] = {"enabled": True, "port": 0}
+    await metrics.start_server(metrics_bot)
+    try:
+        server: asyncio.Server = metrics_bot.memory["metrics_server"]
+        port = server.sockets[0].getsockname()[1]
+
+        status, body = await fetch(port, b"GET /metrics HTTP/1.1\r\n\r\n")
+        assert status == "HTTP/1.1 200 OK"
+        # Process metrics change between renders, compare the metric names
+        assert [line.split(" ")[0] for line in body.splitlines()] == [
+            line.split(" ")[0]
+            for line in metrics.render_metrics(metrics_bot).splitlines()
+        ]
+
+        status, body = await fetch(port, b"GET /foo HTTP/1.1\r\n\r\n")
+        assert status == "HTTP/1.1 404 Not Found"
+        assert body == ""
+
+        status, _ = await fetch(port, b"POST /metrics HTTP/1.1\r\n\r\n")
+        assert status == "HTTP/1.1 405 Method Not Allowed"
+    finally:
+        await metrics.stop_server(metrics_bot)
+
+    assert "metrics_server" not in metrics_bot.memory
+    await metrics.stop_server(metrics_bot)
+
+
+@pytest.mark.asyncio
+async def test_server_disabled(metrics_bot):
+    await metrics.start_server(metrics_bot)
+    assert "metrics_server" not in metrics_bot.memory
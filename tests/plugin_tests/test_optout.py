@@ -670,3 +670,51 @@ class TestClearOptOut:
             assert optout.clear_optout(session, "net") == 3
 
             assert len(mock_db.get_data(optout.optout_table)) == 1
+
+
+def test_optout_index():
+    optouts = [
+        optout.OptOut(channel="#foo", hook_pattern="my.hook", allow=True),
+        optout.OptOut(channel="#foo*", hook_pattern="my.*", allow=False),
+        optout.OptOut(channel="#bar", hook_pattern="*", allow=False),
+    ]
+    optouts.sort(reverse=True)
+
+    with patch.dict(optout.optout_cache, clear=True, net=optouts):
+        index = optout.get_optout_index("Net")
+        assert optout.get_optout_index("net") is index
+
+        assert index.find("#FOO", "My.Hook") is optouts[0]
+        assert index.find("#foobar", "my.hook") is optouts[1]
+        assert index.find("#bar", "other.hook") is optouts[2]
+        assert index.find("#baz", "my.hook") is None
+        assert ("#foo", "my.hook") in index._decisions
+
+        optouts.append(optout.OptOut("#baz", "*", False))
+        new_index = optout.get_optout_index("net")
+        assert new_index is not index
+        assert new_index.find("#baz", "my.hook") is optouts[-1]
+
+
+def test_optout_index_cache_size(monkeypatch):
+    monkeypatch.setattr(optout, "DECISION_CACHE_SIZE", 2)
+    index = optout.OptOutIndex([optout.OptOut("#*", "*", False)])
+    for chan in ("#a", "#b", "#c", "#b"):
+        index.find(chan, "my.hook")
+
+    assert list(index._decisions) == [("#c", "my.hook"), ("#b", "my.hook")]
+
+
+def test_optout_index_reload(mock_db):
+    optout.optout_table.create(mock_db.engine)
+    db = mock_db.session()
+    optout.load_cache(db)
+
+    assert optout.get_first_matching_optout("net", "#chan", "my.hook") is None
+
+    optout.set_optout(db, "net", "#chan", "my.*", False)
+    opt = optout.get_first_matching_optout("net", "#chan", "my.hook")
+    assert opt is not None and not opt.allow
+
+    optout.del_optout(db, "net", "#chan", "my.*")
+    assert optout.get_first_matching_optout("net", "#chan", "my.hook") is None
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import time
 from contextlib import contextmanager
@@ -21,21 +22,35 @@ async def async_call(func, *args):
     return func(*args)
 
 
-async def make_reminder(text, nick, chan, mock_db, conn, event):
+@pytest.fixture(autouse=True)
+def clear_cache():
+    remind.reminder_cache.clear()
+    yield
+    remind.reminder_cache.clear()
+
+
+async def make_reminder(text, nick, chan, mock_db, conn, event, bot):
     return await remind.remind(
-        text, nick, chan, mock_db.session(), conn, event, async_call
+        text, nick, chan, mock_db.session(), conn, event, async_call, bot
     )
 
 
 @pytest.mark.asyncio()
-async def test_invalid_reminder(mock_db, freeze_time, setup_db):
-    await remind.load_cache(async_call, mock_db.session())
+async def test_invalid_reminder(mock_db, freeze_time, setup_db, mock_bot):
+    bot = mock_bot
+    await remind.load_cache(bot, async_call, mock_db.session())
     mock_conn = MagicMock()
     mock_conn.name = "test"
     mock_event = MagicMock()
 
     result = await make_reminder(
-        "1 day some reminder", "user", "#chan", mock_db, mock_conn, mock_event
+        "1 day some reminder",
+        "user",
+        "#chan",
+        mock_db,
+        mock_conn,
+        mock_event,
+        bot,
     )
 
     assert mock_event.notice_doc.called
@@ -46,14 +61,21 @@ async def test_invalid_reminder(mock_db, freeze_time, setup_db):
 
 
 @pytest.mark.asyncio()
-async def test_invalid_reminder_time(mock_db, freeze_time, setup_db):
-    await remind.load_cache(async_call, mock_db.session())
+async def test_invalid_reminder_time(mock_db, freeze_time, setup_db, mock_bot):
+    bot = mock_bot
+    await remind.load_cache(bot, async_call, mock_db.session())
     mock_conn = MagicMock()
     mock_conn.name = "test"
     mock_event = MagicMock()
 
     result = await make_reminder(
-        "0 days: some reminder", "user", "#chan", mock_db, mock_conn, mock_event
+        "0 days: some reminder",
+        "user",
+        "#chan",
+        mock_db,
+        mock_conn,
+        mock_event,
+        bot,
     )
 
     assert result == "Invalid input."
@@ -62,8 +84,11 @@ async def test_invalid_reminder_time(mock_db, freeze_time, setup_db):
 
 
 @pytest.mark.asyncio
-async def test_invalid_reminder_overtime(mock_db, freeze_time, setup_db):
-    await remind.load_cache(async_call, mock_db.session())
+async def test_invalid_reminder_overtime(
+    mock_db, freeze_time, setup_db, mock_bot
+):
+    bot = mock_bot
+    await remind.load_cache(bot, async_call, mock_db.session())
     mock_conn = MagicMock()
     mock_conn.name = "test"
     mock_event = MagicMock()
@@ -75,6 +100,7 @@ async def test_invalid_reminder_overtime(mock_db, freeze_time, setup_db):
         mock_db,
         mock_conn,
         mock_event,
+        bot,
     )
 
     expected = "Sorry, remind input must be more than a minute, and less than one month."
@@ -85,8 +111,9 @@ async def test_invalid_reminder_overtime(mock_db, freeze_time, setup_db):
 
 
 @pytest.mark.asyncio
-async def test_add_reminder(mock_db, freeze_time, setup_db):
-    await remind.load_cache(async_call, mock_db.session())
+async def test_add_reminder(mock_db, freeze_time, setup_db, mock_bot):
+    bot = mock_bot
+    await remind.load_cache(bot, async_call, mock_db.session())
     mock_conn = MagicMock()
     mock_conn.name = "test"
     mock_event = MagicMock()
@@ -100,6 +127,7 @@ async def test_add_reminder(mock_db, freeze_time, setup_db):
         mock_db,
         mock_conn,
         mock_event,
+        bot,
     )
 
     expected = 'Alright, I\'ll remind you "some reminder" in \x022 hours and 30 minutes\x0f!'
@@ -109,10 +137,20 @@ async def test_add_reminder(mock_db, freeze_time, setup_db):
     assert mock_db.get_data(remind.table) == [
         ("test", "user", now, "#chan", "some reminder", remind_time)
     ]
+    job = bot.scheduler.get(remind.job_key("test", "user", now))
+    assert job is not None
+    assert job.when == remind_time.timestamp()
+    assert job.args == (
+        bot,
+        ("test", remind_time, now, "user", "some reminder"),
+    )
 
 
 @pytest.mark.asyncio()
-async def test_add_reminder_fail_count(mock_db, freeze_time, setup_db):
+async def test_add_reminder_fail_count(
+    mock_db, freeze_time, setup_db, mock_bot
+):
+    bot = mock_bot
     mock_conn = MagicMock()
     mock_conn.name = "test"
     mock_event = MagicMock()
@@ -143,7 +181,7 @@ async def test_add_reminder_fail_count(mock_db, freeze_time, setup_db):
             remind_time=row[5],
         )
 
-    await remind.load_cache(async_call, mock_db.session())
+    await remind.load_cache(bot, async_call, mock_db.session())
 
     result = await make_reminder(
         "2 hours, 30 minutes: some reminder",
@@ -152,6 +190,7 @@ async def test_add_reminder_fail_count(mock_db, freeze_time, setup_db):
         mock_db,
         mock_conn,
         mock_event,
+        bot,
     )
 
     expected = (
@@ -164,7 +203,7 @@ async def test_add_reminder_fail_count(mock_db, freeze_time, setup_db):
     assert mock_db.get_data(remind.table) == data
 
 
-class TestCheckReminders:
+class TestSendReminder:
     delay = second * 0
 
     @contextmanager
@@ -188,7 +227,7 @@ class TestCheckReminders:
     def remind_time(self):
         return (self.now - (5 * minute)) - self.delay
 
-    async def check_reminders(self, mock_db, bot):
+    async def send_reminder(self, mock_db, bot):
         mock_db.add_row(
             remind.table,
             network="test",
@@ -198,8 +237,32 @@ class TestCheckReminders:
             message="a reminder",
             remind_time=self.remind_time,
         )
-        await remind.load_cache(async_call, mock_db.session())
-        await remind.check_reminders(bot, async_call, mock_db.session())
+        await remind.load_cache(bot, async_call, mock_db.session())
+        key = remind.job_key("test", "user", self.set_time)
+        job = bot.scheduler.get(key)
+        assert job is not None
+        await job.callback(*job.args)
+        return key
+
+    def assert_retried(self, mock_db, bot, key):
+        job = bot.scheduler.get(key)
+        assert job is not None
+        assert job.when == time.time() + remind.RETRY_DELAY
+        self.assert_kept(mock_db)
+
+    def assert_kept(self, mock_db):
+        assert remind.reminder_cache
+
+        assert mock_db.get_data(remind.table) == [
+            (
+                "test",
+                "user",
+                self.set_time,
+                "#chan",
+                "a reminder",
+                self.remind_time,
+            )
+        ]
 
     @pytest.mark.asyncio()
     async def test_no_conn(
@@ -209,27 +272,16 @@ class TestCheckReminders:
         setup_db,
         freeze_time,
     ):
-        await remind.load_cache(async_call, mock_db.session())
         bot = mock_bot_factory()
         bot.connections = {}
-        mock_conn = MagicMock()
-        mock_conn.name = "test"
-        mock_conn.ready = True
-
-        await self.check_reminders(mock_db, bot)
 
-        assert mock_conn.message.mock_calls == []
+        key = await self.send_reminder(mock_db, bot)
 
-        assert mock_db.get_data(remind.table) == [
-            (
-                "test",
-                "user",
-                self.set_time,
-                "#chan",
-                "a reminder",
-                self.remind_time,
-            )
-        ]
+        # Reminders for unknown networks are kept, but not retried
+        job = bot.scheduler.get(key)
+        assert job is not None
+        assert job.when < time.time()
+        self.assert_kept(mock_db)
 
     @pytest.mark.asyncio()
     async def test_conn_not_ready(
@@ -239,27 +291,16 @@ class TestCheckReminders:
         setup_db,
         freeze_time,
     ):
-        await remind.load_cache(async_call, mock_db.session())
         bot = mock_bot_factory()
         mock_conn = MagicMock()
         mock_conn.name = "test"
         mock_conn.ready = False
         bot.connections = {mock_conn.name: mock_conn}
 
-        await self.check_reminders(mock_db, bot)
+        key = await self.send_reminder(mock_db, bot)
 
         assert mock_conn.message.mock_calls == []
-
-        assert mock_db.get_data(remind.table) == [
-            (
-                "test",
-                "user",
-                self.set_time,
-                "#chan",
-                "a reminder",
-                self.remind_time,
-            )
-        ]
+        self.assert_retried(mock_db, bot, key)
 
     @pytest.mark.asyncio()
     async def test_late(
@@ -269,7 +310,6 @@ class TestCheckReminders:
         setup_db,
         freeze_time,
     ):
-        await remind.load_cache(async_call, mock_db.session())
         bot = mock_bot_factory()
         mock_conn = MagicMock()
         mock_conn.name = "test"
@@ -277,7 +317,7 @@ class TestCheckReminders:
         bot.connections = {mock_conn.name: mock_conn}
 
         with self.set_delay(40 * minute):
-            await self.check_reminders(mock_db, bot)
+            await self.send_reminder(mock_db, bot)
 
         assert mock_conn.message.mock_calls == [
             call(
@@ -292,6 +332,7 @@ class TestCheckReminders:
         ]
 
         assert mock_db.get_data(remind.table) == []
+        assert remind.reminder_cache == {}
 
     @pytest.mark.asyncio()
     async def test_normal(
@@ -301,14 +342,13 @@ class TestCheckReminders:
         setup_db,
         freeze_time,
     ):
-        await remind.load_cache(async_call, mock_db.session())
         bot = mock_bot_factory()
         mock_conn = MagicMock()
         mock_conn.name = "test"
         mock_conn.ready = True
         bot.connections = {mock_conn.name: mock_conn}
 
-        await self.check_reminders(mock_db, bot)
+        await self.send_reminder(mock_db, bot)
 
         assert mock_conn.message.mock_calls == [
             call(
@@ -318,10 +358,69 @@ class TestCheckReminders:
         ]
 
         assert mock_db.get_data(remind.table) == []
+        assert remind.reminder_cache == {}
+
+
+@pytest.mark.asyncio()
+async def test_reminder_fires_on_time(mock_db, setup_db, mock_bot):
+    mock_conn = MagicMock()
+    mock_conn.name = "test"
+    mock_conn.ready = True
+    mock_bot.connections = {mock_conn.name: mock_conn}
+
+    now = datetime.datetime.now()
+    remind_time = now + 0.05 * second
+    mock_db.add_row(
+        remind.table,
+        network="test",
+        added_user="user",
+        added_time=now,
+        added_chan="#chan",
+        message="a reminder",
+        remind_time=remind_time,
+    )
+    await remind.load_cache(mock_bot, async_call, mock_db.session())
+    assert len(mock_bot.scheduler) == 1
+
+    for _ in range(100):
+        if not mock_db.get_data(remind.table):
+            break
+
+        await asyncio.sleep(0.01)
+
+    assert datetime.datetime.now() >= remind_time
+    assert mock_conn.message.mock_calls[1] == call("user", '"a reminder"')
+    assert mock_db.get_data(remind.table) == []
+    assert len(mock_bot.scheduler) == 0
+
+
+@pytest.mark.asyncio()
+async def test_unschedule_on_stop(mock_db, setup_db, mock_bot):
+    now = datetime.datetime.now()
+    for user in ("user", "other"):
+        mock_db.add_row(
+            remind.table,
+            network="test",
+            added_user=user,
+            added_time=now,
+            added_chan="#chan",
+            message="a reminder",
+            remind_time=now + hour,
+        )
+
+    await remind.load_cache(mock_bot, async_call, mock_db.session())
+    assert len(mock_bot.scheduler) == 2
+
+    await remind.unschedule_all(mock_bot)
+    assert len(mock_bot.scheduler) == 0
+    assert remind.reminder_cache == {}
+    # The reminders are still delivered after the plugin is loaded again
+    assert len(mock_db.get_data(remind.table)) == 2
 
 
 @pytest.mark.asyncio()
-async def test_clear_reminders(mock_db, setup_db):
+async def test_clear_reminders(mock_db, setup_db, mock_bot):
+    bot = mock_bot
     now = datetime.datetime.now()
 
     mock_db.add_row(
@@ -336,7 +435,7 @@ async def test_clear_reminders(mock_db, setup_db):
 
     assert len(mock_db.get_data(remind.table)) == 1
 
-    await remind.load_cache(async_call, mock_db.session())
+    await remind.load_cache(bot, async_call, mock_db.session())
 
     mock_conn = MagicMock()
     mock_conn.name = "test"
@@ -351,19 +450,23 @@ async def test_clear_reminders(mock_db, setup_db):
         mock_conn,
         mock_event,
         async_call,
+        bot,
     )
 
     assert result == "Deleted all (1) reminders for user!"
 
     assert mock_db.get_data(remind.table) == []
+    assert len(bot.scheduler) == 0
+    assert remind.reminder_cache == {}
 
 
 @pytest.mark.asyncio()
-async def test_clear_reminders_empty(mock_db):
+async def test_clear_reminders_empty(mock_db, mock_bot):
+    bot = mock_bot
     remind.table.create(mock_db.engine, checkfirst=True)
     assert mock_db.get_data(remind.table) == []
 
-    await remind.load_cache(async_call, mock_db.session())
+    await remind.load_cache(bot, async_call, mock_db.session())
 
     mock_conn = MagicMock()
     mock_conn.name = "test"
@@ -378,6 +481,7 @@ async def test_clear_reminders_empty(mock_db):
         mock_conn,
         mock_event,
         async_call,
+        bot,
     )
 
     assert result == "You have no reminders to delete."
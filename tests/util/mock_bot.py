@@ -5,7 +5,10 @@ from watchdog.observers import Observer
 
 from cloudbot.bot import AbstractBot, CloudBot
 from cloudbot.client import Client
+from cloudbot.loop_watchdog import LoopWatchdog
 from cloudbot.plugin import PluginManager
+from cloudbot.scheduler import Scheduler
+from cloudbot.util.database import DatabaseExecutorPool
 from tests.util.mock_config import MockConfig
 from tests.util.mock_db import MockDB
 
@@ -36,6 +39,8 @@ class MockBot(AbstractBot):
         else:
             self.db_engine = None
 
+        self.db_executor_pool = DatabaseExecutorPool(1)
+
         self.running = True
         self.logger = logging.getLogger("cloudbot")
         super().__init__(config=MockConfig(self))
@@ -47,12 +52,17 @@ class MockBot(AbstractBot):
         self.plugin_reloading_enabled = False
         self.config_reloading_enabled = False
         self.observer = Observer()
+        self.loop_watchdog_enabled = False
+        self.loop_watchdog = LoopWatchdog(self)
+        self.scheduler = Scheduler(self.loop)
         self.repo_link = "https://github.com/foobar/baz"
         self.user_agent = "User agent"
         self.connections: dict[str, Client] = {}
 
     def close(self):
+        self.scheduler.close()
         self.observer.stop()
+        self.db_executor_pool.shutdown()
 
     def migrate_db(self) -> None:
         return CloudBot.migrate_db(self)  # type: ignore[arg-type]